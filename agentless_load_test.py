@@ -6,37 +6,208 @@
 # own risk. This sample is not a Deep Instinct commercial product and is not
 # officially supported, although the API that it calls is.
 #
+# Load generator for sizing Agentless Connector deployments. For each
+# concurrency level, worker threads are started gradually over the ramp-up
+# period and then scan files picked at random from the corpus until the
+# duration or scan count limit is reached. Client-side latency (time for the
+# full request, including upload) is recorded alongside the scan time reported
+# by the connector, and the results for each level (latency percentiles and
+# histogram, error rate, throughput) are printed and written to JSON and CSV.
+# Comparing throughput across levels shows where a connector saturates.
+#
 
-import deepinstinctagentless as di, time, json
+import deepinstinctagentless as di, time, json, csv, threading, os, random, datetime, collections, math
 
 #CONFIGURATION
-scanner_ip = '192.168.0.50'
-file_to_scan = 'example.pdf'
-number_of_scans = 5000
-
-# ESTABLISH VARIABLES
-start_time = time.perf_counter()
-n = 0
-total_scan_duration_in_microseconds = 0
-total_file_size_in_bytes = 0
-
-# EXECUTE THE SCANS
-while n < number_of_scans:
-    verdict = di.scan_file(file_to_scan, scanner_ip)
-    total_scan_duration_in_microseconds += verdict['scan_duration_in_microseconds']
-    total_file_size_in_bytes += verdict['file_size_in_bytes']
-    n += 1
-    print('Completed scan', n,'of',number_of_scans, end='\r')
-
-# CALCULATE RESULTS
-results = {}
-results['scan_count'] = n
-results['runtime_in_seconds'] = time.perf_counter() - start_time
-results['scan_time_in_seconds'] = total_scan_duration_in_microseconds / 1000000
-results['scan_volume_in_megabytes'] = total_file_size_in_bytes / 1000000
-results['ratio_of_time_spent_scanning'] = results['scan_time_in_seconds'] / results['runtime_in_seconds']
-results['gross_throughput_in_megabytes_per_second'] = results['scan_volume_in_megabytes'] / results['scan_time_in_seconds']
-results['net_throughput_in_megabytes_per_second'] = results['scan_volume_in_megabytes'] / results['runtime_in_seconds']
-
-# PRINT RESULTS TO CONSOLE
-print('\n', json.dumps(results, indent=4))
+scanner_ip = '192.168.0.50'       # a single connector, or a list to spread scans across several with di.ConnectorPool
+scanner_port = 5000
+corpus = ['example.pdf']          # files and/or directories; use a mix of sizes and types representative of production
+concurrency_levels = [1, 2, 4, 8, 16, 32]
+ramp_up_seconds = 10              # per level, workers are started evenly over this period (excluded from results)
+duration_seconds = 60             # per level, measured after ramp-up (None to use scan_count only)
+scan_count = None                 # per level, maximum number of scans (None to use duration_seconds only)
+encoded = False                   # True to use /scan/base64 instead of /scan/binary
+timeout = 20                      # seconds before a scan request is abandoned
+random_seed = 1                   # makes the sequence of files picked from the corpus repeatable
+output_file_prefix = 'agentless_load_test'
+
+#upper bounds (in milliseconds) of the latency histogram buckets
+histogram_buckets_ms = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000]
+
+#scans must go to the connector every time
+di.verdict_cache_path = None
+
+
+# Returns the pth percentile of a sorted list (nearest-rank), or None if empty
+def percentile(sorted_values, p):
+    if len(sorted_values) == 0:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Returns p50/p95/p99/max/mean of a list of values
+def summarize(values):
+    values = sorted(values)
+    return {'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99),
+            'max': values[-1] if len(values) > 0 else None, 'mean': sum(values) / len(values) if len(values) > 0 else None}
+
+
+# Returns a dictionary of {bucket label: count} for latencies in milliseconds
+def histogram(latencies_ms):
+    counts = collections.OrderedDict((f'<={bucket}', 0) for bucket in histogram_buckets_ms)
+    counts[f'>{histogram_buckets_ms[-1]}'] = 0
+    for latency in latencies_ms:
+        for bucket in histogram_buckets_ms:
+            if latency <= bucket:
+                counts[f'<={bucket}'] += 1
+                break
+        else:
+            counts[f'>{histogram_buckets_ms[-1]}'] += 1
+    return counts
+
+
+# Runs one concurrency level and returns the list of samples. Each sample is a
+# dictionary with start (seconds since the level began), latency_ms, file_size,
+# server_scan_time_ms, and error (None if the scan succeeded). target is the
+# connector IP or a di.ConnectorPool.
+def run_level(concurrency, files, rng, target):
+    samples = []
+    lock = threading.Lock()
+    level_start = time.perf_counter()
+    measure_start = level_start + ramp_up_seconds
+    deadline = measure_start + duration_seconds if duration_seconds != None else None
+    scans_started = [0]
+
+    def worker(worker_number):
+        #start workers evenly across the ramp-up period
+        time.sleep(ramp_up_seconds * worker_number / concurrency)
+        while True:
+            with lock:
+                if scan_count != None and scans_started[0] >= scan_count:
+                    return
+                file_name, file_size = rng.choice(files)
+                scans_started[0] += 1
+            start = time.perf_counter()
+            if deadline != None and start >= deadline:
+                return
+            error = None
+            verdict = None
+            try:
+                verdict = di.scan_file(file_name, target, encoded=encoded, scanner_port=scanner_port, timeout=timeout)
+                if verdict == None:
+                    error = 'unexpected_response'
+            except Exception as e:
+                error = type(e).__name__
+            end = time.perf_counter()
+            sample = {'start': start - level_start, 'latency_ms': (end - start) * 1000, 'file_size': file_size, 'error': error,
+                      'server_scan_time_ms': verdict['scan_duration_in_microseconds'] / 1000 if verdict != None and 'scan_duration_in_microseconds' in verdict else None}
+            with lock:
+                samples.append(sample)
+                print('Concurrency', concurrency, '- completed', len(samples), 'scans', end='\r')
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print()
+    return samples, time.perf_counter() - level_start
+
+
+# Calculates the results for one concurrency level. Scans started during
+# ramp-up are excluded (unless there are no others, e.g. a short count-limited
+# run), so the figures reflect the level at full concurrency.
+def calculate_results(concurrency, samples, elapsed):
+    measured = [sample for sample in samples if sample['start'] >= ramp_up_seconds]
+    window = elapsed - ramp_up_seconds
+    if len(measured) == 0:
+        measured = samples
+        window = elapsed
+    succeeded = [sample for sample in measured if sample['error'] == None]
+    latencies = [sample['latency_ms'] for sample in succeeded]
+    server_times = [sample['server_scan_time_ms'] for sample in succeeded if sample['server_scan_time_ms'] != None]
+    megabytes = sum(sample['file_size'] for sample in succeeded) / 1000000
+
+    results = collections.OrderedDict()
+    results['concurrency'] = concurrency
+    results['scans'] = len(measured)
+    results['succeeded'] = len(succeeded)
+    results['errors'] = len(measured) - len(succeeded)
+    results['error_rate'] = results['errors'] / len(measured) if len(measured) > 0 else None
+    results['errors_by_type'] = dict(collections.Counter(sample['error'] for sample in measured if sample['error'] != None))
+    results['measured_seconds'] = window
+    results['throughput_scans_per_second'] = len(succeeded) / window if window > 0 else None
+    results['throughput_megabytes_per_second'] = megabytes / window if window > 0 else None
+    results['latency_ms'] = summarize(latencies)
+    results['server_scan_time_ms'] = summarize(server_times)
+    results['ratio_of_time_spent_scanning'] = sum(server_times) / sum(latencies) if sum(latencies) > 0 else None
+    results['latency_histogram_ms'] = histogram(latencies)
+    return results
+
+
+# Flattens the results for one level into a CSV row
+def csv_row(results):
+    row = collections.OrderedDict()
+    for field, value in results.items():
+        if field in ['latency_ms', 'server_scan_time_ms']:
+            for statistic, statistic_value in value.items():
+                row[f'{field}_{statistic}'] = statistic_value
+        elif field == 'errors_by_type':
+            row[field] = json.dumps(value)
+        elif field not in ['latency_histogram_ms', 'connectors']:
+            row[field] = value
+    return row
+
+
+# BUILD THE CORPUS
+files = [(file_name, os.path.getsize(file_name)) for file_name in di.iter_files(corpus)]
+if len(files) == 0:
+    print('ERROR: The corpus', corpus, 'contains no files')
+    exit(1)
+extensions = collections.Counter(os.path.splitext(file_name)[1].lower() or '(none)' for file_name, file_size in files)
+corpus_summary = {'files': len(files), 'megabytes': sum(file_size for file_name, file_size in files) / 1000000,
+                  'file_size_bytes': summarize([file_size for file_name, file_size in files]), 'extensions': dict(extensions)}
+print('Corpus:', json.dumps(corpus_summary))
+
+if duration_seconds == None and scan_count == None:
+    print('ERROR: Set duration_seconds and/or scan_count')
+    exit(1)
+
+# EXECUTE THE SCANS AT EACH CONCURRENCY LEVEL
+rng = random.Random(random_seed)
+all_results = []
+for concurrency in concurrency_levels:
+    if isinstance(scanner_ip, str):
+        samples, elapsed = run_level(concurrency, files, rng, scanner_ip)
+        results = calculate_results(concurrency, samples, elapsed)
+    else:
+        #a new pool per level, so the per-connector stats cover this level only
+        pool = di.ConnectorPool(scanner_ip, scanner_port=scanner_port)
+        samples, elapsed = run_level(concurrency, files, rng, pool)
+        results = calculate_results(concurrency, samples, elapsed)
+        results['connectors'] = pool.get_stats()
+    all_results.append(results)
+    print('Concurrency', concurrency, '-', results['scans'], 'scans,', results['errors'], 'errors,',
+          round(results['throughput_scans_per_second'] or 0, 2), 'scans/s,',
+          round(results['throughput_megabytes_per_second'] or 0, 2), 'MB/s, latency p50/p95/p99/max',
+          '/'.join(str(round(results['latency_ms'][statistic])) if results['latency_ms'][statistic] != None else '-' for statistic in ['p50', 'p95', 'p99', 'max']), 'ms')
+
+# SAVE RESULTS
+timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H.%M')
+configuration = {'scanner_ip': scanner_ip, 'scanner_port': scanner_port, 'corpus': corpus, 'concurrency_levels': concurrency_levels,
+                 'ramp_up_seconds': ramp_up_seconds, 'duration_seconds': duration_seconds, 'scan_count': scan_count,
+                 'encoded': encoded, 'timeout': timeout, 'random_seed': random_seed}
+
+json_file_name = f'{output_file_prefix}_{timestamp}.json'
+with open(json_file_name, 'w') as f:
+    json.dump({'configuration': configuration, 'corpus': corpus_summary, 'results': all_results}, f, indent=4)
+
+csv_file_name = f'{output_file_prefix}_{timestamp}.csv'
+rows = [csv_row(results) for results in all_results]
+with open(csv_file_name, 'w', newline='') as f:
+    writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+    writer.writeheader()
+    writer.writerows(rows)
+
+print('Results written to', json_file_name, 'and', csv_file_name)
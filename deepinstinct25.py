@@ -26,6 +26,10 @@
 # problem against the raw/pure DI REST API.
 #
 
+# URL scheme used to reach the server. Change to 'http' only to test against
+# a local mock server (see mock_dappliance.py).
+protocol = 'https'
+
 # Import various libraries used by one or more method below.
 import requests, json, datetime, pandas, re, ipaddress, time, os
 #If any of the above throw import errors, try running 'pip install library_name'
@@ -96,9 +100,9 @@ def archive_devices(device_ids, unarchive=False):
     # Calculate headers and URL
     headers = {'Content-Type': 'application/json', 'Authorization': key}
     if unarchive:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/unarchive'
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/unarchive'
     else:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/archive'
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/archive'
 
     # Create payload with list of provided IDs as a Python dictionary
     payload = {'ids': device_ids}
@@ -206,7 +210,7 @@ def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_
         if policy['os'] in platforms:
             # If yes, get policy data from the server
             policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/data'
             response = requests.get(request_url, headers=headers)
             policy_data = response.json()
             # Check if the upgrade setting needs changing
@@ -244,7 +248,7 @@ def enable_upgrades_for_list_of_policy_ids(policy_ids, automatic_upgrade=True):
 
     # Iterate through the poliocy ids provided
     for policy_id in policy_ids:
-        request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
+        request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/data'
         response = requests.get(request_url, headers=headers)
         policy_data = response.json()
         # Check if the upgrade setting needs changing
@@ -263,7 +267,7 @@ def enable_upgrades_for_list_of_policy_ids(policy_ids, automatic_upgrade=True):
 def get_tenants():
     # Calculate headers and url
     headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/'
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/'
 
     # Get data from server
     response = requests.get(request_url, headers=headers)
@@ -291,7 +295,7 @@ def get_devices():
     # COLLECT DATA
     while last_id != None and error_count < 10: #loop until all visible devices have been collected
         #calculate URL for request
-        request_url = f'https://{fqdn}/api/v1/devices?after_device_id={last_id}'
+        request_url = f'{protocol}://{fqdn}/api/v1/devices?after_device_id={last_id}'
         #make request, store response
         response = requests.get(request_url, headers=headers)
         if response.status_code == 200: #this means successful query to server
@@ -374,9 +378,9 @@ def add_devices_to_group(device_ids, group_id, remove=False):
     # Calculate headers and URL
     headers = {'Content-Type': 'application/json', 'Authorization': key}
     if remove:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/remove-devices'
+        request_url = f'{protocol}://{fqdn}/api/v1/groups/{group_id}/remove-devices'
     else:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/add-devices'
+        request_url = f'{protocol}://{fqdn}/api/v1/groups/{group_id}/add-devices'
 
     # Create payload
     payload = {'devices': device_ids}
@@ -403,7 +407,7 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False):
 
     # Calculate headers and URL
     headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/policies/'
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/'
 
     # Get data, convert to Python list
     response = requests.get(request_url, headers=headers)
@@ -416,7 +420,7 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False):
         for policy in policies:
             # Extract ID, calculate URL, and pull policy data from server
             policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/data'
             response = requests.get(request_url, headers=headers)
             # Check response code (for some platforms, no policy data available)
             if response.status_code == 200:
@@ -437,37 +441,37 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False):
             # or deny-list data from the server and append it to the policy
             # in policies (the collected data).
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/hashes'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/allow-list/hashes'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 allow_list_hashes = response.json()
                 policy['allow_list_static_analysis_hashes'] = allow_list_hashes['items']
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/paths'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/allow-list/paths'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 allow_list_paths = response.json()
                 policy['allow_list_static_analysis_paths'] = allow_list_paths['items']
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/certificates'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/allow-list/certificates'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 allow_list_certificates = response.json()
                 policy['allow_list_static_analysis_certificates'] = allow_list_certificates['items']
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/process_paths'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/allow-list/process_paths'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 allow_list_process_paths = response.json()
                 policy['allow_list_behavioral_analysis_process_paths'] = allow_list_process_paths['items']
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/scripts'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/allow-list/scripts'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 allow_list_scripts = response.json()
                 policy['allow_list_script_control'] = allow_list_scripts['items']
 
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/deny-list/hashes'
+            request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/deny-list/hashes'
             response = requests.get(request_url, headers=headers)
             if response.status_code == 200:
                 deny_list_hashes = response.json()
@@ -481,7 +485,7 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False):
 def get_msps():
     # Calculate headers and url
     headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
 
     # Get data from server
     response = requests.get(request_url, headers=headers)
@@ -494,7 +498,7 @@ def get_msps():
 def create_msp(msp_name, license_limit):
     # Calculate headers, URL, and payload
     headers = {'Content-Type': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
     payload = {'name': msp_name, 'license_limit': license_limit}
 
     # Send request to server
@@ -527,7 +531,7 @@ def delete_msp(msp_name):
         return 'No match found for provided msp_name ' + msp_name
 
     # DELETE THE MSP
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
     headers = {'Authorization': key}
     response = requests.delete(request_url, headers=headers)
 
@@ -555,7 +559,7 @@ def remove_device(device, device_id_only=False):
         device_id = device['id']
 
     #UNINSTALL THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/remove'
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/remove'
     headers = {'Authorization': key}
     response = requests.post(request_url, headers=headers)
 
@@ -582,7 +586,7 @@ def get_events(search={}, minimum_event_id=0):
     #loop until we have all the events
     while minimum_event_id != None:
         #calculate request url
-        request_url = f'https://{fqdn}/api/v1/events/search/{str(minimum_event_id)}'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/search/{str(minimum_event_id)}'
         #make request to server, store response
         response = requests.post(request_url, headers=headers, json=search)
         #check HTTP return code, and in case of error exit the method and return empty list
@@ -617,7 +621,7 @@ def get_all_events(max_event_id, min_event_id=1):
 
     #loop until we have collected all events within specified range
     for event_id in range(min_event_id, max_event_id):
-        request_url = f'https://{fqdn}/api/v1/events/{str(event_id)}'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/{str(event_id)}'
         response = requests.get(request_url, headers=headers)
         if response.status_code == 200:
             print('INFO:', request_url, 'returned', response.status_code)
@@ -633,7 +637,7 @@ def get_all_events(max_event_id, min_event_id=1):
 def get_groups(exclude_default_groups=False):
     # Calculate headers and URL
     headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/groups/'
+    request_url = f'{protocol}://{fqdn}/api/v1/groups/'
     # Get Device Groups from server
     response = requests.get(request_url, headers=headers)
     #Check response code
@@ -654,7 +658,7 @@ def get_groups(exclude_default_groups=False):
 def get_device(device_id):
     # Calculate headers and URL
     headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}'
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}'
     # Get data on the requested device ID from the server
     response = requests.get(request_url, headers=headers)
     # Check response code
@@ -27,29 +27,239 @@
 
 debug_mode = False
 
+# URL scheme used to reach the server. Change to 'http' only to test against
+# a local mock server (see mock_dappliance.py).
+protocol = 'https'
+
+# HTTP connection pool settings. All requests to the server share a single
+# keep-alive session, so the TCP+TLS handshake is paid once per pooled
+# connection instead of once per request.
+pool_size = 10
+max_retries = 3
+
+# Maximum number of worker threads used by methods which send requests
+# concurrently
+max_workers = 8
+
+# Default file format written by the export_* methods: 'xlsx', 'parquet',
+# 'csv.gz', or 'jsonl' (see export_writers). Each export method also accepts
+# an export_format parameter which overrides this. Records are converted and
+# written export_chunk_size rows at a time.
+default_export_format = 'xlsx'
+export_chunk_size = 10000
+
+# Client-side rate limit shared by all requests (and all threads), enforced
+# with a token bucket. None disables the limit. rate_limit_burst is the number
+# of requests which may be sent back-to-back before the limit applies.
+requests_per_second = None
+rate_limit_burst = 1
+
+# Requests which receive one of retry_status_codes are retried up to
+# retry_attempts times with exponential backoff and jitter (starting at
+# retry_base_wait seconds, capped at retry_max_wait). A Retry-After header
+# returned by the server takes precedence over the calculated wait. Requests
+# which are not safe to repeat (the create_* methods) are only retried on
+# non_idempotent_retry_status_codes, since a 502/504 may be returned after the
+# server has already created the object.
+retry_status_codes = (429, 502, 503, 504)
+non_idempotent_retry_status_codes = (429, 503)
+retry_attempts = 5
+retry_base_wait = 0.5
+retry_max_wait = 30
+
+# Wait (in seconds) before retrying a failed page request in get_devices. The
+# wait doubles after each consecutive failure, up to device_retry_max_wait.
+device_retry_wait = 1
+device_retry_max_wait = 60
+
+# Methods which send a list of ids in one request (archive/unarchive devices
+# and events, close/open events, add/remove devices to/from groups) split long
+# lists into chunks of up to id_chunk_size ids, sent concurrently. Chunks
+# which fail are retried up to id_chunk_retries more times.
+id_chunk_size = 1000
+id_chunk_retries = 1
+
+# Results of get_groups, get_msps, get_tenants, and get_policies are cached
+# for lookup_cache_ttl seconds (per server, API key, and arguments), so that
+# repeated lookups such as get_group_id or move_devices in a loop don't
+# download the full list every time. None or 0 disables the cache. Changes
+# made through this wrapper (create/delete MSP, tenant, or policy, and policy
+# data updates) clear the cache automatically; call clear_lookup_cache() after
+# changes made elsewhere. Hits and misses are counted in lookup_cache_stats.
+lookup_cache_ttl = 60
+lookup_cache_stats = {'hits': 0, 'misses': 0}
+
 # Import various libraries used by one or more method below.
-import requests, json, datetime, pandas, re, ipaddress, time, os
+import requests, json, datetime, pandas, re, ipaddress, time, os, concurrent.futures, threading, random, email.utils, gzip, itertools, bisect, collections, operator, functools, copy, inspect, contextlib, tempfile
 #If any of the above throw import errors, try running 'pip install library_name'
 #If that doesn't fix the problem I recommend to search Google for the error
 #that you are getting.
 
-
-# Export Device List to disk in Excel format
-def export_devices(include_deactivated=False):
-    #get the devices from server
-    devices = get_devices(include_deactivated=include_deactivated)
-    #convert to Pandas Data Frame
-    devices_df = pandas.DataFrame(devices)
+_session = None
+_session_config = None
+_session_lock = threading.Lock()
+
+
+# Returns the shared HTTP session, (re)building it if the server, API key, or
+# pool settings have changed since it was created. The lock makes sure that
+# concurrent first calls from worker threads share one session.
+def get_session():
+    global _session, _session_config
+    config = (fqdn, key, pool_size, max_retries)
+    with _session_lock:
+        if _session is None or _session_config != config:
+            if _session is not None:
+                _session.close()
+            session = requests.Session()
+            # adapter retries cover connection-level failures only (not HTTP errors)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # default headers for all requests, built once per session
+            session.headers.update({'accept': 'application/json', 'Authorization': key})
+            _session = session
+            _session_config = config
+        return _session
+
+
+# Closes the shared HTTP session (a new one is created on next request)
+def close_session():
+    global _session, _session_config
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_config = None
+
+
+_rate_limit_lock = threading.Lock()
+_rate_limit_tokens = None
+_rate_limit_timestamp = None
+
+
+# Blocks until the token bucket allows another request to be sent
+def _wait_for_rate_limit():
+    global _rate_limit_tokens, _rate_limit_timestamp
+    if requests_per_second == None:
+        return
+    capacity = max(1, rate_limit_burst)
+    while True:
+        with _rate_limit_lock:
+            now = time.monotonic()
+            if _rate_limit_tokens == None:
+                _rate_limit_tokens = capacity
+            else:
+                #refill the bucket based on time elapsed since the last check
+                _rate_limit_tokens = min(capacity, _rate_limit_tokens + (now - _rate_limit_timestamp) * requests_per_second)
+            _rate_limit_timestamp = now
+            if _rate_limit_tokens >= 1:
+                _rate_limit_tokens -= 1
+                return
+            wait = (1 - _rate_limit_tokens) / requests_per_second
+        time.sleep(wait)
+
+
+# Calculates how long to wait before retry number attempt (starting at 1),
+# honouring a Retry-After header (in seconds or as an HTTP date) if present
+def _calculate_retry_wait(response, attempt):
+    retry_after = response.headers.get('Retry-After')
+    if retry_after != None:
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    #exponential backoff with full jitter
+    return random.uniform(0, min(retry_max_wait, retry_base_wait * 2 ** (attempt - 1)))
+
+
+# Sends a request to the server using the shared session and returns the
+# response. All methods in this module send their requests through here, so
+# the rate limit and retry settings above apply to every call. Pass
+# idempotent=False for requests which must not be repeated after a 502/504.
+def _request(method, request_url, idempotent=True, **kwargs):
+    status_codes = retry_status_codes if idempotent else [code for code in retry_status_codes if code in non_idempotent_retry_status_codes]
+    attempt = 0
+    while True:
+        _wait_for_rate_limit()
+        response = get_session().request(method, request_url, **kwargs)
+        if response.status_code not in status_codes or attempt >= retry_attempts:
+            return response
+        attempt += 1
+        wait = _calculate_retry_wait(response, attempt)
+        if debug_mode:
+            print('Return code', response.status_code, 'on', method, request_url, '- retry', attempt, 'of', retry_attempts, 'in', round(wait, 2), 'seconds')
+        time.sleep(wait)
+
+
+_lookup_cache = {}
+_lookup_cache_lock = threading.Lock()
+
+
+# Empties the lookup cache (see lookup_cache_ttl), optionally resetting the
+# hit/miss counters as well
+def clear_lookup_cache(reset_stats=False):
+    with _lookup_cache_lock:
+        _lookup_cache.clear()
+        if reset_stats:
+            lookup_cache_stats['hits'] = 0
+            lookup_cache_stats['misses'] = 0
+
+
+# Decorator which caches the results of a read-only lookup method for
+# lookup_cache_ttl seconds. Callers receive their own copy of the cached data
+# so they can modify it freely. Empty results are not cached, since the
+# lookup methods also return an empty list (or a dictionary) on error.
+def _cached_lookup(function):
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not lookup_cache_ttl:
+            return function(*args, **kwargs)
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        cache_key = (fqdn, key, function.__name__, repr(tuple(arguments.arguments.items())))
+        with _lookup_cache_lock:
+            entry = _lookup_cache.get(cache_key)
+            if entry != None and time.monotonic() - entry[0] < lookup_cache_ttl:
+                lookup_cache_stats['hits'] += 1
+                return copy.deepcopy(entry[1])
+            lookup_cache_stats['misses'] += 1
+        result = function(*args, **kwargs)
+        #get_policies(return_errors=True) returns (policies, errors); only
+        #complete results are cached
+        data = result
+        if isinstance(result, tuple):
+            data = result[0] if len(result[1]) == 0 else None
+        if isinstance(data, list) and len(data) > 0:
+            with _lookup_cache_lock:
+                _lookup_cache[cache_key] = (time.monotonic(), copy.deepcopy(result))
+        return result
+
+    return wrapper
+
+
+# Export Device List to disk (in Excel format unless export_format is set)
+def export_devices(include_deactivated=False, export_format=None):
+    #stream the devices from server
+    devices = iter_devices(include_deactivated=include_deactivated)
     #calculate timestamp
     timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H.%M')
     #calculate folder name
     folder_name = create_export_folder()
-    #calculate file name
-    file_name = f'device_list_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
+    #calculate file name (extension is added based on export format)
+    file_name = f'device_list_{timestamp}_{fqdn.split(".",1)[0]}'
     #write data to disk
-    devices_df.to_excel(f'{folder_name}/{file_name}', index=False)
+    try:
+        file_path, device_count = write_export(devices, folder_name, file_name, export_format=export_format)
+    except requests.HTTPError as e:
+        return 'ERROR: ' + str(e)
     #return confirmation message
-    return ('INFO: ' + str(len(devices)) + f' devices written to {folder_name}/{file_name}')
+    return ('INFO: ' + str(device_count) + f' devices written to {file_path}')
 
 
 # Accepts a list of (exact hostnames | hostname regex patterns | CIDRs) and
@@ -66,58 +276,155 @@ def move_devices(search_list, group_name, regex_hostname_search=False, cidr_sear
 
 
 # Accepts list of hostnames, removes any explicit/manual group assignment.
-def move_devices_to_automatic_assignment(hostnames):
+# Devices are removed from their groups in bulk (see move_devices_by_group).
+# With return_results=True, the per-group results are returned instead of a
+# message.
+def move_devices_to_automatic_assignment(hostnames, return_results=False):
     #Get all devices from server
     devices = get_devices(include_deactivated=False)
 
-    #Establish a list to store the devices that match the search list
-    devices_to_move = []
-
     #Search the full device list and pull out those that match our search list
-    for device in devices:
-        if device['hostname'] in hostnames:
-            devices_to_move.append(device)
+    hostnames = set(hostnames)
+    devices_to_move = [device for device in devices if device['hostname'] in hostnames]
 
-    #Iterate through the list of matching devices
-    for device in devices_to_move:
-        #Remove the device from it's current group
-        remove_devices_from_group([device['id']], device['group_id'])
+    #Remove the matching devices from their current groups, one request per
+    #group (per id_chunk_size devices)
+    results = move_devices_by_group(devices_to_move)
+    if return_results:
+        return results
 
     #Return a message indicating how many devices were moved
-    return(str(len(devices_to_move)) + ' devices were moved to automatic assignment')
-
-
-#Archives (hides from GUI and API) a list of devices
-def archive_devices(device_ids, unarchive=False):
-    # Calculate headers and URL
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
+    failed_count = sum(len(result['failed']) for result in results.values())
+    message = str(len(devices_to_move) - failed_count) + ' devices were moved to automatic assignment'
+    if failed_count > 0:
+        message += ' (' + str(failed_count) + ' failed)'
+    return message
+
+
+# Splits a list into lists of at most chunk_size items
+def _chunks(items, chunk_size):
+    chunk_size = max(1, chunk_size)
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+# Sends POST requests for a list of (request_url, chunk of ids) pairs, with the
+# ids in payload_field, concurrently using up to max_workers threads. Chunks
+# which don't return expected_status_code are retried up to id_chunk_retries
+# more times. Returns a tuple of (list of the pairs which succeeded, list of
+# (pair, status code of the final attempt) for those which failed).
+def _post_chunks(url_chunks, expected_status_code, payload_field='ids'):
+    pending = list(url_chunks)
+    succeeded = []
+    failed = []
+
+    def post(url_chunk):
+        return _request('POST', url_chunk[0], json={payload_field: url_chunk[1]})
+
+    for attempt in range(1 + id_chunk_retries):
+        if len(pending) == 0:
+            break
+        if attempt > 0 and debug_mode:
+            print('Retrying', len(pending), 'failed chunks')
+        if len(pending) == 1:
+            responses = [post(pending[0])]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                responses = list(executor.map(post, pending))
+
+        failed = []
+        for url_chunk, response in zip(pending, responses):
+            if response.status_code == expected_status_code:
+                succeeded.append(url_chunk)
+            else:
+                failed.append((url_chunk, response.status_code))
+        pending = [url_chunk for url_chunk, status_code in failed]
+
+    return succeeded, failed
+
+
+# Sends a list of ids to a method which accepts a list of ids in its payload,
+# split into chunks of up to id_chunk_size ids (see _post_chunks). Returns a
+# dictionary with the succeeded and failed ids, and the status_codes returned
+# by the final attempt of each failed chunk.
+def _post_id_chunks(request_url, ids, expected_status_code, payload_field='ids'):
+    succeeded, failed = _post_chunks([(request_url, chunk) for chunk in _chunks(list(ids), id_chunk_size)], expected_status_code, payload_field=payload_field)
+    failed_ids = [id for (url, chunk), status_code in failed for id in chunk]
+    status_codes = [status_code for url_chunk, status_code in failed]
+    if len(failed_ids) > 0:
+        print('ERROR:', len(failed_ids), 'ids failed on POST to', request_url, 'with return code(s)', sorted(set(status_codes)))
+    return {'succeeded': [id for url, chunk in succeeded for id in chunk], 'failed': failed_ids, 'status_codes': status_codes}
+
+
+# Plans a bulk group move for a list of devices (each needs id and group_id).
+# Returns a dictionary of {group_id: [device ids]} giving the group each
+# request is sent to. If group_id is None, devices are planned for removal
+# from their current group (automatic assignment) and grouped by that group;
+# otherwise devices not already in group_id are planned to be added to it.
+def plan_group_moves(devices, group_id=None):
+    plan = {}
+    for device in devices:
+        if group_id == None:
+            plan.setdefault(device['group_id'], []).append(device['id'])
+        elif device['group_id'] != group_id:
+            plan.setdefault(group_id, []).append(device['id'])
+    return plan
+
+
+# Executes a bulk group move (see plan_group_moves). Each group's device list
+# is split into chunks of up to id_chunk_size ids, and the chunks for all
+# groups are sent together by _post_chunks (one pool of up to max_workers
+# threads, with failed chunks retried). Returns a dictionary of
+# {group_id: result}, where each result has the device_ids planned, the
+# succeeded and failed device ids, and the status_codes returned for the
+# group's failed requests.
+def move_devices_by_group(devices, group_id=None):
+    remove = group_id == None
+    plan = plan_group_moves(devices, group_id=group_id)
+    results = {target_group_id: {'device_ids': device_ids, 'succeeded': [], 'failed': [], 'status_codes': []} for target_group_id, device_ids in plan.items()}
+    group_ids_by_url = {_group_devices_url(target_group_id, remove=remove): target_group_id for target_group_id in plan}
+
+    url_chunks = [(request_url, chunk) for request_url, target_group_id in group_ids_by_url.items() for chunk in _chunks(plan[target_group_id], id_chunk_size)]
+    succeeded, failed = _post_chunks(url_chunks, 204, payload_field='devices')
+    for request_url, chunk in succeeded:
+        results[group_ids_by_url[request_url]]['succeeded'].extend(chunk)
+    for (request_url, chunk), status_code in failed:
+        result = results[group_ids_by_url[request_url]]
+        result['failed'].extend(chunk)
+        result['status_codes'].append(status_code)
+
+    for target_group_id, result in results.items():
+        if len(result['failed']) > 0:
+            print('ERROR:', len(result['failed']), 'devices could not be', 'removed from' if remove else 'added to', 'group', target_group_id, 'with return code(s)', sorted(set(result['status_codes'])))
+    return results
+
+
+#Archives (hides from GUI and API) a list of devices. Long lists are sent in
+#chunks (see id_chunk_size). With return_failed_ids=True, the list of ids
+#which could not be archived is returned instead of True/False.
+def archive_devices(device_ids, unarchive=False, return_failed_ids=False):
+    # Calculate URL
     if unarchive:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/unarchive'
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/unarchive'
     else:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/archive'
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/archive'
 
-    # Create payload with list of provided IDs as a Python dictionary
-    payload = {'ids': device_ids}
+    # Send the list of provided IDs to the server
+    results = _post_id_chunks(request_url, device_ids, 200)
 
-    # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
-
-    # Check response code
-    if response.status_code == 200:
-        # return True if operation was successful
-        return True
-    else:
-        # return False if unexpected return code (something failed)
-        return False
+    if return_failed_ids:
+        return results['failed']
+    # return True if operation was successful for all ids, False otherwise
+    return len(results['failed']) == 0
 
 
 # Unarchives (unhides from GUI and API) a list of devices
-def unarchive_devices(device_ids):
-    return archive_devices(device_ids=device_ids, unarchive=True)
+def unarchive_devices(device_ids, return_failed_ids=False):
+    return archive_devices(device_ids=device_ids, unarchive=True, return_failed_ids=return_failed_ids)
 
 
-# Write Device Policy data to disk in MS Excel format.
-def export_policies(include_allow_deny_lists=True):
+# Write Device Policy data to disk (in MS Excel format unless export_format
+# is set), one file per platform.
+def export_policies(include_allow_deny_lists=True, export_format=None):
     # Get all policies from server, including auxilary data
     policies = get_policies(include_policy_data=True, include_allow_deny_lists=include_allow_deny_lists)
 
@@ -142,14 +449,6 @@ def export_policies(include_allow_deny_lists=True):
         elif policy['os'] == 'NETWORK_AGENTLESS':
             network_agentless_policies.append(policy)
 
-    # Convert to Pandas dataframes (to allow easy exports to Excel)
-    windows_policies_df = pandas.DataFrame(windows_policies)
-    mac_policies_df = pandas.DataFrame(mac_policies)
-    ios_policies_df = pandas.DataFrame(ios_policies)
-    android_policies_df = pandas.DataFrame(android_policies)
-    chrome_policies_df = pandas.DataFrame(chrome_policies)
-    network_agentless_policies_df = pandas.DataFrame(network_agentless_policies)
-
     # Get current timestamp and format for usage in exported filenames
     timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H.%M')
 
@@ -157,65 +456,98 @@ def export_policies(include_allow_deny_lists=True):
 
     folder_name = create_export_folder()
 
-    file_name = f'windows_policies_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    windows_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(windows_policies), 'policies written to', f'{folder_name}/{file_name}')
-
-    file_name = f'mac_policies.xlsx_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    mac_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(mac_policies), 'policies written to', f'{folder_name}/{file_name}')
-
-    file_name = f'ios_policies.xlsx_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    ios_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(ios_policies), 'policies written to', f'{folder_name}/{file_name}')
-
-    file_name = f'android_policies_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    android_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(android_policies), 'policies written to', f'{folder_name}/{file_name}')
-
-    file_name = f'chrome_policies_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    chrome_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(chrome_policies), 'policies written to', f'{folder_name}/{file_name}')
-
-    file_name = f'network_agentless_policies_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    network_agentless_policies_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print('INFO:', len(network_agentless_policies), 'policies written to', f'{folder_name}/{file_name}')
+    for platform_policies, file_name in [
+        (windows_policies, f'windows_policies_{timestamp}_{fqdn.split(".",1)[0]}'),
+        (mac_policies, f'mac_policies.xlsx_{timestamp}_{fqdn.split(".",1)[0]}'),
+        (ios_policies, f'ios_policies.xlsx_{timestamp}_{fqdn.split(".",1)[0]}'),
+        (android_policies, f'android_policies_{timestamp}_{fqdn.split(".",1)[0]}'),
+        (chrome_policies, f'chrome_policies_{timestamp}_{fqdn.split(".",1)[0]}'),
+        (network_agentless_policies, f'network_agentless_policies_{timestamp}_{fqdn.split(".",1)[0]}'),
+        ]:
+        file_path, policy_count = write_export(platform_policies, folder_name, file_name, export_format=export_format)
+        print('INFO:', policy_count, 'policies written to', file_path)
+
+
+# Concurrent read-modify-write of policy data. Policies are selected either
+# by policy_ids, or by predicate(policy) applied to get_policies() (all
+# policies if neither is provided). The data of the selected policies is
+# fetched concurrently, mutate(policy_data) is called on a copy of each
+# policy's data dictionary (modify it in place, or return a replacement), and
+# only policies whose data changed are written back, also concurrently, using
+# up to max_workers threads. With dry_run=True nothing is written. Returns a
+# dictionary with:
+#   changed - list of {policy_id, request_url, changes, status_code} where
+#             changes is {field: {'old': value, 'new': value}} and status_code
+#             is the PUT return code (None for a dry run)
+#   unchanged - list of ids of policies which needed no change
+#   errors - list of {policy_id, request_url, status_code} for policy data
+#            which could not be read or written
+def patch_policies(mutate, predicate=None, policy_ids=None, dry_run=False):
+    # SELECT POLICIES
+    if policy_ids == None:
+        policy_ids = [policy['id'] for policy in get_policies() if predicate == None or predicate(policy)]
+
+    results = {'changed': [], 'unchanged': [], 'errors': []}
+    if len(policy_ids) == 0:
+        return results
+
+    # READ POLICY DATA CONCURRENTLY AND CALCULATE CHANGES
+    updates = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for policy_id, (request_url, status_code, policy_data) in zip(policy_ids, executor.map(lambda policy_id: _get_policy_detail(policy_id, 'data'), policy_ids)):
+            if policy_data == None:
+                results['errors'].append({'policy_id': policy_id, 'request_url': request_url, 'status_code': status_code})
+                continue
+            new_data = copy.deepcopy(policy_data['data'])
+            returned_data = mutate(new_data)
+            if returned_data != None:
+                new_data = returned_data
+            changes = {}
+            for field in list(policy_data['data'].keys()) + [field for field in new_data.keys() if field not in policy_data['data']]:
+                if policy_data['data'].get(field) != new_data.get(field):
+                    changes[field] = {'old': policy_data['data'].get(field), 'new': new_data.get(field)}
+            if len(changes) == 0:
+                results['unchanged'].append(policy_id)
+            else:
+                updated_policy_data = dict(policy_data)
+                updated_policy_data['data'] = new_data
+                updates.append((policy_id, request_url, changes, updated_policy_data))
+
+    # WRITE CHANGED POLICY DATA CONCURRENTLY (UNLESS DRY RUN)
+    if dry_run:
+        for policy_id, request_url, changes, updated_policy_data in updates:
+            results['changed'].append({'policy_id': policy_id, 'request_url': request_url, 'changes': changes, 'status_code': None})
+        return results
+
+    if len(updates) > 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(lambda update: _request('PUT', update[1], json=update[3]), updates))
+        clear_lookup_cache()
+        for (policy_id, request_url, changes, updated_policy_data), response in zip(updates, responses):
+            if response.status_code in (200, 204):
+                results['changed'].append({'policy_id': policy_id, 'request_url': request_url, 'changes': changes, 'status_code': response.status_code})
+            else:
+                print('ERROR: Unexpected return code', response.status_code, 'on PUT to', request_url)
+                results['errors'].append({'policy_id': policy_id, 'request_url': request_url, 'status_code': response.status_code})
+
+    return results
 
 
 # Enable automatic upgrade setting in policies
 def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_modified_policies_id_list=False):
-    # Get list of policies
-    policies = get_policies()
-
-    # Establish a counter of how many policies were modified (used in return)
-    modified_policy_counter = 0
 
-    # Establish a list of modified policy IDs
-    modified_policies_id_list = []
+    # Sets the upgrade setting in a policy's data
+    def set_automatic_upgrade(policy_data):
+        policy_data['automatic_upgrade'] = automatic_upgrade
 
-    # Static headers for all requests in this function
-    headers = {'accept': 'application/json', 'Authorization': key}
+    # Update policies for the targeted platforms concurrently; only policies
+    # where the setting needs changing are written back
+    results = patch_policies(set_automatic_upgrade, predicate=lambda policy: policy['os'] in platforms)
+    modified_policies_id_list = [result['policy_id'] for result in results['changed']]
 
-    # Iterate through the polic0ies
-    for policy in policies:
-        # Check if the OS of the current policy is one of the targeted platforms
-        if policy['os'] in platforms:
-            # If yes, get policy data from the server
-            policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-            response = requests.get(request_url, headers=headers)
-            policy_data = response.json()
-            # Check if the upgrade setting needs changing
-            if policy_data['data']['automatic_upgrade'] != automatic_upgrade:
-                # If yes, set it to desired setting
-                policy_data['data']['automatic_upgrade'] = automatic_upgrade
-                # Write modified policy data back to server (saving change)
-                response = requests.put(request_url, json=policy_data, headers=headers)
-                # Increment the counter of how many policies we have modified
-                modified_policy_counter += 1
-                modified_policies_id_list.append(policy['id'])
-
-    return_string = str(modified_policy_counter) + ' policies modified to set automatic_upgrade to ' + str(automatic_upgrade)
+    return_string = str(len(modified_policies_id_list)) + ' policies modified to set automatic_upgrade to ' + str(automatic_upgrade)
+    if len(results['errors']) > 0:
+        return_string += ' (' + str(len(results['errors'])) + ' policies failed)'
 
     if return_modified_policies_id_list:
         print(return_string)
@@ -232,37 +564,28 @@ def disable_upgrades(platforms=['WINDOWS','MAC'], return_modified_policies_id_li
 # Enables upgrades for a list of policy IDs
 def enable_upgrades_for_list_of_policy_ids(policy_ids, automatic_upgrade=True):
 
-    # Establish a counter of how many policies were modified (used in return)
-    modified_policy_counter = 0
+    # Sets the upgrade setting in a policy's data
+    def set_automatic_upgrade(policy_data):
+        policy_data['automatic_upgrade'] = automatic_upgrade
 
-    # Static headers for all requests in this function
-    headers = {'accept': 'application/json', 'Authorization': key}
+    # Update the policies concurrently; only policies where the setting needs
+    # changing are written back
+    results = patch_policies(set_automatic_upgrade, policy_ids=list(policy_ids))
 
-    # Iterate through the poliocy ids provided
-    for policy_id in policy_ids:
-        request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-        response = requests.get(request_url, headers=headers)
-        policy_data = response.json()
-        # Check if the upgrade setting needs changing
-        if policy_data['data']['automatic_upgrade'] != automatic_upgrade:
-            # If yes, set it to desired setting
-            policy_data['data']['automatic_upgrade'] = automatic_upgrade
-            # Write modified policy data back to server (saving change)
-            request = requests.put(request_url, json=policy_data, headers=headers)
-            # Increment the counter of how many policies we have modified
-            modified_policy_counter += 1
-
-    return str(modified_policy_counter) + ' policies modified to set automatic_upgrade to ' + str(automatic_upgrade)
+    return_string = str(len(results['changed'])) + ' policies modified to set automatic_upgrade to ' + str(automatic_upgrade)
+    if len(results['errors']) > 0:
+        return_string += ' (' + str(len(results['errors'])) + ' policies failed)'
+    return return_string
 
 
 # Returns a list of all visible Tenants
+@_cached_lookup
 def get_tenants():
-    # Calculate headers and url
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/'
+    # Calculate url
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/'
 
     # Get data from server
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
 
     #check response code, parse JSON if valid
     if response.status_code == 200:
@@ -273,15 +596,26 @@ def get_tenants():
     return tenants
 
 
-# Returns a list of all visible Devices
-def get_devices(include_deactivated=True):
+# Requests one page (up to 50 devices) from /api/v1/devices and parses it.
+# Returns a tuple of (request_url, status_code, parsed response or None).
+def _get_devices_page(last_id):
+    request_url = f'{protocol}://{fqdn}/api/v1/devices?after_device_id={last_id}'
+    response = _request('GET', request_url)
+    if response.status_code == 200:
+        return request_url, response.status_code, response.json()
+    else:
+        return request_url, response.status_code, None
+
+
+# Generator which yields all visible Devices as each page is returned by the
+# server. With prefetch=True, the request for the next page is issued in a
+# background thread as soon as the cursor for it is known, overlapping network
+# latency with processing of the current page. Raises requests.HTTPError if
+# the crawl is abandoned after 10 failed requests.
+def iter_devices(include_deactivated=True, prefetch=False):
     # CREATE VARIABLES
     #cursor to keep track of highest device id returned
     last_id = 0
-    #list to collect the devices
-    collected_devices = []
-    #static set of headers for requests in this method
-    headers = {'accept': 'application/json', 'Authorization': key}
 
     # The method we are using (/api/v1/devices) returns up to 50 devices at a
     # time, and the response includes a last_id which indicates the highest
@@ -289,35 +623,164 @@ def get_devices(include_deactivated=True):
     # key when we get last_id=None in a response.
 
     error_count = 0
+    consecutive_error_count = 0
+    #background worker and pending request for the next page (prefetch only)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if prefetch else None
+    next_page = None
+
     # COLLECT DATA
-    while last_id != None and error_count < 10: #loop until all visible devices have been collected
-        #calculate URL for request
-        request_url = f'https://{fqdn}/api/v1/devices?after_device_id={last_id}'
-        #make request, store response
-        response = requests.get(request_url, headers=headers)
-        if response.status_code == 200:
-            response = response.json() #convert to Python list
-            if 'last_id' in response:
-                last_id = response['last_id'] #save returned last_id for reuse on next request
-            else: #added this to handle issue where some server versions fail to return last_id on final batch of devices
-                last_id = None
-            if 'devices' in response:
-                devices = response['devices'] #extract devices from response
-                for device in devices: #iterate through the list of devices
-                    if device['license_status'] == 'ACTIVATED' or include_deactivated:
-                        collected_devices.append(device) #add to collected devices
-        else:
-            print('WARNING: Unexpected return code', response.status_code,
-            'on request to\n', request_url, '\nwith headers\n', headers)
-            error_count += 1  #increment error counter
-            time.sleep(10) #wait before trying request again
+    try:
+        while last_id != None: #loop until all visible devices have been collected
+            #get the page for the current cursor, either from the prefetch worker or directly
+            if next_page is not None:
+                request_url, status_code, response = next_page.result()
+                next_page = None
+            else:
+                request_url, status_code, response = _get_devices_page(last_id)
+            if status_code == 200:
+                consecutive_error_count = 0
+                if 'last_id' in response:
+                    last_id = response['last_id'] #save returned last_id for reuse on next request
+                else: #added this to handle issue where some server versions fail to return last_id on final batch of devices
+                    last_id = None
+                #start fetching the next page while this one is processed
+                if executor is not None and last_id != None:
+                    next_page = executor.submit(_get_devices_page, last_id)
+                if 'devices' in response:
+                    devices = response['devices'] #extract devices from response
+                    for device in devices: #iterate through the list of devices
+                        if device['license_status'] == 'ACTIVATED' or include_deactivated:
+                            yield device
+            else:
+                print('WARNING: Unexpected return code', status_code,
+                'on request to\n', request_url)
+                error_count += 1  #increment error counter
+                if error_count >= 10:
+                    raise requests.HTTPError(f'Giving up after {error_count} failed requests; last was return code {status_code} on request to {request_url}')
+                consecutive_error_count += 1
+                #wait before trying request again, doubling the wait after each consecutive failure
+                time.sleep(min(device_retry_max_wait, device_retry_wait * 2 ** (consecutive_error_count - 1)))
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Returns a list of all visible Devices (see iter_devices for prefetch)
+def get_devices(include_deactivated=True, prefetch=False):
+    #list to collect the devices
+    collected_devices = []
 
-    # When while loop exists, we know we have collected all visible data
+    try:
+        for device in iter_devices(include_deactivated=include_deactivated, prefetch=prefetch):
+            collected_devices.append(device) #add to collected devices
+    #after repeated errors, return the devices collected so far (warnings were already printed)
+    except requests.HTTPError:
+        pass
 
     # RETURN COLLECTED DATA
     return collected_devices
 
 
+# Index over a list of CIDRs (IPv4 and/or IPv6) which tests whether an IP
+# address falls within any of them in O(log n), using a sorted list of merged
+# address ranges per IP version. Build it once and reuse it across calls, e.g.
+# get_device_ids(CidrIndex(cidrs), cidr_search=True). Supports the 'in'
+# operator with an IP address string; invalid addresses never match.
+class CidrIndex:
+
+    def __init__(self, cidrs):
+        ranges = {4: [], 6: []}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr)
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        #sort the ranges and merge any which overlap or are adjacent, so that
+        #the range starting at or before an address is the only candidate
+        self._starts = {}
+        self._ends = {}
+        for version, version_ranges in ranges.items():
+            merged = []
+            for start, end in sorted(version_ranges):
+                if len(merged) > 0 and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, end in merged]
+            self._ends[version] = [end for start, end in merged]
+
+    def __contains__(self, ip_address):
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return False
+        value = int(address)
+        position = bisect.bisect_right(self._starts[address.version], value) - 1
+        return position >= 0 and value <= self._ends[address.version][position]
+
+
+# Matches hostnames against a list of regex patterns (with re.match
+# semantics) with few regex calls. Runs of consecutive plain patterns are
+# compiled once into a combined alternation of named groups, and the name of
+# the group which matched identifies the pattern. Patterns containing "(?"
+# (inline flags, which before Python 3.11 apply to the whole alternation,
+# conditionals, named groups) or numbered backreferences depend on their
+# own group numbering and flags, so they are matched on their own. Build it
+# once and reuse it across calls.
+class HostnameMatcher:
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        #compile individually first so an invalid pattern raises as it did before
+        compiled = [re.compile(pattern) for pattern in self.patterns]
+        #list of (combined regex, list of pattern indexes) tried in order
+        self._segments = []
+        plain = []
+        for index, pattern in enumerate(self.patterns):
+            if '(?' in pattern or re.search(r'\\[1-9]', pattern):
+                self._add_combined(plain)
+                plain = []
+                self._segments.append((compiled[index], [index]))
+            else:
+                plain.append(index)
+        self._add_combined(plain)
+
+    def _add_combined(self, indexes):
+        if len(indexes) > 0:
+            combined = re.compile('|'.join(f'(?P<_pattern{number}>{self.patterns[index]})' for number, index in enumerate(indexes)))
+            self._segments.append((combined, indexes))
+
+    # Returns the first pattern (in list order) which matches the hostname, or
+    # None if no pattern matches
+    def match(self, hostname):
+        for regex, indexes in self._segments:
+            match = regex.match(hostname)
+            if match != None:
+                if len(indexes) == 1:
+                    return self.patterns[indexes[0]]
+                #the alternation matches the leftmost pattern which matches, and
+                #its group is the last to close, so lastgroup identifies it
+                return self.patterns[indexes[int(match.lastgroup[len('_pattern'):])]]
+        return None
+
+
+# Returns a dictionary of {device id: matching pattern} for all activated
+# devices whose hostname matches one of the provided regex patterns (or a
+# prebuilt HostnameMatcher), reporting the first pattern matched
+def get_device_ids_by_hostname_pattern(patterns):
+    if isinstance(patterns, HostnameMatcher):
+        matcher = patterns
+    else:
+        matcher = HostnameMatcher(patterns)
+    matches = {}
+    for device in get_devices(include_deactivated=False):
+        pattern = matcher.match(device['hostname'])
+        if pattern != None:
+            matches[device['id']] = pattern
+    return matches
+
+
 # Translates a list of device names, regex patterns, or CIDRs to a list of
 # device IDs
 def get_device_ids(search_list, regex_hostname_search=False, cidr_search=False):
@@ -331,24 +794,31 @@ def get_device_ids(search_list, regex_hostname_search=False, cidr_search=False):
 
     # Regex-based matching on hostname
     if regex_hostname_search:
+        #search_list may be a prebuilt HostnameMatcher (reusable across calls) or a list of patterns
+        if isinstance(search_list, HostnameMatcher):
+            matcher = search_list
+        else:
+            matcher = HostnameMatcher(search_list)
         for device in devices:
-            for regex in search_list: #for each regex...
-                if re.match(regex, device['hostname']): #check if hostname matches
-                    if device['id'] not in device_ids: #avoid duplicates
-                        device_ids.append(device['id']) #append id to search results
+            if matcher.match(device['hostname']) != None: #each device matches at most once, so no duplicates
+                device_ids.append(device['id']) #append id to search results
 
     # IP range (CIDR) matching
     elif cidr_search:
-        for cidr in search_list: #for each cidr in the search list...
-            for device in devices:
-                if ipaddress.ip_address(device['ip_address']) in ipaddress.ip_network(cidr):
-                    if device['id'] not in device_ids: #avoid duplicates
-                        device_ids.append(device['id']) #append id to search results
+        #search_list may be a prebuilt CidrIndex (reusable across calls) or a list of CIDRs
+        if isinstance(search_list, CidrIndex):
+            cidr_index = search_list
+        else:
+            cidr_index = CidrIndex(search_list)
+        for device in devices:
+            if device['ip_address'] in cidr_index: #each device matches at most once, so no duplicates
+                device_ids.append(device['id']) #append id to search results
 
     # Hostname search (exact match only)
     else:
+        search_set = set(search_list)
         for device in devices:
-            if device['hostname'] in search_list:
+            if device['hostname'] in search_set:
                 device_ids.append(device['id']) #append id to search results
 
     # RETURN THE SEARCH RESULTS
@@ -368,44 +838,73 @@ def get_group_id(group_name, exclude_default_groups=False):
     return None #no match found
 
 
-# Adds a list of Devices to a Device Group
-def add_devices_to_group(device_ids, group_id, remove=False):
-    # Calculate headers and URL
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
+# Calculates the URL of the add-devices (or remove-devices) method of a group
+def _group_devices_url(group_id, remove=False):
     if remove:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/remove-devices'
+        return f'{protocol}://{fqdn}/api/v1/groups/{group_id}/remove-devices'
     else:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/add-devices'
+        return f'{protocol}://{fqdn}/api/v1/groups/{group_id}/add-devices'
 
-    # Create payload
-    payload = {'devices': device_ids}
 
+# Adds a list of Devices to a Device Group. Long lists are sent in chunks (see
+# id_chunk_size). With return_failed_ids=True, the list of ids which could
+# not be added is returned instead of a message.
+def add_devices_to_group(device_ids, group_id, remove=False, return_failed_ids=False):
     # Send to server, return confirmation if successful
-    response = requests.post(request_url, json=payload, headers=headers)
-    if response.status_code == 204: #expected return code
+    results = _post_id_chunks(_group_devices_url(group_id, remove=remove), device_ids, 204, payload_field='devices')
+    if return_failed_ids:
+        return results['failed']
+    if len(results['failed']) == 0:
         if remove:
-            return str(len(device_ids)) + ' devices removed from group ' + str(group_id)
+            return str(len(results['succeeded'])) + ' devices removed from group ' + str(group_id)
         else:
-            return str(len(device_ids)) + ' devices added to group ' + str(group_id)
+            return str(len(results['succeeded'])) + ' devices added to group ' + str(group_id)
     else:
         return None #something went wrong
 
 
 # Removes a list of Devices from a Device Group
-def remove_devices_from_group(device_ids, group_id):
-    return add_devices_to_group(device_ids=device_ids, group_id=group_id, remove=True)
+def remove_devices_from_group(device_ids, group_id, return_failed_ids=False):
+    return add_devices_to_group(device_ids=device_ids, group_id=group_id, remove=True, return_failed_ids=return_failed_ids)
+
+
+# Allow-list and deny-list methods appended to policy data by get_policies,
+# as (URL suffix, field name in returned policy) pairs
+_allow_deny_list_fields = [
+    ('allow-list/hashes', 'allow_list_static_analysis_hashes'),
+    ('allow-list/paths', 'allow_list_static_analysis_paths'),
+    ('allow-list/certificates', 'allow_list_static_analysis_certificates'),
+    ('allow-list/process_paths', 'allow_list_behavioral_analysis_process_paths'),
+    ('allow-list/scripts', 'allow_list_script_control'),
+    ('deny-list/hashes', 'deny_list_static_analysis_hashes'),
+    ]
+
+
+# Requests one auxiliary policy method from the server. Returns a tuple of
+# (request_url, status_code, parsed response or None).
+def _get_policy_detail(policy_id, url_suffix):
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}/{url_suffix}'
+    response = _request('GET', request_url)
+    if response.status_code == 200:
+        return request_url, response.status_code, response.json()
+    else:
+        return request_url, response.status_code, None
 
 
-# Collect and return list of Device Policies.
-def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL'):
+# Collect and return list of Device Policies. Policy data and allow/deny
+# lists (when enabled) are fetched concurrently using up to max_workers
+# threads. Requests which fail are skipped as before (for some platforms no
+# policy data is available); with return_errors=True a list describing each
+# failed request is returned as well, as (policies, errors).
+@_cached_lookup
+def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL', return_errors=False):
     # GET POLICIES (basic data only)
 
-    # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/policies/'
+    # Calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/'
 
     # Get data, convert to Python list
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
     policies = response.json()
 
     # Apply filter based on msp, if enabled
@@ -416,85 +915,52 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep
                 filtered_policies.append(policy)
         policies = filtered_policies
 
-    # APPEND POLICY DATA (IF ENABLED)
-    if include_policy_data:
-
-        # Iterate through policy list
-        for policy in policies:
-            # Extract ID, calculate URL, and pull policy data from server
-            policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-            response = requests.get(request_url, headers=headers)
-            # Check response code (for some platforms, no policy data available)
-            if response.status_code == 200:
-                # Extract policy data from response and append it to policy
-                if keep_data_encapsulated:
-                    policy_data = response.json()
+    # BUILD LIST OF AUXILIARY DATA TO COLLECT (IF ENABLED)
+    # Each entry is (policy, URL suffix, field name); a field name of None
+    # means the response is policy data to be merged into the policy.
+    detail_requests = []
+    for policy in policies:
+        if include_policy_data:
+            detail_requests.append((policy, 'data', None))
+        if include_allow_deny_lists:
+            for url_suffix, field_name in _allow_deny_list_fields:
+                detail_requests.append((policy, url_suffix, field_name))
+
+    # COLLECT AUXILIARY DATA CONCURRENTLY
+    errors = []
+    if len(detail_requests) > 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_get_policy_detail, policy['id'], url_suffix) for policy, url_suffix, field_name in detail_requests]
+
+            # Append results to policies in the same order as requested, so
+            # the merged output matches the sequential implementation
+            for (policy, url_suffix, field_name), future in zip(detail_requests, futures):
+                request_url, status_code, detail = future.result()
+                if detail == None:
+                    errors.append({'policy_id': policy['id'], 'policy_name': policy.get('name'), 'request_url': request_url, 'status_code': status_code})
+                elif field_name == None:
+                    # Extract policy data from response and append it to policy
+                    if keep_data_encapsulated:
+                        policy.update(detail)
+                    else:
+                        policy.update(detail['data'])
                 else:
-                    policy_data = response.json()['data']
-                policy.update(policy_data)
-
-    # APPEND ALLOW-LIST AND DENY-LIST DATA (IF ENABLED)
-    if include_allow_deny_lists:
-
-        # Iterate through policy list
-        for policy in policies:
-
-            # Extract the policy id, which is used in subsequent requests
-            policy_id = policy['id']
-
-            # Each of the 6 code blocks below extract a specific type of allow-
-            # or deny-list data from the server and append it to the policy
-            # in policies (the collected data).
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/hashes'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                allow_list_hashes = response.json()
-                policy['allow_list_static_analysis_hashes'] = allow_list_hashes['items']
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/paths'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                allow_list_paths = response.json()
-                policy['allow_list_static_analysis_paths'] = allow_list_paths['items']
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/certificates'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                allow_list_certificates = response.json()
-                policy['allow_list_static_analysis_certificates'] = allow_list_certificates['items']
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/process_paths'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                allow_list_process_paths = response.json()
-                policy['allow_list_behavioral_analysis_process_paths'] = allow_list_process_paths['items']
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/scripts'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                allow_list_scripts = response.json()
-                policy['allow_list_script_control'] = allow_list_scripts['items']
-
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/deny-list/hashes'
-            response = requests.get(request_url, headers=headers)
-            if response.status_code == 200:
-                deny_list_hashes = response.json()
-                policy['deny_list_static_analysis_hashes'] = deny_list_hashes['items']
+                    policy[field_name] = detail['items']
 
     # RETURN THE COLLECTED DATA
+    if return_errors:
+        return policies, errors
     return policies
 
 
 # Returns a list of all MSPs on the server
+@_cached_lookup
 def get_msps():
-    # Calculate headers and url
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
+    # Calculate url
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
 
     # Get data from server
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
 
     #check response code, parse JSON if valid
     if response.status_code == 200:
@@ -509,13 +975,13 @@ def get_msps():
 
 # Create a new MSP
 def create_msp(msp_name, license_limit):
-    # Calculate headers, URL, and payload
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
+    # Calculate URL and payload
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
     payload = {'name': msp_name, 'license_limit': license_limit}
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = _request('POST', request_url, json=payload, idempotent=False)
+    clear_lookup_cache()
 
     # Check return code and return Success or descriptive error
     if response.status_code == 200:
@@ -544,9 +1010,9 @@ def delete_msp(msp_name):
         return 'No match found for provided msp_name ' + msp_name
 
     # DELETE THE MSP
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
-    headers = {'Authorization': key}
-    response = requests.delete(request_url, headers=headers)
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
+    response = _request('DELETE', request_url)
+    clear_lookup_cache()
 
     # RETURN SUCCESS/FAILURE BASED ON RETURN CODE
     if response.status_code == 204:
@@ -572,9 +1038,8 @@ def remove_device(device, device_id_only=False):
         device_id = device['id']
 
     #UNINSTALL THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/remove'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/remove'
+    response = _request('POST', request_url)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
@@ -585,15 +1050,29 @@ def remove_device(device, device_id_only=False):
         return False
 
 
-# Return a list of events matching specified search parameters and/or minimum
-# event id. If neither are provided, all visible events are returned.
-def get_events(search={}, minimum_event_id=0, suspicious=False):
+# Calculates the URL of the event search method for a given cursor position.
+# server_protocol and server_fqdn default to the protocol and fqdn settings
+# (deepinstinct30_async passes its own).
+def _event_search_url(after_event_id, suspicious=False, server_protocol=None, server_fqdn=None):
+    if server_protocol == None:
+        server_protocol = protocol
+    if server_fqdn == None:
+        server_fqdn = fqdn
+    base_url = f'{server_protocol}://{server_fqdn}/api/v1'
+    if suspicious:
+        return f'{base_url}/suspicious-events/search?after_event_id={str(after_event_id)}'
+    else:
+        return f'{base_url}/events/search?after_event_id={str(after_event_id)}'
 
-    #define HTTP headers for all requests in this method
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
 
-    #list to collect events
-    collected_events = []
+# Generator which yields events matching specified search parameters and/or
+# minimum event id as they are returned by the server, one page (up to 50
+# events) at a time, so that memory use stays constant regardless of how many
+# events exist. By default individual events are yielded; with
+# yield_pages=True each item is a dictionary {'events': [...], 'last_id': N}
+# where last_id is the cursor to pass as minimum_event_id to resume the crawl.
+# Raises requests.HTTPError on an unexpected return code.
+def iter_events(search={}, minimum_event_id=0, suspicious=False, yield_pages=False):
 
     #Note that the API method we are calling returns up to 50 events at a time,
     #and we know we have all events when we get last_id=None back in the response
@@ -602,33 +1081,169 @@ def get_events(search={}, minimum_event_id=0, suspicious=False):
     while minimum_event_id != None:
 
         #calculate request url
-        if suspicious:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/search?after_event_id={str(minimum_event_id)}'
-        else:
-            request_url = f'https://{fqdn}/api/v1/events/search?after_event_id={str(minimum_event_id)}'
+        request_url = _event_search_url(minimum_event_id, suspicious)
 
         #make request to server, store response
-        response = requests.post(request_url, headers=headers, json=search)
+        response = _request('POST', request_url, json=search)
 
         if debug_mode:
             print(request_url, '\n returned', response.status_code)
 
-        #check HTTP return code, and in case of error exit the method and return empty list
+        #check HTTP return code, and in case of error stop the crawl
         if response.status_code != 200:
-            return []
+            raise requests.HTTPError(f'Unexpected return code {response.status_code} on POST to {request_url}', response=response)
+
+        response = response.json()
+
+        #store the returned last_id value
+        minimum_event_id = response['last_id']
+
+        #if we got a none-null last_id back, then hand the event(s) to the caller
+        if minimum_event_id != None:
+            if yield_pages:
+                yield {'events': response['events'], 'last_id': minimum_event_id}
+            else:
+                yield from response['events']
+
+
+# Return a list of events matching specified search parameters and/or minimum
+# event id. If neither are provided, all visible events are returned. Setting
+# shard_count above 1 crawls the event id space in parallel ranges (see
+# get_events_sharded).
+def get_events(search={}, minimum_event_id=0, suspicious=False, shard_count=1):
+
+    if shard_count > 1:
+        return get_events_sharded(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious, shard_count=shard_count)
+
+    #list to collect events
+    collected_events = []
+
+    #collect all events returned by iter_events
+    try:
+        for page in iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious, yield_pages=True):
+            collected_events.extend(page['events'])
+            minimum_event_id = page['last_id']
+    #in case of error (after retries), keep the events collected so far
+    except requests.HTTPError as e:
+        print('ERROR:', e, '- returning the', len(collected_events), 'events collected before the error. To resume, use minimum_event_id', minimum_event_id)
+
+    #return the list of collected events
+    return collected_events
+
+
+# Returns the id of the first event after after_event_id matching the search
+# parameters, or None if there are no such events. Used to probe the event id
+# space without crawling it.
+def _get_next_event_id(after_event_id, search={}, suspicious=False):
+    request_url = _event_search_url(after_event_id, suspicious)
+    response = _request('POST', request_url, json=search)
+    if response.status_code != 200:
+        raise requests.HTTPError(f'Unexpected return code {response.status_code} on POST to {request_url}', response=response)
+    response = response.json()
+    if response['last_id'] == None or len(response['events']) == 0:
+        return None
+    return response['events'][0]['id']
+
+
+# Returns the highest event id matching the search parameters, or None if no
+# events match. Uses an exponential search followed by a binary search on
+# after_event_id, so it needs a number of requests proportional to the log of
+# the event id range rather than crawling every event.
+def get_max_event_id(search={}, minimum_event_id=0, suspicious=False):
+    #lowest known event id (an event exists with this id)
+    lower = _get_next_event_id(int(minimum_event_id), search, suspicious)
+    if lower == None:
+        return None
+
+    #find an upper bound after which no events exist
+    step = 1024
+    while True:
+        next_event_id = _get_next_event_id(lower + step, search, suspicious)
+        if next_event_id == None:
+            upper = lower + step
+            break
+        lower = next_event_id
+        step *= 2
+
+    #narrow the range until lower is the last event
+    while lower < upper:
+        middle = (lower + upper) // 2
+        next_event_id = _get_next_event_id(middle, search, suspicious)
+        if next_event_id == None:
+            upper = middle
         else:
-            #store the returned last_id value
-            minimum_event_id = response.json()['last_id']
-
-            #if we got a none-null last_id back
-            if minimum_event_id != None:
-                #then extract the events
-                events = response.json()['events']
-                #append the event(s) from this response to collected_events
-                for event in events:
+            lower = next_event_id
+
+    return lower
+
+
+# Collects the events with ids in the range (lower_event_id, upper_event_id].
+# An upper_event_id of None means the range is open-ended. Returns a tuple of
+# (events, error), where error is the requests.HTTPError which stopped the
+# crawl (after retries) or None, so that events collected before an error are
+# kept.
+def _get_events_in_range(lower_event_id, upper_event_id, search={}, suspicious=False):
+    collected_events = []
+    try:
+        for page in iter_events(search=search, minimum_event_id=lower_event_id, suspicious=suspicious, yield_pages=True):
+            for event in page['events']:
+                if upper_event_id == None or event['id'] <= upper_event_id:
                     collected_events.append(event)
+            #stop once the cursor has passed the end of this range
+            if upper_event_id != None and page['last_id'] >= upper_event_id:
+                break
+    except requests.HTTPError as e:
+        return collected_events, e
+    return collected_events, None
 
-    #return the list of collected events
+
+# Return a list of events matching specified search parameters and/or minimum
+# event id, crawling shard_count ranges of the event id space in parallel.
+# The highest event id is found by probing the server (see get_max_event_id)
+# unless maximum_event_id is provided. The last range is open-ended, so events
+# created during the crawl are still collected. Events are returned in id
+# order. In case of error (after retries), the same as get_events, the events
+# up to the point of the error are returned and the minimum_event_id to resume
+# from is printed: all complete ranges before the first failed range, plus the
+# events that range collected before failing. Events from later ranges are not
+# returned, so that resuming from the printed id neither skips nor duplicates
+# events.
+def get_events_sharded(search={}, minimum_event_id=0, suspicious=False, shard_count=4, maximum_event_id=None):
+
+    minimum_event_id = int(minimum_event_id)
+
+    try:
+        if maximum_event_id == None:
+            maximum_event_id = get_max_event_id(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious)
+    except requests.HTTPError as e:
+        print('ERROR:', e, '- no events were collected. To resume, use minimum_event_id', minimum_event_id)
+        return []
+    if maximum_event_id == None or maximum_event_id <= minimum_event_id:
+        #nothing to split, fall back to a single sequential crawl
+        return get_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious)
+
+    #split (minimum_event_id, maximum_event_id] into contiguous ranges
+    span = maximum_event_id - minimum_event_id
+    boundaries = sorted(set(minimum_event_id + span * i // shard_count for i in range(shard_count + 1)))
+    ranges = list(zip(boundaries[:-1], boundaries[1:]))
+    ranges[-1] = (ranges[-1][0], None)
+
+    #crawl each range on its own worker
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(_get_events_in_range, lower, upper, search, suspicious) for lower, upper in ranges]
+        results = [future.result() for future in futures]
+
+    #ranges are disjoint and in ascending order, so concatenating them keeps id
+    #order. Stop at the first range which failed.
+    collected_events = []
+    for number, ((lower, upper), (events, error)) in enumerate(zip(ranges, results)):
+        collected_events.extend(events)
+        if error != None:
+            resume_event_id = events[-1]['id'] if len(events) > 0 else lower
+            discarded = sum(len(later_events) for later_events, later_error in results[number + 1:])
+            print('ERROR:', error, '- returning the', len(collected_events), 'events collected before the error. To resume, use minimum_event_id', resume_event_id,
+                  f'({discarded} events collected from later ranges were not returned)' if discarded > 0 else '')
+            break
     return collected_events
 
 
@@ -640,12 +1255,12 @@ def get_suspicious_events(search={}, minimum_event_id=0):
 
 
 #Return a list of all visible Device Groups
+@_cached_lookup
 def get_groups(exclude_default_groups=False):
-    # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/groups/'
+    # Calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/groups/'
     # Get Device Groups from server
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
     #Check response code
     if response.status_code == 200:
         groups = response.json() #convert to Python list
@@ -662,11 +1277,10 @@ def get_groups(exclude_default_groups=False):
 
 #Gets a single device
 def get_device(device_id):
-    # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}'
+    # Calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}'
     # Get data on the requested device ID from the server
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
     # Check response code
     if response.status_code == 200:
         device = response.json() #convert to Python list
@@ -685,27 +1299,21 @@ def archive_events (ids, unarchive=False, suspicious=False, input_is_ids_only=Tr
             event_ids.append(event['id'])
         ids = event_ids
 
-    # set headers (same for all requests in this method)
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
-
-    # Create payload with list of event IDs as a Python dictionary
-    payload = {'ids': ids}
-
     # calculate the appropriate url based on configuration
     if not suspicious and not unarchive:
-        request_url = f'https://{fqdn}/api/v1/events/actions/archive'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/archive'
     elif not suspicious and unarchive:
-        request_url = f'https://{fqdn}/api/v1/events/actions/unarchive'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/unarchive'
     elif suspicious and not unarchive:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/archive'
+        request_url = f'{protocol}://{fqdn}/api/v1/suspicious-events/actions/archive'
     elif suspicious and unarchive:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/unarchive'
+        request_url = f'{protocol}://{fqdn}/api/v1/suspicious-events/actions/unarchive'
 
-    #send request to server
-    response = requests.post(request_url, headers=headers, json=payload)
+    #send list of event IDs to server (in chunks, see id_chunk_size)
+    results = _post_id_chunks(request_url, ids, 204)
 
     #return true if successful, false otherwise
-    return (response.status_code == 204)
+    return len(results['failed']) == 0
 
 
 #hides a list of suspicious event ids from the GUI and REST API
@@ -732,19 +1340,175 @@ def create_export_folder():
         os.makedirs(exported_data_folder_name)
     return exported_data_folder_name
 
-def get_event(event_id, suspicious=False):
 
-    #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
+# Maximum number of data rows on one Excel worksheet (1,048,576 less header)
+excel_max_rows = 1048575
+
+
+# Converts a chunk of records to a dataframe, optionally flattening nested
+# dictionaries into dotted columns and restricting to the provided columns
+def _records_to_dataframe(records, columns=None, flatten=False):
+    if flatten:
+        df = pandas.json_normalize(records)
+    else:
+        df = pandas.DataFrame(records)
+    if columns != None:
+        df = df.reindex(columns=columns)
+    return df
+
+
+# Generator which consumes records (any iterable, including a generator) and
+# yields them as dataframes of up to chunk_size rows (default export_chunk_size)
+def _iter_dataframe_chunks(records, columns=None, flatten=False, chunk_size=None):
+    chunk_size = chunk_size or export_chunk_size
+    chunk = []
+    chunk_count = 0
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield _records_to_dataframe(chunk, columns, flatten)
+            chunk_count += 1
+            chunk = []
+    #always yield at least one (possibly empty) chunk so that a file is written
+    if len(chunk) > 0 or chunk_count == 0:
+        yield _records_to_dataframe(chunk, columns, flatten)
+
+
+# Spools dataframe chunks to a temporary folder so that the union of their
+# columns (in order of first appearance) is known before anything is written.
+# Yields (columns, generator of the chunks reindexed to those columns). Only
+# one chunk is held in memory at a time; the spool is deleted afterwards.
+@contextlib.contextmanager
+def _spool_chunks(chunks):
+    with tempfile.TemporaryDirectory() as spool_folder:
+        columns = []
+        spool_paths = []
+        for chunk_number, df in enumerate(chunks):
+            columns.extend(column for column in df.columns if column not in columns)
+            spool_path = os.path.join(spool_folder, f'{chunk_number}.pickle')
+            df.to_pickle(spool_path)
+            spool_paths.append(spool_path)
+
+        def read_chunks():
+            for spool_path in spool_paths:
+                yield pandas.read_pickle(spool_path).reindex(columns=columns)
+
+        yield columns, read_chunks()
+
+
+# Writes dataframe chunks to an Excel file. Excel cannot hold more than
+# excel_max_rows rows per worksheet, so larger exports are continued on
+# additional worksheets (sheet_name_2, sheet_name_3, ...). Note that the
+# Excel writer needs the whole export in memory (the chunks are concatenated
+# before writing), so chunking doesn't reduce peak memory for this format;
+# use 'csv.gz', 'parquet', or 'jsonl' for very large exports.
+def _write_xlsx(chunks, file_path, sheet_name):
+    df = pandas.concat(list(chunks), ignore_index=True)
+    with pandas.ExcelWriter(file_path) as writer:
+        if len(df) <= excel_max_rows:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+        else:
+            print('WARNING:', len(df), 'rows exceed the Excel limit of', excel_max_rows, 'rows per worksheet; writing multiple worksheets. Consider using another export_format.')
+            for sheet_number, start in enumerate(range(0, len(df), excel_max_rows), start=1):
+                df.iloc[start:start + excel_max_rows].to_excel(writer, sheet_name=sheet_name if sheet_number == 1 else f'{sheet_name}_{sheet_number}', index=False)
+    return len(df)
+
+
+# Writes dataframe chunks to a gzip-compressed CSV file. The header is the
+# union of the columns of all chunks (see _spool_chunks), so columns which
+# first appear in a later chunk are kept.
+def _write_csv_gz(chunks, file_path, sheet_name):
+    row_count = 0
+    with _spool_chunks(chunks) as (columns, spooled_chunks):
+        with gzip.open(file_path, 'wt', newline='', encoding='utf-8') as f:
+            for chunk_number, df in enumerate(spooled_chunks):
+                df.to_csv(f, index=False, header=chunk_number == 0)
+                row_count += len(df)
+    return row_count
+
+
+# Writes dataframe chunks to a JSON Lines file (one JSON object per row)
+def _write_jsonl(chunks, file_path, sheet_name):
+    row_count = 0
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for df in chunks:
+            if len(df) > 0:
+                lines = df.to_json(orient='records', lines=True, date_format='iso')
+                f.write(lines if lines.endswith('\n') else lines + '\n')
+            row_count += len(df)
+    return row_count
+
+
+# Writes dataframe chunks to a Parquet file (requires the pyarrow library).
+# Nested values (lists and dictionaries) are stored as JSON strings. The
+# columns are the union of the columns of all chunks (see _spool_chunks). The
+# schema types are taken from the first chunk (columns with no values there,
+# including columns which first appear in a later chunk, are stored as
+# strings), and later chunks are converted to it.
+def _write_parquet(chunks, file_path, sheet_name):
+    import pyarrow, pyarrow.parquet
+    row_count = 0
+    writer = None
+    schema = None
+    try:
+        with _spool_chunks(chunks) as (columns, spooled_chunks):
+            for df in spooled_chunks:
+                df = df.copy()
+                for column in df.columns:
+                    if df[column].dtype == object:
+                        df[column] = df[column].map(lambda value: json.dumps(value) if isinstance(value, (dict, list)) else value)
+                if schema == None:
+                    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                    schema = pyarrow.schema([pyarrow.field(field.name, pyarrow.string()) if pyarrow.types.is_null(field.type) or df[field.name].isna().all() else field for field in table.schema]).remove_metadata()
+                    writer = pyarrow.parquet.ParquetWriter(file_path, schema)
+                #values which don't match a string column (e.g. numbers in a column
+                #that held text in the first chunk) are stored as text
+                for field in schema:
+                    if pyarrow.types.is_string(field.type):
+                        df[field.name] = df[field.name].map(lambda value: value if value is None or isinstance(value, str) or (isinstance(value, float) and value != value) else str(value))
+                writer.write_table(pyarrow.Table.from_pandas(df, schema=schema, preserve_index=False, safe=False))
+                row_count += len(df)
+    finally:
+        if writer != None:
+            writer.close()
+    return row_count
+
+
+# Export formats supported by write_export, as format: (file extension, writer)
+# Each writer accepts (dataframe chunks, file path, sheet name) and returns the
+# number of rows written. Additional formats can be registered here.
+export_writers = {
+    'xlsx': ('xlsx', _write_xlsx),
+    'parquet': ('parquet', _write_parquet),
+    'csv.gz': ('csv.gz', _write_csv_gz),
+    'jsonl': ('jsonl', _write_jsonl),
+    }
+
+
+# Writes records (a list or generator of dictionaries) to
+# folder_name/file_name.<extension> in the requested export format (default
+# default_export_format), consuming the records in chunks of export_chunk_size.
+# Returns a tuple of (file path, number of rows written).
+def write_export(records, folder_name, file_name, export_format=None, columns=None, sheet_name='Sheet1', flatten=False):
+    if export_format == None:
+        export_format = default_export_format
+    if export_format not in export_writers:
+        raise ValueError(f'Unsupported export_format {export_format}; use one of {list(export_writers)}')
+    extension, writer = export_writers[export_format]
+    file_path = f'{folder_name}/{file_name}.{extension}'
+    row_count = writer(_iter_dataframe_chunks(records, columns=columns, flatten=flatten), file_path, sheet_name)
+    return file_path, row_count
+
+def get_event(event_id, suspicious=False):
 
     #calculate request url
     if suspicious:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/{str(event_id)}'
+        request_url = f'{protocol}://{fqdn}/api/v1/suspicious-events/{str(event_id)}'
     else:
-        request_url = f'https://{fqdn}/api/v1/events/{str(event_id)}'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/{str(event_id)}'
 
     #make request, store response
-    response = requests.get(request_url, headers=headers)
+    response = _request('GET', request_url)
 
     # based on response code, return event or alternately an error code
     if response.status_code == 200:
@@ -758,17 +1522,15 @@ def get_event(event_id, suspicious=False):
 
 def create_policy(name, base_policy_id, comment=''):
 
-    #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
-
     #calculate request url
-    request_url = f'https://{fqdn}/api/v1/policies/'
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/'
 
     #create the payload
     payload = {'name': name, 'comment': comment, 'base_policy_id': base_policy_id}
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = _request('POST', request_url, json=payload, idempotent=False)
+    clear_lookup_cache()
 
     # Check response code
     if response.status_code == 200:
@@ -782,14 +1544,12 @@ def create_policy(name, base_policy_id, comment=''):
 
 def delete_policy(policy_id):
 
-    #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
-
     #calculate request url
-    request_url = f'https://{fqdn}/api/v1/policies/{policy_id}'
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/{policy_id}'
 
     # Send request to server
-    response = requests.delete(request_url, headers=headers)
+    response = _request('DELETE', request_url)
+    clear_lookup_cache()
 
     # Check response code
     if response.status_code == 204:
@@ -806,32 +1566,146 @@ def delete_policy(policy_id):
         'on DELETE to', request_url)
         return False
 
-def export_events(minimum_event_id=0, suspicious=False, flatten_device_info=True):
+# Export events to disk (in Excel format unless export_format is set). Events
+# are streamed from the server to the export file in chunks. With
+# checkpoint=True, progress is saved after every page (see
+# _collect_events_with_checkpoint) so that an interrupted export resumes where
+# it stopped, and a later run exports only the events created since the last
+# successful export.
+def export_events(minimum_event_id=0, suspicious=False, flatten_device_info=True, checkpoint=False, export_format=None):
+
+    if checkpoint:
+        if not _collect_events_with_checkpoint(minimum_event_id=minimum_event_id, suspicious=suspicious):
+            return
+        events = _iter_spooled_events(suspicious=suspicious)
+    else:
+        #events are returned in ascending id order
+        events = iter_events(minimum_event_id=minimum_event_id, suspicious=suspicious)
 
-    events = get_events(minimum_event_id=minimum_event_id, suspicious=suspicious)
+    #check that there is at least one event before creating the export file
+    try:
+        first_event = next(events, None)
+    except requests.HTTPError as e:
+        print('ERROR:', e)
+        return
 
-    if len(events) > 0:
-        if flatten_device_info:
-            #flattens recorded_device_info into discreet columns. Examples: recorded_device_info.hostname, recorded_device_info.policy_name
-            events = pandas.json_normalize(events)
-        events_df = pandas.DataFrame(events)
-        events_df.sort_values(by=['id'], inplace=True)
+    if first_event != None:
         folder_name = create_export_folder()
-        file_name = f'events_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
+        file_name = f'events_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}'
         if suspicious:
             file_name = f'suspicious_{file_name}'
         columns = ['id', 'status', 'action', 'type', 'trigger', 'threat_severity', 'file_hash', 'file_archive_hash', 'path', 'timestamp', 'insertion_timestamp', 'close_timestamp', 'close_trigger', 'last_reoccurrence', 'reoccurrence_count', 'last_action', 'device_id', 'recorded_device_info.os', 'recorded_device_info.mac_address', 'recorded_device_info.hostname', 'recorded_device_info.tag', 'recorded_device_info.group_name', 'recorded_device_info.policy_name', 'recorded_device_info.tenant_name', 'comment', 'mitre_classifications', 'file_size', 'file_status', 'sandbox_status', 'msp_name', 'msp_id', 'tenant_name', 'tenant_id']
-        events_df.to_excel(f'{folder_name}/{file_name}', index=False, sheet_name='Event_Data', columns=columns)
-        print('INFO:', len(events), 'events were exported to disk as:', f'{folder_name}/{file_name}')
+        #flatten_device_info flattens recorded_device_info into discreet columns. Examples: recorded_device_info.hostname, recorded_device_info.policy_name
+        try:
+            file_path, event_count = write_export(itertools.chain([first_event], events), folder_name, file_name, export_format=export_format, columns=columns, sheet_name='Event_Data', flatten=flatten_device_info)
+        except requests.HTTPError as e:
+            print('ERROR:', e, '- the export file is incomplete')
+            return
+        print('INFO:', event_count, 'events were exported to disk as:', file_path)
+        if checkpoint:
+            _commit_event_checkpoint(suspicious=suspicious)
+    elif checkpoint:
+        _commit_event_checkpoint(suspicious=suspicious)  #removes the empty spool
+        print('WARNING: No new events were found on the server since the last checkpoint')
     else:
         print('WARNING: No events were found on the server')
 
-def export_groups(exclude_default_groups=False):
+
+# Returns the paths of the checkpoint file and spool file used by
+# export_events(checkpoint=True)
+def _event_checkpoint_paths(suspicious=False):
+    folder_name = create_export_folder()
+    prefix = 'suspicious_events' if suspicious else 'events'
+    return f'{folder_name}/{prefix}_export_checkpoint.json', f'{folder_name}/{prefix}_export_spool.jsonl'
+
+
+# Atomically writes the checkpoint file, so that it always describes a
+# consistent state even if the process is killed while writing it
+def _write_event_checkpoint(checkpoint_path, checkpoint):
+    temporary_path = checkpoint_path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+
+# Collects events for export_events(checkpoint=True). Each page is appended to
+# an on-disk spool (one event per line), then the checkpoint is updated with
+# the page's last_id and the size of the spool. If a checkpoint exists, the
+# crawl resumes from it (minimum_event_id is ignored) and the spool is
+# truncated to the recorded size, discarding any page written after the last
+# checkpoint. Returns True when all events have been spooled, or False if the
+# crawl failed (the progress so far is kept for the next run, and the spool is
+# removed if nothing was spooled).
+def _collect_events_with_checkpoint(minimum_event_id=0, suspicious=False):
+    checkpoint_path, spool_path = _event_checkpoint_paths(suspicious)
+
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        #a spool with events in it means the previous run didn't finish
+        if checkpoint['spool_size'] > 0:
+            print('INFO: Resuming event export from checkpoint at event id', checkpoint['last_id'])
+        else:
+            print('INFO: Exporting events created since the last export (after event id', str(checkpoint['last_id']) + ')')
+    else:
+        checkpoint = {'last_id': int(minimum_event_id), 'spool_size': 0}
+
+    with open(spool_path, 'ab') as spool:
+        spool.truncate(checkpoint['spool_size'])
+        try:
+            for page in iter_events(minimum_event_id=checkpoint['last_id'], suspicious=suspicious, yield_pages=True):
+                for event in page['events']:
+                    spool.write(json.dumps(event).encode() + b'\n')
+                spool.flush()
+                os.fsync(spool.fileno())
+                checkpoint = {'last_id': page['last_id'], 'spool_size': spool.tell()}
+                _write_event_checkpoint(checkpoint_path, checkpoint)
+        except requests.HTTPError as e:
+            print('ERROR:', e, '- progress was saved at event id', checkpoint['last_id'], 'and the export will resume from there on the next run')
+            completed = False
+        else:
+            completed = True
+
+    if not completed and checkpoint['spool_size'] == 0:
+        os.remove(spool_path)
+    return completed
+
+
+# Generator which reads back the events spooled by
+# _collect_events_with_checkpoint, one at a time
+def _iter_spooled_events(suspicious=False):
+    checkpoint_path, spool_path = _event_checkpoint_paths(suspicious)
+    with open(spool_path) as spool:
+        for line in spool:
+            yield json.loads(line)
+
+
+# Marks the spooled events as exported. The checkpoint keeps last_id, so the
+# next export_events(checkpoint=True) fetches only newer events.
+def _commit_event_checkpoint(suspicious=False):
+    checkpoint_path, spool_path = _event_checkpoint_paths(suspicious)
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    checkpoint['spool_size'] = 0
+    _write_event_checkpoint(checkpoint_path, checkpoint)
+    os.remove(spool_path)
+
+
+# Removes the saved export_events checkpoint, so that the next checkpointed
+# export starts again from minimum_event_id
+def reset_event_export_checkpoint(suspicious=False):
+    for path in _event_checkpoint_paths(suspicious):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_groups(exclude_default_groups=False, export_format=None):
     groups = get_groups(exclude_default_groups=exclude_default_groups)
-    groups_df = pandas.DataFrame(groups)
     folder_name = create_export_folder()
-    file_name = f'groups_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
-    groups_df.to_excel(f'{folder_name}/{file_name}', index=False)
+    file_name = f'groups_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}'
+    write_export(groups, folder_name, file_name, export_format=export_format)
 
 
 def create_tenant(tenant_name, license_limit, msp_name):
@@ -844,14 +1718,12 @@ def create_tenant(tenant_name, license_limit, msp_name):
                 'name': tenant_name,
                 'license_limit': license_limit }
 
-    #calculate headers
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
-
     #calculate URL
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/'
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/'
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = _request('POST', request_url, json=payload, idempotent=False)
+    clear_lookup_cache()
 
     # Check return code and return success or descriptive error
     if response.status_code == 200: #tenant creation was successful
@@ -890,12 +1762,12 @@ def delete_tenant(tenant_name, msp_name):
             if tenant['name'] == tenant_name:
                 tenant_id = tenant['id']
 
-    #calculate URL and headers
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/{tenant_id}'
-    headers = {'Authorization': key}
+    #calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/{tenant_id}'
 
     #send request to server
-    response = requests.delete(request_url, headers=headers)
+    response = _request('DELETE', request_url)
+    clear_lookup_cache()
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
@@ -916,12 +1788,11 @@ def request_agent_logs(device_id, device_id_only=True):
     if not device_id_only:
         device_id = device_id['id']
 
-    #calculate URL and headers
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/upload-logs'
-    headers = {'Authorization': key, 'accept': 'application/json'}
+    #calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/upload-logs'
 
     # Send request to server
-    response = requests.post(request_url, headers=headers)
+    response = _request('POST', request_url)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
@@ -934,66 +1805,62 @@ def request_agent_logs(device_id, device_id_only=True):
         print('WARN: Device', device_id, 'not found')
         return False
     else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url, 'with headers', headers)
+        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
         return False
 
-def close_events(event_id_list, open=False):
+# Closes (or opens) a list of events. Long lists are sent in chunks (see
+# id_chunk_size). With return_failed_ids=True, the list of ids which failed
+# is returned instead of True/False.
+def close_events(event_id_list, open=False, return_failed_ids=False):
 
-    #calculate URL, headers, and payload
+    #calculate URL
     if open:
-        request_url = f'https://{fqdn}/api/v1/events/actions/open'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/open'
     else:
-        request_url = f'https://{fqdn}/api/v1/events/actions/close'
-    headers = {'Authorization': key,
-                'accept': 'application/json',
-                'Content-Type': 'application/json'}
-    payload = {'ids': event_id_list}
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/close'
 
-    # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    # Send request(s) to server (errors are printed by _post_id_chunks)
+    results = _post_id_chunks(request_url, event_id_list, 204)
 
-    # Check return code and return Success or descriptive error
-    if response.status_code == 204:
+    if len(results['succeeded']) > 0:
         if open:
-            print('INFO:', len(event_id_list), 'events were opened')
+            print('INFO:', len(results['succeeded']), 'events were opened')
         else:
-            print('INFO:', len(event_id_list), 'events were closed')
-        return True
-    else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
-        return False
+            print('INFO:', len(results['succeeded']), 'events were closed')
+
+    if return_failed_ids:
+        return results['failed']
+    return len(results['failed']) == 0
 
-def open_events(event_id_list):
-    return close_events(event_id_list=event_id_list, open=True)
+def open_events(event_id_list, return_failed_ids=False):
+    return close_events(event_id_list=event_id_list, open=True, return_failed_ids=return_failed_ids)
 
-def archive_events(event_id_list, unarchive=False):
+# Archives (or unarchives) a list of events. Long lists are sent in chunks
+# (see id_chunk_size). With return_failed_ids=True, the list of ids which
+# failed is returned instead of True/False.
+def archive_events(event_id_list, unarchive=False, return_failed_ids=False):
 
-    #calculate URL, headers, and payload
+    #calculate URL
     if unarchive:
-        request_url = f'https://{fqdn}/api/v1/events/actions/unarchive'
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/unarchive'
     else:
-        request_url = f'https://{fqdn}/api/v1/events/actions/archive'
-    headers = {'Authorization': key,
-                'accept': 'application/json',
-                'Content-Type': 'application/json'}
-    payload = {'ids': event_id_list}
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/archive'
 
-    # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    # Send request(s) to server (errors are printed by _post_id_chunks)
+    results = _post_id_chunks(request_url, event_id_list, 204)
 
-    # Check return code and return Success or descriptive error
-    if response.status_code == 204:
+    if len(results['succeeded']) > 0:
         if unarchive:
-            print('INFO: Successfully unarchived up to ', len(event_id_list), 'events')
+            print('INFO: Successfully unarchived up to ', len(results['succeeded']), 'events')
         else:
-            print('INFO: Successfully archived up to ', len(event_id_list), 'events')
-        return True
-    else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
-        return False
+            print('INFO: Successfully archived up to ', len(results['succeeded']), 'events')
+
+    if return_failed_ids:
+        return results['failed']
+    return len(results['failed']) == 0
 
-def unarchive_events(event_id_list):
-    return archive_events(event_id_list=event_id_list, unarchive=True)
+def unarchive_events(event_id_list, return_failed_ids=False):
+    return archive_events(event_id_list=event_id_list, unarchive=True, return_failed_ids=return_failed_ids)
 
 
 # Disable scanning and enforcement on a device
@@ -1008,9 +1875,8 @@ def disable_device(device, device_id_only=False):
         device_id = device['id']
 
     #DISABLE THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/disable'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/disable'
+    response = _request('POST', request_url)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
@@ -1033,9 +1899,8 @@ def enable_device(device, device_id_only=False):
         device_id = device['id']
 
     #ENABLE THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/enable'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/enable'
+    response = _request('POST', request_url)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
@@ -1046,19 +1911,75 @@ def enable_device(device, device_id_only=False):
         return False
 
 
-def get_event_counts_by_device_id(minimum_event_id=0, event_filters={}):
+# Sends one device action request (remove | disable | enable | upload-logs)
+# and returns (device_id, status_code, latency in seconds). The latency
+# includes any rate limit wait and retries.
+def _post_device_action(device_id, action):
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/{action}'
+    start_time = time.perf_counter()
+    response = _request('POST', request_url)
+    return device_id, response.status_code, time.perf_counter() - start_time
+
+
+# Sends a device action for each of the provided devices (device ids or
+# device dictionaries, in any iterable) using up to max_workers threads, with
+# the rate limit and retry settings applied to every request. Instead of
+# printing per device, returns a dictionary with the succeeded and failed
+# device ids (in the order provided), and the status_codes and latencies
+# (seconds) of each device's request as {device_id: value}.
+def _bulk_device_action(devices, action):
+    device_ids = [device['id'] if isinstance(device, dict) else device for device in devices]
+    results = {'succeeded': [], 'failed': [], 'status_codes': {}, 'latencies': {}}
+    if len(device_ids) == 0:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for device_id, status_code, latency in executor.map(lambda device_id: _post_device_action(device_id, action), device_ids):
+            results['status_codes'][device_id] = status_code
+            results['latencies'][device_id] = latency
+            if status_code == 204: #expected return code
+                results['succeeded'].append(device_id)
+            else:
+                results['failed'].append(device_id)
+
+    print('INFO:', action, 'succeeded for', len(results['succeeded']), 'of', len(device_ids), 'devices')
+    return results
+
+
+# Bulk versions of remove_device, disable_device, enable_device, and
+# request_agent_logs. Each accepts an iterable of device ids or device
+# dictionaries and returns a results dictionary (see _bulk_device_action).
+def remove_devices(devices):
+    return _bulk_device_action(devices, 'remove')
+
 
-    #get event data from server
-    events = get_events(minimum_event_id=minimum_event_id, search=event_filters)
+def disable_devices(devices):
+    return _bulk_device_action(devices, 'disable')
 
-    #convert to PivotTable style summary of event count by device id
-    event_counts = count_data_by_field(events, 'device_id')
+
+def enable_devices(devices):
+    return _bulk_device_action(devices, 'enable')
+
+
+def request_agent_logs_for_devices(devices):
+    return _bulk_device_action(devices, 'upload-logs')
+
+
+def get_event_counts_by_device_id(minimum_event_id=0, event_filters={}):
+
+    #stream event data from server and convert to PivotTable style summary of
+    #event count by device id without holding all events in memory
+    try:
+        event_counts = count_data_by_field(iter_events(minimum_event_id=minimum_event_id, search=event_filters), 'device_id')
+    except requests.HTTPError as e:
+        print('ERROR:', e)
+        event_counts = {}
 
     #return the data
     return event_counts
 
 
-def export_event_count_by_device_id(minimum_event_id=0, event_filters={}):
+def export_event_count_by_device_id(minimum_event_id=0, event_filters={}, export_format=None):
 
     #get events counts
     event_counts = get_event_counts_by_device_id(minimum_event_id=minimum_event_id, event_filters=event_filters)
@@ -1071,23 +1992,19 @@ def export_event_count_by_device_id(minimum_event_id=0, event_filters={}):
 
     #calculate (and create if necessary) export folder and file name
     folder_name = create_export_folder()
-    file_name = f'event_count_by_device_id_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
+    file_name = f'event_count_by_device_id_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}'
 
     #write data to disk
-    event_counts_df.to_excel(f'{folder_name}/{file_name}', index=False, sheet_name='Event_Counts')
-    print('INFO: event counts were exported to disk as:', f'{folder_name}/{file_name}')
+    file_path, row_count = write_export(event_counts_df.to_dict('records'), folder_name, file_name, export_format=export_format, sheet_name='Event_Counts')
+    print('INFO: event counts were exported to disk as:', file_path)
 
     #return event_counts in case needed for further analysis in another method
     return event_counts
 
 def count_data_by_field(data, field_name):
-    result = {}
-    for record in data:
-        if record[field_name] in result.keys():
-            result[record[field_name]] += 1
-        else:
-            result[record[field_name]] = 1
-    return result
+    #Counter counts in C and keeps keys in the order first seen; data may be
+    #any iterable of dictionaries, including a generator such as iter_events
+    return dict(collections.Counter(map(operator.itemgetter(field_name), data)))
 
 def is_prevention_policy(policy, exclude_static_analysis=False, exclude_ransomware_behavior=False, exclude_remote_code_injection=False, exclude_arbritrary_shallcode_execution=False):
 
@@ -1109,9 +2026,8 @@ def is_prevention_policy(policy, exclude_static_analysis=False, exclude_ransomwa
     return verdict
 
 def download_uploaded_file(file_hash):
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/events/actions/download-uploaded-file/{file_hash}'
-    response = requests.get(request_url, headers=headers)
+    request_url = f'{protocol}://{fqdn}/api/v1/events/actions/download-uploaded-file/{file_hash}'
+    response = _request('GET', request_url)
     if response.status_code == 200:
         folder_name = create_export_folder()
         file_name = f'{file_hash}.zip'
@@ -1123,12 +2039,11 @@ def download_uploaded_file(file_hash):
 
 def request_malware_sample(event_id):
 
-    #calculate URL and headers
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/devices/actions/request-remote-file-upload/{event_id}'
+    #calculate URL
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/request-remote-file-upload/{event_id}'
 
     # Send request to server
-    response = requests.post(request_url, headers=headers)
+    response = _request('POST', request_url)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
@@ -1138,5 +2053,5 @@ def request_malware_sample(event_id):
         print('WARN: Event', event_id, 'not found')
         return False
     else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url, 'with headers', headers)
+        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
         return False
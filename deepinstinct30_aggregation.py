@@ -0,0 +1,250 @@
+# Deep Instinct v3.0 Aggregation
+#
+# Counting and summarizing helpers for device and event data. Lists of
+# records are converted to a column-oriented pandas DataFrame once and
+# grouped/counted with vectorized pandas and NumPy operations instead of
+# looping over the records in Python, and events can be counted page by page
+# as they are streamed from the server so that the full event list never
+# needs to be held in memory.
+#
+# Suggested Usage:
+# 1. Save this file in the same directory as deepinstinct30.py and your code
+# 2. Include "import deepinstinct30 as di, deepinstinct30_aggregation as agg"
+# 3. Set di.fqdn and di.key as usual
+# 4. Examples:
+#     agg.count_by(devices, ['tenant_id', 'os'])  -> {(tenant_id, os): count}
+#     agg.count_by_period(events, freq='W', fields='device_id')
+#     counter = agg.count_events(['device_id', 'type'], minimum_event_id=1000)
+#     agg.add_weekly_event_rates(devices, counter.result('device_id'))
+#
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. This is not a
+# Deep Instinct commercial product and is not officially supported.
+#
+
+import deepinstinct30 as di, pandas, numpy, datetime, collections, requests
+
+
+# Returns the records (a list or other iterable of dictionaries, or a
+# DataFrame) as a DataFrame
+def to_dataframe(records):
+    if isinstance(records, pandas.DataFrame):
+        return records
+    return pandas.DataFrame.from_records(list(records))
+
+
+# Parses ISO 8601 timestamps (which may mix formats, e.g. with and without
+# fractional seconds) as UTC datetimes. pandas 2 infers one format from the
+# first value unless format='ISO8601' is given, which pandas 1.x does not
+# support (it parses each value separately anyway).
+def _to_utc_datetime(values, errors='raise'):
+    if int(pandas.__version__.split('.')[0]) >= 2:
+        return pandas.to_datetime(values, utc=True, format='ISO8601', errors=errors)
+    return pandas.to_datetime(values, utc=True, errors=errors)
+
+
+# Returns fields as a list (accepts a single field name or a list of names)
+def _as_field_list(fields):
+    if isinstance(fields, str):
+        return [fields]
+    return list(fields)
+
+
+# Returns a dictionary of {value: count} for a single field, or
+# {(value1, value2, ...): count} for a list of fields. Keys appear in the
+# order they are first seen in the data (the same as count_data_by_field),
+# and missing values are counted under None (see StreamingCounter).
+def count_by(records, fields):
+    counter = StreamingCounter(fields)
+    counter.add(records if isinstance(records, pandas.DataFrame) else list(records))
+    return counter.result()
+
+
+# Returns a dictionary of {key: sum} with the sum of value_field for each
+# value (or tuple of values) of fields, keyed as in count_by. Missing values
+# are treated as 0. If value_field is a list, the sums are returned as
+# {key: {value_field: sum}}.
+def sum_by(records, fields, value_field):
+    counter = StreamingCounter(fields, sum_fields=value_field)
+    counter.add(records if isinstance(records, pandas.DataFrame) else list(records))
+    if isinstance(value_field, str):
+        return counter.result_sums(value_field)
+    return {key: {field: counter.sums[field][key] for field in value_field} for key in counter.counts}
+
+
+# Returns a DataFrame with the number of records per time period (plus per
+# value of fields, if provided). freq is a pandas frequency string ('D' daily,
+# 'W' weekly, 'MS' monthly, 'h' hourly). Columns are period (the pandas label
+# of the period, for example the Sunday ending the week for 'W'), the fields,
+# and count. Periods with no records are omitted.
+def count_by_period(records, timestamp_field='timestamp', freq='W', fields=None):
+    field_list = [] if fields == None else _as_field_list(fields)
+    df = to_dataframe(records)
+    if df.empty:
+        return pandas.DataFrame(columns=['period'] + field_list + ['count'])
+    df = df[[timestamp_field] + field_list].copy()
+    df[timestamp_field] = _to_utc_datetime(df[timestamp_field], errors='coerce')
+    counts = df.groupby([pandas.Grouper(key=timestamp_field, freq=freq)] + field_list, dropna=False).size()
+    counts = counts[counts > 0].reset_index(name='count')
+    counts.rename(columns={timestamp_field: 'period'}, inplace=True)
+    return counts
+
+
+# Returns the number of whole days between each record's timestamp_field and
+# now (default the current UTC time) as a NumPy array
+def days_since(records, timestamp_field, now=None):
+    df = to_dataframe(records)
+    if df.empty:
+        return numpy.array([], dtype='int64')
+    if now == None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    elapsed = pandas.Timestamp(now) - _to_utc_datetime(df[timestamp_field])
+    return elapsed.dt.days.to_numpy()
+
+
+# Returns a DataFrame (in the same order as devices) with id, event_count,
+# days_since_deployment, and weekly_event_rate for each device. event_counts
+# is a dictionary of {device_id: count} such as returned by count_by or
+# di.get_event_counts_by_device_id. The rate is the event count per 7 days
+# since the device was last registered (devices registered less than a day
+# ago are treated as registered for 1 day).
+def weekly_event_rates(devices, event_counts, now=None):
+    df = to_dataframe(devices)
+    if df.empty:
+        return pandas.DataFrame(columns=['id', 'event_count', 'days_since_deployment', 'weekly_event_rate'])
+    days = days_since(df, 'last_registration', now=now)
+    counts = df['id'].map(event_counts).fillna(0).astype('int64').to_numpy()
+    rates = numpy.where(days > 0, counts / numpy.maximum(days, 1) * 7, counts * 7)
+    return pandas.DataFrame({'id': df['id'].to_numpy(), 'event_count': counts, 'days_since_deployment': days, 'weekly_event_rate': rates})
+
+
+# Adds event_count, days_since_deployment, and weekly_event_rate fields to
+# each device dictionary (see weekly_event_rates). Returns the devices.
+def add_weekly_event_rates(devices, event_counts, now=None):
+    rates = weekly_event_rates(devices, event_counts, now=now)
+    for device, event_count, days, rate in zip(devices, rates['event_count'].tolist(), rates['days_since_deployment'].tolist(), rates['weekly_event_rate'].tolist()):
+        device['event_count'] = event_count
+        device['days_since_deployment'] = days
+        device['weekly_event_rate'] = rate
+    return devices
+
+
+# Returns value, or None if it is a missing value (NaN) from pandas
+def _none_if_missing(value):
+    return None if isinstance(value, float) and value != value else value
+
+
+# Accumulates counts (and optionally sums) as pages of records are added, so
+# results can be built from a stream without keeping the records. Each page
+# is counted and summed with pandas.factorize and numpy.bincount rather than a
+# Python loop per record. These have a fixed cost per call, so large pages
+# (thousands of records) are counted far more efficiently than small ones
+# (see count_events batch_size).
+class StreamingCounter:
+
+    def __init__(self, fields, sum_fields=None):
+        self.fields = _as_field_list(fields)
+        self.sum_fields = [] if sum_fields == None else _as_field_list(sum_fields)
+        self.counts = collections.Counter()
+        self.sums = {field: collections.Counter() for field in self.sum_fields}
+        self.record_count = 0
+        self.last_id = None  #set by count_events to allow resuming a failed crawl
+
+    # Adds a page (list of records, or a DataFrame) of records. Missing values
+    # are counted under None, and are treated as 0 in sums.
+    def add(self, records):
+        if len(records) == 0:
+            return
+        if isinstance(records, pandas.DataFrame):
+            columns = {field: records[field].tolist() if field in records else [None] * len(records) for field in self.fields + self.sum_fields}
+        else:
+            columns = {field: [record.get(field) for record in records] for field in self.fields + self.sum_fields}
+        #number the distinct values of each field (factorize gives missing
+        #values -1), and combine them into one key number per record. The
+        #combined numbers are renumbered after each field, so they stay below
+        #the number of records however many fields and distinct values there
+        #are. Then bincount counts and sums the records per key number.
+        codes = numpy.zeros(len(records), dtype='int64')
+        for field in self.fields:
+            field_codes, values = pandas.factorize(pandas.Series(columns[field], dtype=object))
+            field_codes[field_codes == -1] = len(values)
+            codes = pandas.factorize(codes * (len(values) + 1) + field_codes)[0]
+        #each key is taken from the first record with that key number
+        first_positions = numpy.unique(codes, return_index=True)[1].tolist()
+        if len(self.fields) == 1:
+            keys = [_none_if_missing(columns[self.fields[0]][position]) for position in first_positions]
+        else:
+            keys = [tuple(_none_if_missing(columns[field][position]) for field in self.fields) for position in first_positions]
+        for key, count in zip(keys, numpy.bincount(codes, minlength=len(keys)).tolist()):
+            self.counts[key] += count
+        for field in self.sum_fields:
+            values = numpy.nan_to_num(numpy.array(columns[field], dtype='float64'))
+            integral = bool((values % 1 == 0).all())
+            for key, value in zip(keys, numpy.bincount(codes, weights=values, minlength=len(keys)).tolist()):
+                self.sums[field][key] += int(value) if integral else value
+        self.record_count += len(records)
+
+    # Returns the counts as a dictionary. If fields is provided (a subset of
+    # the fields being counted), the counts are rolled up to those fields.
+    def result(self, fields=None):
+        return self._roll_up(self.counts, fields)
+
+    # Returns the sums of sum_field as a dictionary, optionally rolled up
+    def result_sums(self, sum_field, fields=None):
+        return self._roll_up(self.sums[sum_field], fields)
+
+    def _roll_up(self, counter, fields):
+        if fields == None or _as_field_list(fields) == self.fields:
+            return dict(counter)
+        if len(self.fields) == 1:
+            raise ValueError(f'Can not roll up counts by {fields}; counting by {self.fields}')
+        positions = [self.fields.index(field) for field in _as_field_list(fields)]
+        rolled_up = collections.Counter()
+        for key, value in counter.items():
+            if len(positions) == 1:
+                rolled_up[key[positions[0]]] += value
+            else:
+                rolled_up[tuple(key[position] for position in positions)] += value
+        return dict(rolled_up)
+
+    # Returns the counts (and sums) as a DataFrame with one column per field
+    def to_dataframe(self):
+        keys = list(self.counts.keys())
+        if len(self.fields) == 1:
+            df = pandas.DataFrame({self.fields[0]: keys})
+        else:
+            df = pandas.DataFrame.from_records(keys, columns=self.fields)
+        df['count'] = [self.counts[key] for key in keys]
+        for field in self.sum_fields:
+            df[f'{field}_sum'] = [self.sums[field][key] for key in keys]
+        return df
+
+
+# Streams events from the server (see di.iter_events) and counts them by
+# fields, without holding the events in memory. The server returns 50 events
+# per page, so pages are buffered and counted batch_size events at a time.
+# Returns a StreamingCounter. If the crawl fails part way, the counts so far
+# are returned and counter.last_id holds the last event id counted, which can
+# be passed as minimum_event_id to a new counter to pick up where it stopped.
+def count_events(fields='device_id', search={}, minimum_event_id=0, suspicious=False, sum_fields=None, batch_size=10000):
+    counter = StreamingCounter(fields, sum_fields=sum_fields)
+    counter.last_id = minimum_event_id
+    batch = []
+    batch_last_id = minimum_event_id
+    try:
+        for page in di.iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious, yield_pages=True):
+            batch.extend(page['events'])
+            batch_last_id = page['last_id']
+            if len(batch) >= batch_size:
+                counter.add(batch)
+                counter.last_id = batch_last_id
+                batch = []
+    except requests.HTTPError as e:
+        print('ERROR:', e)
+        print('WARNING: Counts are partial. Resume with minimum_event_id', batch_last_id)
+    counter.add(batch)
+    counter.last_id = batch_last_id
+    return counter
@@ -0,0 +1,595 @@
+# Deep Instinct v3.0 REST API Wrapper (asyncio version)
+#
+# Compatibility:
+# -Deep Instinct D-Appliance versions 3.0.x, 3.1.x, and 3.2.x
+# -Requires Python 3.7 or later and the aiohttp library
+#
+# Suggested Usage:
+# 1. Save this file as deepinstinct30_async.py in the same directory as your code
+#    and deepinstinct30.py (which it shares URL building with)
+# 2. Include "import deepinstinct30_async as di" at the top of your code
+# 3. Set/modify the DI server name like this: di.fqdn = 'SERVER-NAME'
+# 4. Set/modify the DI REST API key like this: di.key = 'API-KEY'
+# 5. Await the REST API methods from a coroutine like this:
+#    device = await di.get_device(device_id)
+#    or run many at once like this:
+#    devices = await asyncio.gather(*[di.get_device(i) for i in device_ids])
+# 6. Call 'await di.close_session()' before the event loop is closed
+#
+# The methods below mirror those of the same name in deepinstinct30.py (same
+# URLs, parameters, and return values), but do not block the event loop. All
+# requests share one connection pool, and the number of requests in flight at
+# any one time is limited by max_concurrency.
+#
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. This API
+# Wrapper is not a Deep Instinct commercial product and is not officially
+# supported, although the underlying REST API is. This means that to report an
+# issue to tech support you must remove the API Wrapper layer and recreate the
+# problem against the raw/pure DI REST API.
+#
+
+fqdn = 'SERVER-NAME'
+key = 'API-KEY'
+
+# URL scheme used to reach the server. Change to 'http' only to test against
+# a local mock server (see mock_dappliance.py).
+protocol = 'https'
+
+# Maximum number of requests in flight at once, and maximum number of pooled
+# connections to the server
+max_concurrency = 20
+pool_size = 20
+
+# Optional ssl.SSLContext to use for connections (for example one which trusts
+# a private CA). None means default certificate verification.
+ssl_context = None
+
+# Client-side rate limit shared by all requests, enforced with a token bucket.
+# None disables the limit. rate_limit_burst is the number of requests which
+# may be sent back-to-back before the limit applies.
+requests_per_second = None
+rate_limit_burst = 1
+
+# Requests which receive one of retry_status_codes are retried up to
+# retry_attempts times with exponential backoff and jitter (starting at
+# retry_base_wait seconds, capped at retry_max_wait). A Retry-After header
+# returned by the server takes precedence over the calculated wait. Requests
+# which are not safe to repeat (the create_* methods) are only retried on
+# non_idempotent_retry_status_codes, since a 502/504 may be returned after the
+# server has already created the object.
+retry_status_codes = (429, 502, 503, 504)
+non_idempotent_retry_status_codes = (429, 503)
+retry_attempts = 5
+retry_base_wait = 0.5
+retry_max_wait = 30
+
+# Wait (in seconds) before retrying a failed page request in get_devices. The
+# wait doubles after each consecutive failure, up to device_retry_max_wait.
+device_retry_wait = 1
+device_retry_max_wait = 60
+
+# Import various libraries used by one or more method below.
+import asyncio, aiohttp, random, datetime, email.utils
+from deepinstinct30 import _event_search_url as _shared_event_search_url
+#If any of the above throw import errors, try running 'pip install library_name'
+
+_session = None
+_semaphore = None
+_session_config = None
+
+
+# Returns the shared HTTP session, (re)building it if the event loop, server,
+# API key, or pool settings have changed since it was created
+async def get_session():
+    global _session, _semaphore, _session_config
+    config = (asyncio.get_running_loop(), fqdn, key, max_concurrency, pool_size, ssl_context)
+    if _session is None or _session.closed or _session_config != config:
+        if _session is not None and not _session.closed and _session_config[0] is config[0]:
+            await _session.close()
+        connector = aiohttp.TCPConnector(limit=pool_size, ssl=ssl_context if ssl_context is not None else True)
+        _session = aiohttp.ClientSession(connector=connector, headers={'accept': 'application/json', 'Authorization': key})
+        _semaphore = asyncio.Semaphore(max_concurrency)
+        _session_config = config
+    return _session
+
+
+# Closes the shared HTTP session
+async def close_session():
+    global _session, _semaphore, _session_config
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _semaphore = None
+    _session_config = None
+
+
+_rate_limit_tokens = None
+_rate_limit_timestamp = None
+
+
+# Waits until the token bucket allows another request to be sent. Each caller
+# reserves a token immediately (the bucket may go negative) and then sleeps
+# until that token would have been available.
+async def _wait_for_rate_limit():
+    global _rate_limit_tokens, _rate_limit_timestamp
+    if requests_per_second == None:
+        return
+    capacity = max(1, rate_limit_burst)
+    now = asyncio.get_running_loop().time()
+    if _rate_limit_tokens == None:
+        _rate_limit_tokens = capacity
+    else:
+        _rate_limit_tokens = min(capacity, _rate_limit_tokens + (now - _rate_limit_timestamp) * requests_per_second)
+    _rate_limit_timestamp = now
+    _rate_limit_tokens -= 1
+    if _rate_limit_tokens < 0:
+        await asyncio.sleep(-_rate_limit_tokens / requests_per_second)
+
+
+# Calculates how long to wait before retry number attempt (starting at 1),
+# honouring a Retry-After header (in seconds or as an HTTP date) if present
+def _calculate_retry_wait(response, attempt):
+    retry_after = response.headers.get('Retry-After')
+    if retry_after != None:
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    #exponential backoff with full jitter
+    return random.uniform(0, min(retry_max_wait, retry_base_wait * 2 ** (attempt - 1)))
+
+
+# Sends a request to the server using the shared session, applying the rate
+# limit and retry settings above. Returns a tuple of (status_code, parsed JSON
+# response body or None if the body is empty). Pass idempotent=False for
+# requests which must not be repeated after a 502/504.
+async def _request(method, request_url, json=None, idempotent=True):
+    status_codes = retry_status_codes if idempotent else [code for code in retry_status_codes if code in non_idempotent_retry_status_codes]
+    session = await get_session()
+    attempt = 0
+    while True:
+        await _wait_for_rate_limit()
+        async with _semaphore:
+            async with session.request(method, request_url, json=json) as response:
+                body = await response.read()
+                if response.status not in status_codes or attempt >= retry_attempts:
+                    if len(body) > 0 and response.status == 200:
+                        return response.status, await response.json(content_type=None)
+                    return response.status, None
+                attempt += 1
+                wait = _calculate_retry_wait(response, attempt)
+        #sleep outside the semaphore so other requests can proceed meanwhile
+        await asyncio.sleep(wait)
+
+
+# Returns a list of all visible Devices
+async def get_devices(include_deactivated=True):
+    last_id = 0
+    collected_devices = []
+    error_count = 0
+    consecutive_error_count = 0
+    while last_id != None and error_count < 10:
+        request_url = f'{protocol}://{fqdn}/api/v1/devices?after_device_id={last_id}'
+        status_code, response = await _request('GET', request_url)
+        if status_code == 200:
+            consecutive_error_count = 0
+            last_id = response.get('last_id')
+            for device in response.get('devices', []):
+                if device['license_status'] == 'ACTIVATED' or include_deactivated:
+                    collected_devices.append(device)
+        else:
+            print('WARNING: Unexpected return code', status_code, 'on request to\n', request_url)
+            error_count += 1
+            consecutive_error_count += 1
+            await asyncio.sleep(min(device_retry_max_wait, device_retry_wait * 2 ** (consecutive_error_count - 1)))
+    return collected_devices
+
+
+#Gets a single device
+async def get_device(device_id):
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}'
+    status_code, device = await _request('GET', request_url)
+    if status_code == 200:
+        return device
+    else:
+        return None
+
+
+# Calculates the URL of the event search method for a given cursor position
+# (the same URL building as deepinstinct30, using this module's settings)
+def _event_search_url(after_event_id, suspicious=False):
+    return _shared_event_search_url(after_event_id, suspicious, server_protocol=protocol, server_fqdn=fqdn)
+
+
+# Raised by iter_events when the server returns an unexpected return code
+# (after retries). status holds the return code and message a description.
+class UnexpectedResponseError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Async generator which yields events matching specified search parameters
+# and/or minimum event id as each page is returned by the server. With
+# yield_pages=True each item is a dictionary {'events': [...], 'last_id': N}.
+# Raises UnexpectedResponseError on an unexpected return code.
+async def iter_events(search={}, minimum_event_id=0, suspicious=False, yield_pages=False):
+    while minimum_event_id != None:
+        request_url = _event_search_url(minimum_event_id, suspicious)
+        status_code, response = await _request('POST', request_url, json=search)
+        if status_code != 200:
+            raise UnexpectedResponseError(status_code, f'Unexpected return code {status_code} on POST to {request_url}')
+        minimum_event_id = response['last_id']
+        if minimum_event_id != None:
+            if yield_pages:
+                yield {'events': response['events'], 'last_id': minimum_event_id}
+            else:
+                for event in response['events']:
+                    yield event
+
+
+# Return a list of events matching specified search parameters and/or minimum
+# event id. If neither are provided, all visible events are returned. In case
+# of error (after retries), the events collected before the error are returned
+# and the minimum_event_id to resume from is printed.
+async def get_events(search={}, minimum_event_id=0, suspicious=False):
+    collected_events = []
+    try:
+        async for page in iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious, yield_pages=True):
+            collected_events.extend(page['events'])
+            minimum_event_id = page['last_id']
+    #in case of error, keep the events collected so far
+    except UnexpectedResponseError as e:
+        print('ERROR:', e.message, '- returning the', len(collected_events), 'events collected before the error. To resume, use minimum_event_id', minimum_event_id)
+    return collected_events
+
+
+# Return a list of suspicious events matching specified search parameters
+# and/or minimum event id
+async def get_suspicious_events(search={}, minimum_event_id=0):
+    return await get_events(suspicious=True, search=search, minimum_event_id=minimum_event_id)
+
+
+# Gets a single event
+async def get_event(event_id, suspicious=False):
+    if suspicious:
+        request_url = f'{protocol}://{fqdn}/api/v1/suspicious-events/{str(event_id)}'
+    else:
+        request_url = f'{protocol}://{fqdn}/api/v1/events/{str(event_id)}'
+    status_code, response = await _request('GET', request_url)
+    if status_code == 200:
+        return response['event']
+    elif status_code == 404:
+        print('ERROR: Event', str(event_id), 'not found')
+        return []
+    else:
+        print('ERROR: Unexpected return code', str(status_code), 'on request to', request_url)
+        return []
+
+
+# Allow-list and deny-list methods appended to policy data by get_policies,
+# as (URL suffix, field name in returned policy) pairs
+_allow_deny_list_fields = [
+    ('allow-list/hashes', 'allow_list_static_analysis_hashes'),
+    ('allow-list/paths', 'allow_list_static_analysis_paths'),
+    ('allow-list/certificates', 'allow_list_static_analysis_certificates'),
+    ('allow-list/process_paths', 'allow_list_behavioral_analysis_process_paths'),
+    ('allow-list/scripts', 'allow_list_script_control'),
+    ('deny-list/hashes', 'deny_list_static_analysis_hashes'),
+    ]
+
+
+# Collect and return list of Device Policies, optionally including policy data
+# and allow/deny lists (fetched concurrently)
+async def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL'):
+    request_url = f'{protocol}://{fqdn}/api/v1/policies/'
+    status_code, policies = await _request('GET', request_url)
+
+    if msp_id != 'ALL':
+        policies = [policy for policy in policies if policy['msp_id'] == msp_id]
+
+    # Each entry is (policy, URL suffix, field name); a field name of None
+    # means the response is policy data to be merged into the policy.
+    detail_requests = []
+    for policy in policies:
+        if include_policy_data:
+            detail_requests.append((policy, 'data', None))
+        if include_allow_deny_lists:
+            for url_suffix, field_name in _allow_deny_list_fields:
+                detail_requests.append((policy, url_suffix, field_name))
+
+    results = await asyncio.gather(*[_request('GET', f'{protocol}://{fqdn}/api/v1/policies/{policy["id"]}/{url_suffix}') for policy, url_suffix, field_name in detail_requests])
+
+    for (policy, url_suffix, field_name), (status_code, detail) in zip(detail_requests, results):
+        if status_code != 200:
+            continue
+        if field_name == None:
+            if keep_data_encapsulated:
+                policy.update(detail)
+            else:
+                policy.update(detail['data'])
+        else:
+            policy[field_name] = detail['items']
+
+    return policies
+
+
+#Return a list of all visible Device Groups
+async def get_groups(exclude_default_groups=False):
+    request_url = f'{protocol}://{fqdn}/api/v1/groups/'
+    status_code, groups = await _request('GET', request_url)
+    if status_code == 200:
+        if exclude_default_groups:
+            groups = [group for group in groups if not group['is_default_group']]
+        return groups
+    else:
+        return []
+
+
+# Translate a Device Group name into a Device Group ID
+async def get_group_id(group_name, exclude_default_groups=False):
+    for group in await get_groups(exclude_default_groups=exclude_default_groups):
+        if group['name'].lower() == group_name.lower():  #case-insensitive
+            return group['id']
+    return None
+
+
+# Adds a list of Devices to a Device Group
+async def add_devices_to_group(device_ids, group_id, remove=False):
+    if remove:
+        request_url = f'{protocol}://{fqdn}/api/v1/groups/{group_id}/remove-devices'
+    else:
+        request_url = f'{protocol}://{fqdn}/api/v1/groups/{group_id}/add-devices'
+    status_code, response = await _request('POST', request_url, json={'devices': device_ids})
+    if status_code == 204:
+        if remove:
+            return str(len(device_ids)) + ' devices removed from group ' + str(group_id)
+        else:
+            return str(len(device_ids)) + ' devices added to group ' + str(group_id)
+    else:
+        return None
+
+
+# Removes a list of Devices from a Device Group
+async def remove_devices_from_group(device_ids, group_id):
+    return await add_devices_to_group(device_ids=device_ids, group_id=group_id, remove=True)
+
+
+# Returns a list of all visible Tenants
+async def get_tenants():
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/'
+    status_code, response = await _request('GET', request_url)
+    if status_code == 200:
+        return response['tenants']
+    else:
+        return {'tenants': []}
+
+
+# Returns a list of all MSPs on the server
+async def get_msps():
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
+    status_code, response = await _request('GET', request_url)
+    if status_code == 200:
+        return response['msps']
+    else:
+        return {'msps': []}
+
+
+# Translate an MSP name into an MSP ID (0 if not found)
+async def get_msp_id(msp_name):
+    msp_id = 0
+    for msp in await get_msps():
+        if msp['name'] == msp_name:
+            msp_id = msp['id']
+    return msp_id
+
+
+# Create a new MSP
+async def create_msp(msp_name, license_limit):
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/'
+    status_code, response = await _request('POST', request_url, json={'name': msp_name, 'license_limit': license_limit}, idempotent=False)
+    if status_code == 200:
+        return response
+    elif status_code == 409:
+        return 'ERROR: MSP name already exists'
+    elif status_code == 401:
+        return 'ERROR: Unauthorized'
+    elif status_code == 400:
+        return 'ERROR: Insufficient Licenses'
+    else:
+        return 'ERROR: Unexpected return code '+ str(status_code)
+
+
+# Delete an MSP based on provided name
+async def delete_msp(msp_name):
+    msp_id = None
+    for msp in await get_msps():
+        if msp['name'].lower() == msp_name.lower():
+            msp_id = msp['id']
+    if msp_id == None:
+        return 'No match found for provided msp_name ' + msp_name
+
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
+    status_code, response = await _request('DELETE', request_url)
+    if status_code == 204:
+        return 'MSP ' + str(msp_id) + ' ' + msp_name + ' was deleted'
+    elif status_code == 409:
+        return 'MSP ' + str(msp_id) + ' ' + msp_name + ' cannot be deleted because active devices still exist'
+    elif status_code == 404:
+        return 'MSP ' + str(msp_id) + ' ' + msp_name + ' was not found'
+    elif status_code == 403:
+        return 'MSP ' + str(msp_id) + ' ' + msp_name + ' cannot be deleted because only Hub-Admin can delete MSPs'
+    else:
+        return 'ERROR: Unexpected return code ' + str(status_code)
+
+
+# Create a new Tenant in the named MSP, returning the new tenant
+async def create_tenant(tenant_name, license_limit, msp_name):
+    msp_id = await get_msp_id(msp_name)
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/'
+    payload = {'msp_id': msp_id, 'name': tenant_name, 'license_limit': license_limit}
+    status_code, response = await _request('POST', request_url, json=payload, idempotent=False)
+    if status_code == 200:
+        for tenant in await get_tenants():
+            if tenant['name'] == tenant_name and tenant['msp_id'] == msp_id:
+                tenant['msp_name'] = msp_name
+                return tenant
+    else:
+        return None
+
+
+# Delete the named Tenant from the named MSP
+async def delete_tenant(tenant_name, msp_name):
+    msp_id = await get_msp_id(msp_name)
+    tenant_id = 0
+    for tenant in await get_tenants():
+        if tenant['msp_id'] == msp_id and tenant['name'] == tenant_name:
+            tenant_id = tenant['id']
+
+    request_url = f'{protocol}://{fqdn}/api/v1/multitenancy/tenant/{tenant_id}'
+    status_code, response = await _request('DELETE', request_url)
+    if status_code == 204:
+        print('INFO: Tenant', tenant_name, 'was deleted from MSP', msp_name)
+        return True
+    elif status_code == 403:
+        print('ERROR: Only Hub-Admin or MSP-Admin can delete tenants')
+        return False
+    elif status_code == 404:
+        print('ERROR: Tenant not found')
+        return False
+    elif status_code == 409:
+        print('ERROR: Tried to delete a tenant but active devices still exist!')
+        return False
+
+
+#Archives (hides from GUI and API) a list of devices
+async def archive_devices(device_ids, unarchive=False):
+    if unarchive:
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/unarchive'
+    else:
+        request_url = f'{protocol}://{fqdn}/api/v1/devices/actions/archive'
+    status_code, response = await _request('POST', request_url, json={'ids': device_ids})
+    return status_code == 200
+
+
+# Unarchives (unhides from GUI and API) a list of devices
+async def unarchive_devices(device_ids):
+    return await archive_devices(device_ids=device_ids, unarchive=True)
+
+
+# Sends a device action (remove, disable, enable) and returns True if the
+# server returned the expected return code
+async def _device_action(device, device_id_only, action):
+    if device_id_only:
+        device_id = device
+    else:
+        device_id = device['id']
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/{action}'
+    status_code, response = await _request('POST', request_url)
+    return status_code == 204
+
+
+# Remotely uninstall a device
+async def remove_device(device, device_id_only=False):
+    if await _device_action(device, device_id_only, 'remove'):
+        print('INFO: Successfully removed device', device)
+        return True
+    else:
+        print('INFO: Failed to remove device', device)
+        return False
+
+
+# Disable scanning and enforcement on a device
+async def disable_device(device, device_id_only=False):
+    if await _device_action(device, device_id_only, 'disable'):
+        print('INFO: Successfully set device', device, 'to be disabled')
+        return True
+    else:
+        print('INFO: Failed to disable device', device)
+        return False
+
+
+# Enable scanning and enforcement on a device
+async def enable_device(device, device_id_only=False):
+    if await _device_action(device, device_id_only, 'enable'):
+        print('INFO: Successfully set device', device, 'to be enabled')
+        return True
+    else:
+        print('INFO: Failed to enable device', device)
+        return False
+
+
+# Request a device to upload its agent logs
+async def request_agent_logs(device_id, device_id_only=True):
+    if not device_id_only:
+        device_id = device_id['id']
+    request_url = f'{protocol}://{fqdn}/api/v1/devices/{device_id}/actions/upload-logs'
+    status_code, response = await _request('POST', request_url)
+    if status_code == 204:
+        print('INFO: Device', device_id, 'set to upload logs')
+        return True
+    elif status_code == 403:
+        print('WARN: Device', device_id, 'does not belong to connector’s msp')
+        return False
+    elif status_code == 404:
+        print('WARN: Device', device_id, 'not found')
+        return False
+    else:
+        print('ERROR: Unexpected return code', status_code, 'on POST to', request_url)
+        return False
+
+
+# Close (or with open=True, re-open) a list of events
+async def close_events(event_id_list, open=False):
+    if open:
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/open'
+    else:
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/close'
+    status_code, response = await _request('POST', request_url, json={'ids': event_id_list})
+    if status_code == 204:
+        if open:
+            print('INFO:', len(event_id_list), 'events were opened')
+        else:
+            print('INFO:', len(event_id_list), 'events were closed')
+        return True
+    else:
+        print('ERROR: Unexpected return code', status_code, 'on POST to', request_url)
+        return False
+
+
+# Re-open a list of events
+async def open_events(event_id_list):
+    return await close_events(event_id_list=event_id_list, open=True)
+
+
+# Archive (or with unarchive=True, unarchive) a list of events
+async def archive_events(event_id_list, unarchive=False):
+    if unarchive:
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/unarchive'
+    else:
+        request_url = f'{protocol}://{fqdn}/api/v1/events/actions/archive'
+    status_code, response = await _request('POST', request_url, json={'ids': event_id_list})
+    if status_code == 204:
+        if unarchive:
+            print('INFO: Successfully unarchived up to ', len(event_id_list), 'events')
+        else:
+            print('INFO: Successfully archived up to ', len(event_id_list), 'events')
+        return True
+    else:
+        print('ERROR: Unexpected return code', status_code, 'on POST to', request_url)
+        return False
+
+
+# Unarchive a list of events
+async def unarchive_events(event_id_list):
+    return await archive_events(event_id_list=event_id_list, unarchive=True)
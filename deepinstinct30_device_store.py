@@ -0,0 +1,200 @@
+# Deep Instinct v3.0 Device Store
+#
+# Keeps a local SQLite snapshot of the device list from a D-Appliance so that
+# scripts can query devices locally (in milliseconds) instead of crawling the
+# full device list from the server on every run, and can ask which devices
+# were added, removed, or changed since a given time.
+#
+# Suggested Usage:
+# 1. Save this file in the same directory as deepinstinct30.py and your code
+# 2. Include "import deepinstinct30 as di, deepinstinct30_device_store as store"
+# 3. Set di.fqdn and di.key as usual
+# 4. Call store.sync_devices() to refresh the snapshot from the server (for
+#    example on a schedule). It returns the added/removed/changed devices.
+# 5. Query the snapshot with store.get_devices(), store.get_device(id), and
+#    store.get_changes_since(timestamp) without contacting the server.
+#
+# By default the database is stored as device_store.sqlite in the export
+# folder for the server (see di.create_export_folder). Pass database_path to
+# any method to use a different file.
+#
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. This is not a
+# Deep Instinct commercial product and is not officially supported.
+#
+
+# Device fields which are ignored when deciding whether a device has changed.
+# They are still updated in the snapshot, but a change to only these fields
+# is not recorded as a change (last_contact is updated constantly by every
+# online device).
+ignored_fields = ['last_contact']
+
+import deepinstinct30 as di, sqlite3, json, datetime
+
+
+# Returns the default database path for the current server
+def _default_database_path():
+    return f'{di.create_export_folder()}/device_store.sqlite'
+
+
+# Opens the database, creating the tables if needed
+def _connect(database_path=None):
+    if database_path == None:
+        database_path = _default_database_path()
+    connection = sqlite3.connect(database_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            first_seen TEXT NOT NULL,
+            last_changed TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            removed TEXT);
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            change TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS changes_by_timestamp ON changes (timestamp);
+        CREATE TABLE IF NOT EXISTS syncs (
+            timestamp TEXT PRIMARY KEY,
+            device_count INTEGER NOT NULL,
+            added INTEGER NOT NULL,
+            removed INTEGER NOT NULL,
+            changed INTEGER NOT NULL);
+        ''')
+    return connection
+
+
+# Returns the current UTC time in the format stored in the database
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+# Converts a datetime (naive values are assumed to be UTC) or string to the
+# format stored in the database, so timestamps compare correctly as text
+def _format_timestamp(timestamp):
+    if isinstance(timestamp, datetime.datetime):
+        if timestamp.tzinfo != None:
+            timestamp = timestamp.astimezone(datetime.timezone.utc)
+        return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return timestamp
+
+
+# Returns the part of a device used to detect changes
+def _comparable(device):
+    return {field: value for field, value in device.items() if field not in ignored_fields}
+
+
+# Refreshes the snapshot from the server. Devices are compared page by page
+# as they are returned, and the differences are recorded with a timestamp.
+# Devices no longer returned by the server are marked as removed. If the crawl
+# fails part way, nothing is written. Returns a dictionary with the sync
+# timestamp and lists of added, removed, and changed devices.
+def sync_devices(database_path=None, prefetch=True):
+    timestamp = _now()
+    added = []
+    changed = []
+    removed = []
+    seen_ids = set()
+
+    connection = _connect(database_path)
+    try:
+        with connection:
+            for device in di.iter_devices(include_deactivated=True, prefetch=prefetch):
+                seen_ids.add(device['id'])
+                data = json.dumps(device, sort_keys=True)
+                row = connection.execute('SELECT data, removed FROM devices WHERE id = ?', (device['id'],)).fetchone()
+
+                if row == None or row['removed'] != None:
+                    added.append(device)
+                    connection.execute('INSERT OR REPLACE INTO devices (id, data, first_seen, last_changed, last_seen, removed) VALUES (?, ?, ?, ?, ?, NULL)',
+                        (device['id'], data, timestamp, timestamp, timestamp))
+                    connection.execute('INSERT INTO changes (device_id, change, timestamp, data) VALUES (?, ?, ?, ?)', (device['id'], 'added', timestamp, data))
+
+                elif _comparable(json.loads(row['data'])) != _comparable(device):
+                    changed.append(device)
+                    connection.execute('UPDATE devices SET data = ?, last_changed = ?, last_seen = ? WHERE id = ?', (data, timestamp, timestamp, device['id']))
+                    connection.execute('INSERT INTO changes (device_id, change, timestamp, data) VALUES (?, ?, ?, ?)', (device['id'], 'changed', timestamp, data))
+
+                else:
+                    connection.execute('UPDATE devices SET data = ?, last_seen = ? WHERE id = ?', (data, timestamp, device['id']))
+
+            #anything in the snapshot which the server no longer returned was removed
+            for row in connection.execute('SELECT id, data FROM devices WHERE removed IS NULL').fetchall():
+                if row['id'] not in seen_ids:
+                    removed.append(json.loads(row['data']))
+                    connection.execute('UPDATE devices SET removed = ?, last_changed = ? WHERE id = ?', (timestamp, timestamp, row['id']))
+                    connection.execute('INSERT INTO changes (device_id, change, timestamp, data) VALUES (?, ?, ?, ?)', (row['id'], 'removed', timestamp, row['data']))
+
+            connection.execute('INSERT INTO syncs (timestamp, device_count, added, removed, changed) VALUES (?, ?, ?, ?, ?)',
+                (timestamp, len(seen_ids), len(added), len(removed), len(changed)))
+    finally:
+        connection.close()
+
+    print('INFO: Device store synced at', timestamp + ':', len(seen_ids), 'devices,', len(added), 'added,', len(removed), 'removed,', len(changed), 'changed')
+    return {'timestamp': timestamp, 'added': added, 'removed': removed, 'changed': changed}
+
+
+# Returns the timestamp of the last successful sync, or None if never synced
+def get_last_sync_timestamp(database_path=None):
+    connection = _connect(database_path)
+    try:
+        row = connection.execute('SELECT MAX(timestamp) FROM syncs').fetchone()
+        return row[0]
+    finally:
+        connection.close()
+
+
+# Returns the devices in the snapshot (same format as di.get_devices). Devices
+# which have been removed from the server are not included.
+def get_devices(include_deactivated=True, database_path=None):
+    connection = _connect(database_path)
+    try:
+        devices = [json.loads(row['data']) for row in connection.execute('SELECT data FROM devices WHERE removed IS NULL ORDER BY id')]
+    finally:
+        connection.close()
+    if not include_deactivated:
+        devices = [device for device in devices if device['license_status'] == 'ACTIVATED']
+    return devices
+
+
+# Returns a single device from the snapshot, or None if not found
+def get_device(device_id, database_path=None):
+    connection = _connect(database_path)
+    try:
+        row = connection.execute('SELECT data FROM devices WHERE id = ? AND removed IS NULL', (device_id,)).fetchone()
+    finally:
+        connection.close()
+    if row == None:
+        return None
+    return json.loads(row['data'])
+
+
+# Returns the changes recorded after the provided timestamp (a datetime or a
+# string in the format returned by sync_devices), oldest first. Each change is
+# a dictionary with device_id, change (added | changed | removed), timestamp,
+# and the device data as of that change.
+def get_changes_since(timestamp, database_path=None):
+    connection = _connect(database_path)
+    try:
+        rows = connection.execute('SELECT device_id, change, timestamp, data FROM changes WHERE timestamp > ? ORDER BY id', (_format_timestamp(timestamp),)).fetchall()
+    finally:
+        connection.close()
+    return [{'device_id': row['device_id'], 'change': row['change'], 'timestamp': row['timestamp'], 'device': json.loads(row['data'])} for row in rows]
+
+
+# Returns the current data of devices added or changed after the provided
+# timestamp (removed devices are available from get_changes_since)
+def get_devices_changed_since(timestamp, database_path=None):
+    connection = _connect(database_path)
+    try:
+        rows = connection.execute('SELECT data FROM devices WHERE removed IS NULL AND last_changed > ? ORDER BY id', (_format_timestamp(timestamp),)).fetchall()
+    finally:
+        connection.close()
+    return [json.loads(row['data']) for row in rows]
@@ -0,0 +1,183 @@
+# Deep Instinct v3.0 Inventory
+#
+# Holds devices, policies, groups, tenants, and MSPs in memory with hash
+# indexes on the fields scripts commonly join on (id, hostname, group_id,
+# policy_id, tenant_id, msp_id), so that enriching one list with data from
+# another is a dictionary lookup per record instead of a nested loop over
+# both lists.
+#
+# Suggested Usage:
+# 1. Save this file in the same directory as deepinstinct30.py and your code
+# 2. Include "import deepinstinct30 as di" and
+#    "from deepinstinct30_inventory import Inventory"
+# 3. Set di.fqdn and di.key as usual
+# 4. Build the inventory from the server with Inventory.load(...), or from
+#    lists you already have with Inventory(devices=..., policies=..., ...)
+# 5. Use the lookups (inventory.policy(id), inventory.devices_in_group(id),
+#    ...) and the join/group_by/count_by helpers
+#
+# Example (add each device's policy name, then count devices per tenant):
+#     inventory = Inventory.load(include_policy_data=True)
+#     inventory.join(inventory.devices, 'policy_id', 'policies', {'name': 'policy_name'})
+#     device_counts = inventory.count_by(inventory.devices, 'tenant_id')
+#
+# The indexes are built once when the inventory is created and hold
+# references to the same dictionaries as the lists, so fields added to a
+# record later are visible through the indexes. Create a new inventory if the
+# lists themselves change.
+#
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. This is not a
+# Deep Instinct commercial product and is not officially supported.
+#
+
+import deepinstinct30 as di
+
+
+# Returns the data as a list (some wrapper methods return a dictionary
+# instead of an empty list on error)
+def _as_list(data):
+    if isinstance(data, list):
+        return data
+    return []
+
+
+# Returns a dictionary of {record[field]: record}. Records without the field
+# are skipped.
+def index_by(records, field):
+    index = {}
+    for record in records:
+        if field in record:
+            index[record[field]] = record
+    return index
+
+
+# Returns a dictionary of {record[field]: [records]}, with the records in each
+# list in their original order. Records without the field are skipped.
+def group_by(records, field):
+    groups = {}
+    for record in records:
+        if field in record:
+            groups.setdefault(record[field], []).append(record)
+    return groups
+
+
+# Returns a dictionary of {record[field]: number of records}
+def count_by(records, field):
+    counts = {}
+    for record in records:
+        if field in record:
+            counts[record[field]] = counts.get(record[field], 0) + 1
+    return counts
+
+
+class Inventory:
+
+    def __init__(self, devices=None, policies=None, groups=None, tenants=None, msps=None):
+        self.devices = _as_list(devices)
+        self.policies = _as_list(policies)
+        self.groups = _as_list(groups)
+        self.tenants = _as_list(tenants)
+        self.msps = _as_list(msps)
+
+        self.devices_by_id = index_by(self.devices, 'id')
+        self.devices_by_hostname = group_by(self.devices, 'hostname') #hostnames are not guaranteed unique
+        self.devices_by_group_id = group_by(self.devices, 'group_id')
+        self.devices_by_policy_id = group_by(self.devices, 'policy_id')
+        self.devices_by_tenant_id = group_by(self.devices, 'tenant_id')
+        self.devices_by_msp_id = group_by(self.devices, 'msp_id')
+        self.policies_by_id = index_by(self.policies, 'id')
+        self.policies_by_msp_id = group_by(self.policies, 'msp_id')
+        self.groups_by_id = index_by(self.groups, 'id')
+        self.groups_by_policy_id = group_by(self.groups, 'policy_id')
+        self.groups_by_msp_id = group_by(self.groups, 'msp_id')
+        self.tenants_by_id = index_by(self.tenants, 'id')
+        self.tenants_by_msp_id = group_by(self.tenants, 'msp_id')
+        self.msps_by_id = index_by(self.msps, 'id')
+
+        #tables which can be referenced by name in join
+        self._tables = {'devices': self.devices_by_id, 'policies': self.policies_by_id, 'groups': self.groups_by_id,
+                        'tenants': self.tenants_by_id, 'msps': self.msps_by_id}
+
+    # Builds an inventory from the server configured in deepinstinct30. Only
+    # the requested data is collected.
+    @classmethod
+    def load(cls, include_deactivated=False, include_policy_data=False, include_groups=True, include_tenants=False, include_msps=False):
+        print('INFO: Building inventory from', di.fqdn)
+        devices = di.get_devices(include_deactivated=include_deactivated)
+        policies = di.get_policies(include_policy_data=include_policy_data)
+        groups = di.get_groups() if include_groups else None
+        tenants = di.get_tenants() if include_tenants else None
+        msps = di.get_msps() if include_msps else None
+        return cls(devices=devices, policies=policies, groups=groups, tenants=tenants, msps=msps)
+
+    # Single record lookups (None if not found)
+    def device(self, device_id):
+        return self.devices_by_id.get(device_id)
+
+    def policy(self, policy_id):
+        return self.policies_by_id.get(policy_id)
+
+    def group(self, group_id):
+        return self.groups_by_id.get(group_id)
+
+    def tenant(self, tenant_id):
+        return self.tenants_by_id.get(tenant_id)
+
+    def msp(self, msp_id):
+        return self.msps_by_id.get(msp_id)
+
+    # Device list lookups (empty list if none)
+    def devices_with_hostname(self, hostname):
+        return self.devices_by_hostname.get(hostname, [])
+
+    def devices_in_group(self, group_id):
+        return self.devices_by_group_id.get(group_id, [])
+
+    def devices_in_policy(self, policy_id):
+        return self.devices_by_policy_id.get(policy_id, [])
+
+    def devices_in_tenant(self, tenant_id):
+        return self.devices_by_tenant_id.get(tenant_id, [])
+
+    def devices_in_msp(self, msp_id):
+        return self.devices_by_msp_id.get(msp_id, [])
+
+    # Returns the policy/group/tenant which the device belongs to
+    def policy_for_device(self, device):
+        return self.policies_by_id.get(device.get('policy_id'))
+
+    def group_for_device(self, device):
+        return self.groups_by_id.get(device.get('group_id'))
+
+    def tenant_for_device(self, device):
+        return self.tenants_by_id.get(device.get('tenant_id'))
+
+    # Copies fields from a related record onto each record, in place. key is
+    # the field on the record holding the related id, table is the name of the
+    # related data (devices | policies | groups | tenants | msps) or a
+    # dictionary of {id: record}, and fields is a list of field names or a
+    # dictionary of {field on related record: field name on record}. Records
+    # with no related record are left unchanged. Returns the records.
+    def join(self, records, key, table, fields):
+        if isinstance(table, str):
+            table = self._tables[table]
+        if not isinstance(fields, dict):
+            fields = {field: field for field in fields}
+        for record in records:
+            related = table.get(record.get(key))
+            if related != None:
+                for source_field, target_field in fields.items():
+                    if source_field in related:
+                        record[target_field] = related[source_field]
+        return records
+
+    # Convenience wrappers around the module-level helpers
+    def group_by(self, records, field):
+        return group_by(records, field)
+
+    def count_by(self, records, field):
+        return count_by(records, field)
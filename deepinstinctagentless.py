@@ -7,45 +7,425 @@
 # officially supported, although the API that it calls is.
 #
 
+#HTTP connection pool settings. All scans share a single keep-alive session, so
+#the TCP+TLS handshake is paid once per pooled connection instead of once per
+#file. pool_size should be at least max_in_flight_scans.
+pool_size = 10
+
+#Defaults for scan_many/scan_directory: the maximum number of scans submitted
+#to the connector(s) at once, and the maximum number of files read from disk
+#ahead of being submitted. Only files up to prefetch_max_file_size bytes are
+#read ahead; larger files are streamed from disk when their scan is submitted.
+max_in_flight_scans = 8
+prefetch_files = 16
+prefetch_max_file_size = 4 * 1024 * 1024
+
+#Files are uploaded (and hashed for the verdict cache) in chunks of this many
+#bytes, so memory use doesn't grow with file size. Must be a multiple of 3 so
+#that base64 encoded chunks join without padding.
+upload_chunk_size = 3 * 256 * 1024
+
+#Verdict cache. If verdict_cache_path is set (for example to
+#'verdict_cache.sqlite'), scans look up the SHA-256 of the file content in a
+#local SQLite database first and only send the file to the connector if no
+#unexpired verdict is stored, then store the new verdict. Verdicts expire after
+#the number of seconds in verdict_cache_ttl for their class (the verdict
+#returned by simplify_verdict); classes not listed are not cached. Hits and
+#misses are counted in verdict_cache_stats.
+verdict_cache_path = None
+verdict_cache_ttl = {'Benign': 7 * 86400, 'Malicious': 30 * 86400, 'Suspicious': 86400, 'Unsupported': 3600}
+verdict_cache_stats = {'hits': 0, 'misses': 0}
+
+#Defaults for ConnectorPool: a connector which fails this many scans in a row
+#(connection errors, timeouts, 429 or 5xx responses) is ejected, i.e. not sent
+#new scans for connector_cooldown seconds, after which it is tried again
+connector_failure_threshold = 3
+connector_cooldown = 30
+
 #Import required libraries
-import requests, base64, json, urllib3
+import requests, base64, json, urllib3, os, queue, threading, concurrent.futures, hashlib, sqlite3, time, copy, collections, math
 
 #Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+_session = None
+_session_pool_size = None
+_session_lock = threading.Lock()
+
+
+#Returns the shared HTTP session, (re)building it if pool_size has changed since
+#it was created
+def get_session():
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None or _session_pool_size != pool_size:
+            if _session is not None:
+                _session.close()
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pool_size = pool_size
+        return _session
+
+
+#Closes the shared HTTP session (a new one is created on next scan)
+def close_session():
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pool_size = None
+
+
+_verdict_cache_local = threading.local()
+_verdict_cache_stats_lock = threading.Lock()
+
+
+#Returns this thread's connection to the verdict cache database, creating the
+#table if needed (SQLite connections can't be shared between threads)
+def _verdict_cache_connect():
+    connections = getattr(_verdict_cache_local, 'connections', None)
+    if connections is None:
+        connections = _verdict_cache_local.connections = {}
+    if verdict_cache_path not in connections:
+        connection = sqlite3.connect(verdict_cache_path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('''CREATE TABLE IF NOT EXISTS verdicts (
+            file_hash TEXT PRIMARY KEY,
+            verdict_class TEXT NOT NULL,
+            verdict TEXT NOT NULL,
+            cached REAL NOT NULL,
+            expires REAL NOT NULL)''')
+        connections[verdict_cache_path] = connection
+    return connections[verdict_cache_path]
+
+
+def _count_verdict_cache(result):
+    with _verdict_cache_stats_lock:
+        verdict_cache_stats[result] += 1
+
+
+#Returns the cached raw verdict for a SHA-256 file hash, or None if there is
+#no unexpired verdict
+def get_cached_verdict(file_hash):
+    row = _verdict_cache_connect().execute('SELECT verdict FROM verdicts WHERE file_hash = ? AND expires > ?', (file_hash, time.time())).fetchone()
+    if row is None:
+        _count_verdict_cache('misses')
+        return None
+    _count_verdict_cache('hits')
+    return json.loads(row[0])
+
+
+#Stores a raw verdict for a SHA-256 file hash, with the expiry for its class
+def cache_verdict(file_hash, verdict):
+    simplified = simplify_verdict(copy.deepcopy(verdict))
+    if simplified is None or simplified['verdict'] not in verdict_cache_ttl:
+        return
+    now = time.time()
+    connection = _verdict_cache_connect()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO verdicts (file_hash, verdict_class, verdict, cached, expires) VALUES (?, ?, ?, ?, ?)',
+            (file_hash, simplified['verdict'], json.dumps(verdict), now, now + verdict_cache_ttl[simplified['verdict']]))
+
+
+#Deletes expired verdicts from the cache and returns the number deleted
+def purge_expired_verdicts():
+    connection = _verdict_cache_connect()
+    with connection:
+        return connection.execute('DELETE FROM verdicts WHERE expires <= ?', (time.time(),)).rowcount
+
+
+#Deletes all verdicts from the cache (optionally only those of one class, for
+#example after a policy change) and returns the number deleted
+def clear_verdict_cache(verdict_class=None):
+    connection = _verdict_cache_connect()
+    with connection:
+        if verdict_class is None:
+            return connection.execute('DELETE FROM verdicts').rowcount
+        return connection.execute('DELETE FROM verdicts WHERE verdict_class = ?', (verdict_class,)).rowcount
+
+
+#Returns the hit/miss counters, hit rate, and the number of unexpired cached
+#verdicts per class
+def get_verdict_cache_stats():
+    with _verdict_cache_stats_lock:
+        stats = dict(verdict_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups > 0 else None
+    rows = _verdict_cache_connect().execute('SELECT verdict_class, COUNT(*) FROM verdicts WHERE expires > ? GROUP BY verdict_class', (time.time(),)).fetchall()
+    stats['cached_verdicts'] = {verdict_class: count for verdict_class, count in rows}
+    return stats
+
 #Primary method which accepts file name and optional config data, submits scan, simplifies it, and returns result
-def scan_file(file_name, scanner_ip, simplified=False, encoded=False, scanner_port=5000):
+def scan_file(file_name, scanner_ip, simplified=False, encoded=False, scanner_port=5000, timeout=20):
 
-    # read file from disk (rb means opens the file in binary format for reading)
+    # open file from disk (rb means opens the file in binary format for reading)
+    # and pass the file object on, so the upload is streamed from disk in chunks
+    # instead of reading the whole file into memory
     with open(file_name, 'rb') as f:
-        #read file
-        data = f.read()
-        #close file
-        f.close()
+        return _scan_data(f, scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, timeout=timeout)
+
+
+#File-like wrapper which base64 encodes a binary file as it is read, so that an
+#encoded upload is streamed instead of encoding the whole file in memory.
+#__len__ gives requests the encoded Content-Length up front.
+class _Base64Reader:
+
+    def __init__(self, f):
+        self._f = f
+        self._buffer = bytearray()
+        self._length = (os.fstat(f.fileno()).st_size - f.tell() + 2) // 3 * 4
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        while len(self._buffer) < size:
+            chunk = self._f.read(upload_chunk_size)
+            if not chunk:
+                break
+            self._buffer += base64.b64encode(chunk)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+#Returns the SHA-256 of file contents (bytes, or a binary file object which is
+#read in chunks and then returned to its original position)
+def _sha256(data):
+    if isinstance(data, bytes):
+        return hashlib.sha256(data).hexdigest()
+    position = data.tell()
+    file_hash = hashlib.sha256()
+    for chunk in iter(lambda: data.read(upload_chunk_size), b''):
+        file_hash.update(chunk)
+    data.seek(position)
+    return file_hash.hexdigest()
+
+
+#Sends file contents to a connector and returns the response
+def _post_scan(data, scanner_ip, scanner_port, encoded, timeout):
+
+    #requests sends a file object with nothing left to read as chunked (it
+    #can't tell it from one of unknown length), so send an empty body instead,
+    #which goes with Content-Length: 0
+    if not isinstance(data, bytes) and os.fstat(data.fileno()).st_size - data.tell() <= 0:
+        data = b''
 
     if encoded:
-        #encode data and set URL to match
-        data = base64.b64encode(data)
+        #encode data (incrementally for files) and set URL to match
+        data = base64.b64encode(data) if isinstance(data, bytes) else _Base64Reader(data)
         request_url = f'https://{scanner_ip}:{scanner_port}/scan/base64'
     else:
         #leave data as-is and set URL to match
         request_url = f'https://{scanner_ip}:{scanner_port}/scan/binary'
 
-    # send scan request, capture response
-    response = requests.post(request_url, data=data, timeout=20, verify=False)
-
-    # validate response code and proceed if expected value 200
-    if response.status_code == 200:
-        #convert to Python dictionary
-        verdict = response.json()
-        if simplified:
-            #Call function to simplify the verdict
-            verdict = simplify_verdict(verdict)
-        #Return [simplified] verdict
-        return verdict
+    # send scan request over the shared session
+    return get_session().post(request_url, data=data, timeout=timeout, verify=False)
+
+
+#Submits file contents (bytes, or a binary file object which is streamed) for
+#scanning and returns the [simplified] verdict, or None on error. scanner_ip can
+#be a ConnectorPool.
+def _scan_data(data, scanner_ip, simplified=False, encoded=False, scanner_port=5000, timeout=20):
+
+    if verdict_cache_path is not None:
+        #return a cached verdict for the same content without contacting the connector
+        file_hash = _sha256(data)
+        verdict = get_cached_verdict(file_hash)
+        if verdict is not None:
+            return simplify_verdict(verdict) if simplified else verdict
+
+    if isinstance(scanner_ip, ConnectorPool):
+        #the pool picks the connector and retries on another one if needed
+        verdict = scanner_ip._scan(data, encoded=encoded, timeout=timeout)
     else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
+        # send scan request, capture response
+        response = _post_scan(data, scanner_ip, scanner_port, encoded, timeout)
+        # validate response code and proceed if expected value 200
+        if response.status_code == 200:
+            #convert to Python dictionary
+            verdict = response.json()
+        else:
+            print('ERROR: Unexpected return code', response.status_code, 'on POST to', response.url)
+            verdict = None
+
+    if verdict is None:
+        return None
+    if verdict_cache_path is not None:
+        cache_verdict(file_hash, verdict)
+    if simplified:
+        #Call function to simplify the verdict
+        verdict = simplify_verdict(verdict)
+    #Return [simplified] verdict
+    return verdict
+
+
+#Returns the pth percentile (nearest-rank) of a sorted list of seconds, in
+#milliseconds, or None if the list is empty
+def _percentile_ms(sorted_seconds, p):
+    if len(sorted_seconds) == 0:
         return None
+    return sorted_seconds[max(1, math.ceil(p / 100 * len(sorted_seconds))) - 1] * 1000
+
+
+#Spreads scans across several connectors. Each scan goes to the healthy
+#connector with the fewest scans outstanding (least-outstanding-requests
+#routing). Connection errors, timeouts, and 429/5xx responses count as failures
+#of the connector and the scan is retried on another connector (scans are
+#idempotent), up to max_attempts connectors. A connector which fails
+#failure_threshold scans in a row is ejected for cooldown seconds. Other
+#responses (e.g. 400 for a bad request) are returned as errors without retry,
+#and are counted as errors rather than succeeded or failed scans.
+#
+#connectors is a list of 'ip', 'ip:port', or (ip, port) entries. A pool can be
+#passed as scanner_ip to scan_file, scan_many, and scan_directory, or its
+#methods of the same names can be used. get_stats() returns per-connector
+#latency, throughput, and health.
+class ConnectorPool:
+
+    def __init__(self, connectors, scanner_port=5000, failure_threshold=None, cooldown=None, max_attempts=None, latency_samples=10000):
+        self.failure_threshold = connector_failure_threshold if failure_threshold is None else failure_threshold
+        self.cooldown = connector_cooldown if cooldown is None else cooldown
+        self._connectors = []
+        for connector in connectors:
+            if isinstance(connector, (tuple, list)):
+                ip, port = connector
+            elif ':' in connector:
+                ip, port = connector.rsplit(':', 1)
+            else:
+                ip, port = connector, scanner_port
+            self._connectors.append({'connector': f'{ip}:{port}', 'ip': ip, 'port': int(port), 'outstanding': 0,
+                                     'consecutive_failures': 0, 'ejected_until': None})
+        if len(self._connectors) == 0:
+            raise ValueError('ConnectorPool requires at least one connector')
+        self.max_attempts = len(self._connectors) if max_attempts is None else max_attempts
+        self._latency_samples = latency_samples
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    #Clears the per-connector counters and latencies
+    def reset_stats(self):
+        with self._lock:
+            self._started = time.monotonic()
+            for connector in self._connectors:
+                connector.update({'scans': 0, 'succeeded': 0, 'failed': 0, 'errors': 0, 'timeouts': 0, 'ejections': 0, 'bytes': 0,
+                                  'latencies': collections.deque(maxlen=self._latency_samples)})
+
+    #Picks the healthy connector with the fewest outstanding scans (ties go to
+    #the one with fewest scans so far), skipping those already tried. If all are
+    #ejected, the one whose cooldown ends first is used rather than failing.
+    def _acquire(self, tried):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [connector for connector in self._connectors if connector not in tried]
+            if len(candidates) == 0:
+                return None
+            healthy = [connector for connector in candidates if connector['ejected_until'] is None or connector['ejected_until'] <= now]
+            if len(healthy) == 0:
+                healthy = [min(candidates, key=lambda connector: connector['ejected_until'])]
+            connector = min(healthy, key=lambda connector: (connector['outstanding'], connector['scans']))
+            connector['outstanding'] += 1
+            connector['scans'] += 1
+            return connector
+
+    #Records the outcome of a scan on a connector, ejecting it if it has failed
+    #failure_threshold times in a row. An error (a response rejecting the
+    #request) shows the connector is up, but is excluded from the succeeded,
+    #bytes, and latency figures.
+    def _release(self, connector, latency, size=0, failed=False, timed_out=False, error=False):
+        with self._lock:
+            connector['outstanding'] -= 1
+            if error:
+                connector['errors'] += 1
+                connector['consecutive_failures'] = 0
+            elif failed:
+                connector['failed'] += 1
+                connector['timeouts'] += int(timed_out)
+                connector['consecutive_failures'] += 1
+                if connector['consecutive_failures'] >= self.failure_threshold:
+                    if connector['ejected_until'] is None or connector['ejected_until'] <= time.monotonic():
+                        connector['ejections'] += 1
+                        print('WARNING: Ejecting connector', connector['connector'], 'for', self.cooldown, 'seconds after', connector['consecutive_failures'], 'consecutive failures')
+                    connector['ejected_until'] = time.monotonic() + self.cooldown
+            else:
+                connector['succeeded'] += 1
+                connector['bytes'] += size
+                connector['latencies'].append(latency)
+                connector['consecutive_failures'] = 0
+                connector['ejected_until'] = None
+
+    #Scans file contents (bytes or a binary file object) and returns the raw
+    #verdict, or None on error
+    def _scan(self, data, encoded=False, timeout=20):
+        if isinstance(data, bytes):
+            position, size = None, len(data)
+        else:
+            position = data.tell()
+            size = os.fstat(data.fileno()).st_size - position
+        tried = []
+        while len(tried) < self.max_attempts:
+            connector = self._acquire(tried)
+            if connector is None:
+                break
+            tried.append(connector)
+            if position is not None:
+                #rewind in case a previous attempt sent part of the file
+                data.seek(position)
+            start = time.perf_counter()
+            try:
+                response = _post_scan(data, connector['ip'], connector['port'], encoded, timeout)
+            except requests.exceptions.RequestException as e:
+                self._release(connector, time.perf_counter() - start, failed=True, timed_out=isinstance(e, requests.exceptions.Timeout))
+                print('WARNING: Scan on connector', connector['connector'], 'failed -', e)
+                continue
+            if response.status_code == 200:
+                self._release(connector, time.perf_counter() - start, size=size)
+                return response.json()
+            if response.status_code == 429 or response.status_code >= 500:
+                self._release(connector, time.perf_counter() - start, failed=True)
+                print('WARNING: Unexpected return code', response.status_code, 'on POST to', response.url)
+                continue
+            #any other response is a problem with the request, not the connector
+            self._release(connector, time.perf_counter() - start, error=True)
+            print('ERROR: Unexpected return code', response.status_code, 'on POST to', response.url)
+            return None
+        print('ERROR: Scan failed on', len(tried), 'connector(s):', ', '.join(connector['connector'] for connector in tried))
+        return None
+
+    #Returns a list with one dictionary per connector: health, outstanding
+    #scans, counters, throughput since the pool was created (or stats were
+    #reset), and latency percentiles in milliseconds over the most recent
+    #latency_samples successful scans
+    def get_stats(self):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._started
+            stats = []
+            for connector in self._connectors:
+                latencies = sorted(connector['latencies'])
+                stats.append({'connector': connector['connector'],
+                              'healthy': connector['ejected_until'] is None or connector['ejected_until'] <= now,
+                              'outstanding': connector['outstanding'], 'scans': connector['scans'], 'succeeded': connector['succeeded'],
+                              'failed': connector['failed'], 'errors': connector['errors'], 'timeouts': connector['timeouts'], 'ejections': connector['ejections'],
+                              'throughput_scans_per_second': connector['succeeded'] / elapsed if elapsed > 0 else None,
+                              'throughput_megabytes_per_second': connector['bytes'] / 1000000 / elapsed if elapsed > 0 else None,
+                              'latency_ms': {'p50': _percentile_ms(latencies, 50), 'p95': _percentile_ms(latencies, 95), 'p99': _percentile_ms(latencies, 99),
+                                             'max': _percentile_ms(latencies, 100), 'mean': sum(latencies) / len(latencies) * 1000 if len(latencies) > 0 else None}})
+            return stats
+
+    def scan_file(self, file_name, simplified=False, encoded=False, timeout=20):
+        return scan_file(file_name, self, simplified=simplified, encoded=encoded, timeout=timeout)
+
+    def scan_many(self, file_names, **kwargs):
+        return scan_many(file_names, self, **kwargs)
+
+    def scan_directory(self, directory, recursive=True, **kwargs):
+        return scan_directory(directory, self, recursive=recursive, **kwargs)
 
 
 #Wrapper which invokes scan_file with the parameter to use encoding
@@ -53,6 +433,138 @@ def scan_file_encoded(file_name, scanner_ip, simplified=False):
     return scan_file(file_name=file_name, scanner_ip=scanner_ip, simplified=simplified, encoded=True)
 
 
+#Yields the name of each file in paths (a file or directory name, or a list of
+#them). Directories are walked lazily, one directory at a time, so scanning can
+#start before the walk of a large file share is complete.
+def iter_files(paths, recursive=True):
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                for root, dirs, files in os.walk(path):
+                    for name in files:
+                        yield os.path.join(root, name)
+            else:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            yield entry.path
+        else:
+            yield path
+
+
+_end_of_files = object()
+
+
+#Puts an item on the queue, giving up if stop is set (the consumer went away)
+def _put_unless_stopped(read_queue, item, stop):
+    while not stop.is_set():
+        try:
+            read_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+#Reads files into the queue as (file_name, data, error) until the queue is full,
+#then waits for room, so at most prefetch files are held in memory. Files larger
+#than prefetch_max_file_size are queued with data None and streamed later.
+def _read_files(file_names, read_queue, stop):
+    try:
+        for file_name in file_names:
+            try:
+                with open(file_name, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size > prefetch_max_file_size:
+                        item = (file_name, None, None)
+                    else:
+                        item = (file_name, f.read(), None)
+            except OSError as e:
+                item = (file_name, None, e)
+            if not _put_unless_stopped(read_queue, item, stop):
+                return
+    except Exception as e:
+        print('ERROR: Listing files to scan failed:', e)
+    _put_unless_stopped(read_queue, _end_of_files, stop)
+
+
+#Scans one item read by _read_files and returns (file_name, verdict)
+def _scan_item(item, scanner_ip, simplified, encoded, scanner_port, timeout):
+    file_name, data, error = item
+    if error is not None:
+        print('ERROR: Unable to read', file_name, '-', error)
+        return file_name, None
+    try:
+        if data is None:
+            return file_name, scan_file(file_name, scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, timeout=timeout)
+        return file_name, _scan_data(data, scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        print('ERROR: Scan of', file_name, 'failed -', e)
+        return file_name, None
+    except OSError as e:
+        print('ERROR: Unable to read', file_name, '-', e)
+        return file_name, None
+
+
+#Scans many files concurrently and yields (file_name, verdict) tuples in the
+#order the scans complete (not the order of file_names). file_names can be any
+#iterable, including a generator such as iter_files, and is consumed lazily.
+#Files are read by a background thread up to prefetch files ahead (larger
+#files are streamed when submitted, see prefetch_max_file_size), and up to
+#max_in_flight scans are submitted at once over the shared session. scanner_ip
+#can be a single connector, a ConnectorPool, or a list of connectors (which is
+#used to create a ConnectorPool). The verdict is None if the file could not be
+#read or scanned (the error is printed), and is simplified if simplified=True.
+def scan_many(file_names, scanner_ip, simplified=False, encoded=False, scanner_port=5000, max_in_flight=None, prefetch=None, timeout=20):
+    if max_in_flight is None:
+        max_in_flight = max_in_flight_scans
+    if prefetch is None:
+        prefetch = prefetch_files
+    if not isinstance(scanner_ip, (str, ConnectorPool)):
+        scanner_ip = ConnectorPool(scanner_ip, scanner_port=scanner_port)
+
+    read_queue = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    threading.Thread(target=_read_files, args=(iter(file_names), read_queue, stop), daemon=True).start()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight)
+    in_flight = set()
+    reading = True
+
+    try:
+        while reading or len(in_flight) > 0:
+            #submit files which have been read, up to the in-flight limit (only
+            #block waiting for a file if there is nothing else to wait for)
+            while reading and len(in_flight) < max_in_flight:
+                try:
+                    item = read_queue.get(block=len(in_flight) == 0)
+                except queue.Empty:
+                    break
+                if item is _end_of_files:
+                    reading = False
+                else:
+                    in_flight.add(executor.submit(_scan_item, item, scanner_ip, simplified, encoded, scanner_port, timeout))
+
+            #yield completed scans (polling briefly if more files may be waiting)
+            if len(in_flight) > 0:
+                wait = 0.05 if reading and len(in_flight) < max_in_flight else None
+                done, in_flight = concurrent.futures.wait(in_flight, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    finally:
+        #stop reading and drop queued scans if the caller stops early
+        stop.set()
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+#Scans the files in a directory (and its subdirectories if recursive=True)
+#concurrently; see scan_many for the other arguments and the results
+def scan_directory(directory, scanner_ip, recursive=True, **kwargs):
+    return scan_many(iter_files(directory, recursive=recursive), scanner_ip, **kwargs)
+
+
 # A method used to convert the raw verdict received from DI Agentless into a simplified/more user-friendly format
 # --> Recommend to use this with an Agentless Policy where "prevention" is enabled at Threat Severity "Low" and above
 # --> This method introduces the concept of a "Suspicious" verdict, which is for files that score Low or Moderate
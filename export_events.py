@@ -83,6 +83,12 @@ events = di.get_events()
 #TODO: Build search_parameters dictionary based upon example above
 #events = di.get_events(search=search_parameters, minimum_event_id=5001)
 
+# Example of a resumable/incremental export (3.0 only). Progress is saved to
+# disk after every page, so an interrupted run resumes where it stopped, and a
+# scheduled run exports only the events created since the last successful run.
+# export_events writes the file itself, so the rest of this script is skipped.
+#di.export_events(checkpoint=True); exit()
+
 # ==============================================================================
 
 if len(events) > 0:
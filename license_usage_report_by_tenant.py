@@ -1,4 +1,5 @@
 import pandas, datetime, deepinstinct30 as di
+from deepinstinct30_inventory import Inventory, index_by
 
 # Optional hardcoded config - if not provided, you'll be prompted at runtime
 di.fqdn = 'SERVER-NAME.customers.deepinstinctweb.com'
@@ -25,13 +26,12 @@ print('INFO: Getting MSP data from server')
 msps = di.get_msps()
 print('INFO: Getting Device data from server')
 devices = di.get_devices(include_deactivated=False)
+print('INFO: Indexing Tenant, MSP, and Device data')
+inventory = Inventory(devices=devices, tenants=tenants, msps=msps)
 
 # Look up MSP name for each tenant and add it to the tenants data
 print('INFO: Adding MSP names to Tenant data')
-for tenant in tenants:
-    for msp in msps:
-        if tenant['msp_id'] == msp['id']:
-            tenant['msp_name'] = msp['name']
+inventory.join(tenants, 'msp_id', 'msps', {'name': 'msp_name'})
 
 # If option to include policy mode counts is enabled, get policy details,
 # then parse policies to calculate mode, then add that data to devices
@@ -57,10 +57,7 @@ if include_policy_mode_counts:
                 policy['prevention_mode'] = True
 
     print('INFO: Adding policy mode to device data')
-    for device in devices:
-        for policy in policies:
-            if policy['id'] == device['policy_id']:
-                device['prevention_mode'] = policy['prevention_mode']
+    inventory.join(devices, 'policy_id', index_by(policies, 'id'), ['prevention_mode'])
 
 # Calculate license usage for each tenant (plus prevention/detection data, if enabled in config)
 if include_policy_mode_counts:
@@ -76,16 +73,16 @@ for device in devices:
     # Check if the device has an activated license (if not skip it)
     if device['license_status'] == 'ACTIVATED':
         # If yes, then find the Tenant that this device belongs to
-        for tenant in tenants:
-            if tenant['id'] == device['tenant_id']:
-                # ...and increment the licenses_used counter in the matching tenant by 1
-                tenant['licenses_used'] += 1
-                # If enabled, also increment the prevention/detection counter
-                if include_policy_mode_counts:
-                    if device['prevention_mode']:
-                        tenant['devices_in_prevention_mode'] += 1
-                    else:
-                        tenant['devices_in_detection_mode'] += 1
+        tenant = inventory.tenant_for_device(device)
+        if tenant != None:
+            # ...and increment the licenses_used counter in the matching tenant by 1
+            tenant['licenses_used'] += 1
+            # If enabled, also increment the prevention/detection counter
+            if include_policy_mode_counts:
+                if device['prevention_mode']:
+                    tenant['devices_in_prevention_mode'] += 1
+                else:
+                    tenant['devices_in_detection_mode'] += 1
 
 # Calculate percent_of_licenses_used for reach tenant and add results to tenants data
 print('INFO: Calculating percentage of licenses used for each tenant')
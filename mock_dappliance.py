@@ -0,0 +1,622 @@
+# mock_dappliance.py
+#
+# A local stand-in for a Deep Instinct D-Appliance which implements the REST
+# API methods used by deepinstinct30, deepinstinct30_async, and
+# deepinstinct25 (device and event paging, policies and policy data,
+# allow/deny lists, groups, tenants, MSPs, and the device/event/group action
+# methods). It is intended for testing and benchmarking the API wrapper
+# without a live server, for example to measure the throughput of a crawl or
+# a bulk action before and after a change.
+#
+# Synthetic data is generated on demand from each id (using a fixed seed), so
+# the server can present 100k devices and millions of events without holding
+# them in memory, and returns the same data on every run. Changes made
+# through the API (group moves, archives, closed events, policy data, new
+# MSPs/tenants/policies) are kept in memory until the server is stopped.
+# Latency, server errors (503), and throttling (429 with Retry-After) can be
+# injected to exercise the wrapper's retry and rate limit handling.
+#
+# Usage:
+# 1. Start the server, for example:
+#        python mock_dappliance.py --port 8080 --devices 100000 --events 5000000
+#    Add --latency 0.05 --error-rate 0.01 --throttle-rate 0.02 to inject
+#    latency and faults, or --max-rps 50 to throttle above a request rate.
+#    Run python mock_dappliance.py --help for all options.
+# 2. Point the wrapper at it:
+#        import deepinstinct30 as di
+#        di.protocol = 'http'
+#        di.fqdn = 'localhost:8080'
+#        di.key = 'any value (or the value passed as --key)'
+# 3. Request counters are available at http://localhost:8080/mock/stats and
+#    are printed when the server is stopped with Ctrl+C.
+#
+# To serve HTTPS instead (for example to test code which can't set
+# di.protocol), pass --certfile and --keyfile and have the client trust the
+# certificate (for requests, set the REQUESTS_CA_BUNDLE environment variable).
+#
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. This is not a
+# Deep Instinct commercial product and is not officially supported. Its
+# responses are an approximation of a real D-Appliance, not a specification.
+#
+
+import argparse, json, random, re, ssl, threading, time, datetime, hashlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Number of devices/events returned per page, as on a real server
+page_size = 50
+
+operating_systems = ['WINDOWS', 'MAC', 'ANDROID', 'IOS', 'CHROME', 'LINUX']
+operating_system_weights = [70, 15, 5, 4, 3, 3]
+event_types = ['STATIC_ANALYSIS', 'RANSOMWARE_FILE_ENCRYPTION', 'REMOTE_CODE_INJECTION_EXECUTION', 'KNOWN_SHELLCODE_PAYLOADS',
+               'ARBITRARY_SHELLCODE', 'REFLECTIVE_DLL', 'AMSI_BYPASS', 'CREDENTIAL_DUMP', 'MALICIOUS_POWERSHELL_COMMAND_EXECUTION']
+event_type_weights = [80, 3, 3, 2, 3, 2, 2, 2, 3]
+threat_severities = ['LOW', 'MODERATE', 'HIGH', 'VERY_HIGH']
+allow_deny_lists = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths', 'allow-list/scripts', 'deny-list/hashes']
+
+
+# Formats a datetime the way the server does
+def _timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+# Returns a deterministic hex string for the provided parts
+def _hex(*parts, length=64):
+    return hashlib.sha256('/'.join(str(part) for part in parts).encode()).hexdigest()[:length]
+
+
+# Returns True if the record matches a search payload. A list value matches
+# any of its values, any other value must be equal, and fields which the
+# record doesn't have are ignored.
+def _matches(record, search):
+    for field, value in search.items():
+        if field not in record:
+            continue
+        if isinstance(value, list):
+            if record[field] not in value:
+                return False
+        elif record[field] != value:
+            return False
+    return True
+
+
+# Holds the synthetic data and any changes made through the API. Requests
+# which change data hold lock, so they are applied one at a time; requests
+# which only read data don't take it, so reads (such as event searches which
+# scan the id range) run concurrently.
+class MockDAppliance:
+
+    def __init__(self, device_count=1000, event_count=10000, suspicious_event_count=1000, msp_count=1, tenants_per_msp=3, groups_per_msp=6, seed=1):
+        self.device_count = device_count
+        self.event_count = event_count
+        self.suspicious_event_count = suspicious_event_count
+        self.seed = seed
+        self.start_time = datetime.datetime.now(datetime.timezone.utc)
+        self.lock = threading.Lock()
+
+        self.msps = []
+        self.tenants = []
+        self.policies = []
+        self.policy_data = {}
+        self.groups = []
+        for msp_number in range(1, msp_count + 1):
+            msp = {'id': msp_number, 'name': f'MSP {msp_number}', 'license_limit': device_count}
+            self.msps.append(msp)
+            for tenant_number in range(1, tenants_per_msp + 1):
+                self.tenants.append({'id': len(self.tenants) + 1, 'name': f'Tenant {msp_number}-{tenant_number}', 'msp_id': msp['id'], 'msp_name': msp['name'],
+                                     'license_limit': device_count // max(1, msp_count * tenants_per_msp) + 100, 'token': _hex('tenant', msp_number, tenant_number, length=32)})
+            #a default policy and a prevention policy per platform, and a default group per platform
+            for os in operating_systems:
+                default_policy = self._add_policy(f'{os.title()} Default Policy', os, msp, is_default=True, prevention=False)
+                self._add_policy(f'{os.title()} Prevention Policy', os, msp, is_default=False, prevention=True)
+                self.groups.append({'id': len(self.groups) + 1, 'name': f'{os.title()} Default Group', 'os': os, 'is_default_group': True,
+                                    'msp_id': msp['id'], 'msp_name': msp['name'], 'policy_id': default_policy['id'], 'comment': ''})
+            #custom groups rotate through the platforms and alternate between the two policies
+            for group_number in range(groups_per_msp):
+                os = operating_systems[group_number % len(operating_systems)]
+                policy = [policy for policy in self.policies if policy['msp_id'] == msp['id'] and policy['os'] == os][group_number // len(operating_systems) % 2]
+                self.groups.append({'id': len(self.groups) + 1, 'name': f'{os.title()} Group {group_number + 1}', 'os': os, 'is_default_group': False,
+                                    'msp_id': msp['id'], 'msp_name': msp['name'], 'policy_id': policy['id'], 'comment': ''})
+
+        #changes made through the API
+        self.device_changes = {}
+        self.archived_device_ids = set()
+        self.event_changes = {}
+        self.archived_event_ids = set()
+
+    def _add_policy(self, name, os, msp, is_default, prevention, base_data=None):
+        policy = {'id': len(self.policies) + 1 if len(self.policies) == 0 else max(policy['id'] for policy in self.policies) + 1,
+                  'name': name, 'os': os, 'is_default_policy': is_default, 'msp_id': msp['id'], 'msp_name': msp['name'], 'comment': ''}
+        if base_data != None:
+            data = json.loads(json.dumps(base_data))
+        elif os == 'WINDOWS':
+            mode = 'PREVENT' if prevention else 'DETECT'
+            data = {'prevention_level': 'MEDIUM' if prevention else 'DISABLED', 'detection_level': 'MEDIUM', 'ransomware_behavior': mode,
+                    'remote_code_injection': mode, 'arbitrary_shellcode_execution': mode, 'in_memory_protection': True,
+                    'automatic_upgrade': False, 'allow_manual_uninstall': False, 'disable_agent_uninstall': True}
+        else:
+            data = {'prevention_level': 'MEDIUM' if prevention else 'DISABLED', 'detection_level': 'MEDIUM', 'automatic_upgrade': False}
+        self.policies.append(policy)
+        self.policy_data[policy['id']] = data
+        return policy
+
+    # Records changes to a device or event. The dictionary of changes for the
+    # record is replaced rather than updated in place, so a reader (which
+    # doesn't hold the lock) never iterates it part way through an update.
+    def _record_changes(self, changes, key, values):
+        changes[key] = {**changes.get(key, {}), **values}
+
+    # Returns the group, policy, and MSP lookups needed to build devices
+    def _find(self, records, record_id):
+        for record in records:
+            if record['id'] == record_id:
+                return record
+        return None
+
+    # Returns a device, or None if it doesn't exist
+    def device(self, device_id):
+        if device_id < 1 or device_id > self.device_count:
+            return None
+        rng = random.Random(self.seed * 1000003 + device_id)
+        tenant = self.tenants[rng.randrange(len(self.tenants))]
+        os = rng.choices(operating_systems, operating_system_weights)[0]
+        groups = [group for group in self.groups if group['msp_id'] == tenant['msp_id'] and group['os'] == os]
+        group = groups[rng.randrange(len(groups))]
+        last_contact = self.start_time - datetime.timedelta(minutes=rng.randrange(60 * 24 * 30))
+        device = {'id': device_id, 'hostname': f'{os.lower()}-{device_id:06d}', 'os': os, 'osv': f'{os.title()} {rng.randint(7, 14)}',
+                  'ip_address': f'10.{(device_id >> 16) & 255}.{(device_id >> 8) & 255}.{device_id & 255}',
+                  'mac_address': ':'.join(_hex('mac', self.seed, device_id, length=12)[i:i + 2] for i in range(0, 12, 2)),
+                  'agent_version': f'3.{rng.randint(0, 3)}.0.{rng.randint(1, 40)}', 'tag': 'VDI' if device_id % 10 == 0 else '',
+                  'group_id': group['id'], 'group_name': group['name'], 'tenant_id': tenant['id'], 'tenant_name': tenant['name'],
+                  'msp_id': tenant['msp_id'], 'msp_name': tenant['msp_name'],
+                  'license_status': 'ACTIVATED' if rng.random() < 0.95 else 'DEACTIVATED',
+                  'connectivity_status': 'ONLINE' if last_contact > self.start_time - datetime.timedelta(hours=1) else 'OFFLINE',
+                  'deployment_status': 'REGISTERED', 'scanned_files': rng.randint(0, 500000), 'comment': '',
+                  'last_registration': _timestamp(last_contact - datetime.timedelta(days=rng.randrange(365))),
+                  'last_contact': _timestamp(last_contact)}
+        device.update(self.device_changes.get(device_id, {}))
+        policy = self._find(self.policies, self._find(self.groups, device['group_id'])['policy_id'])
+        device['policy_id'] = policy['id']
+        device['policy_name'] = policy['name']
+        return device
+
+    # Returns an event, or None if it doesn't exist
+    def event(self, event_id, suspicious=False):
+        count = self.suspicious_event_count if suspicious else self.event_count
+        if event_id < 1 or event_id > count:
+            return None
+        rng = random.Random((self.seed * 2 + int(suspicious)) * 1000003 + event_id)
+        device = self.device(rng.randint(1, max(1, self.device_count)))
+        #events are spread over the last 90 days in id order
+        occurred = self.start_time - datetime.timedelta(seconds=(count - event_id) * 90 * 86400 / count)
+        event_type = rng.choices(event_types, event_type_weights)[0]
+        file_hash = _hex('file', rng.randrange(max(100, count // 20)))
+        event = {'id': event_id, 'device_id': device['id'], 'type': event_type, 'trigger': 'BRAIN' if event_type == 'STATIC_ANALYSIS' else 'BEHAVIORAL',
+                 'threat_severity': rng.choice(threat_severities), 'status': 'OPEN', 'action': rng.choice(['PREVENTED', 'DETECTED']),
+                 'file_hash': file_hash, 'file_archive_hash': None, 'path': f'c:\\users\\user{rng.randint(1, 99)}\\downloads\\{file_hash[:8]}.exe',
+                 'file_size': rng.randint(1000, 50000000), 'file_status': 'NOT_UPLOADED', 'sandbox_status': 'NOT_READY_TO_GENERATE',
+                 'timestamp': _timestamp(occurred), 'insertion_timestamp': _timestamp(occurred + datetime.timedelta(seconds=5)),
+                 'close_timestamp': None, 'close_trigger': None, 'last_reoccurrence': None, 'reoccurrence_count': 0,
+                 'last_action': None, 'comment': None, 'mitre_classifications': [],
+                 'msp_id': device['msp_id'], 'msp_name': device['msp_name'], 'tenant_id': device['tenant_id'], 'tenant_name': device['tenant_name'],
+                 'recorded_device_info': {'hostname': device['hostname'], 'os': device['os'], 'mac_address': device['mac_address'], 'tag': device['tag'],
+                                          'group_name': device['group_name'], 'policy_name': device['policy_name'], 'tenant_name': device['tenant_name']}}
+        event.update(self.event_changes.get((suspicious, event_id), {}))
+        return event
+
+    # Returns a page of devices after the provided id
+    def device_page(self, after_device_id):
+        devices = []
+        device_id = max(0, after_device_id)
+        while device_id < self.device_count and len(devices) < page_size:
+            device_id += 1
+            if device_id not in self.archived_device_ids:
+                devices.append(self.device(device_id))
+        return {'devices': devices, 'last_id': devices[-1]['id'] if len(devices) > 0 else None}
+
+    # Returns a page of events after the provided id which match the search.
+    # Note that a search matching few events scans the whole id range.
+    def event_page(self, after_event_id, search, suspicious=False):
+        count = self.suspicious_event_count if suspicious else self.event_count
+        events = []
+        event_id = max(0, after_event_id)
+        while event_id < count and len(events) < page_size:
+            event_id += 1
+            if (suspicious, event_id) in self.archived_event_ids:
+                continue
+            event = self.event(event_id, suspicious)
+            if _matches(event, search):
+                events.append(event)
+        return {'events': events, 'last_id': events[-1]['id'] if len(events) > 0 else None}
+
+    # Moves devices to a group, or back to the default group of their
+    # platform (group_id None)
+    def move_devices(self, device_ids, group_id=None):
+        for device_id in device_ids:
+            device = self.device(device_id)
+            if device == None:
+                continue
+            if group_id == None:
+                group = [group for group in self.groups if group['is_default_group'] and group['msp_id'] == device['msp_id'] and group['os'] == device['os']][0]
+            else:
+                group = self._find(self.groups, group_id)
+            self._record_changes(self.device_changes, device_id, {'group_id': group['id'], 'group_name': group['name']})
+
+
+# Handles requests to the mock server. The server instance holds the
+# appliance (server.appliance), the fault settings, and the stats.
+class MockRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  #keep-alive, as on a real server
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _send(self, status_code, body=None, headers={}):
+        if isinstance(body, (bytes, bytearray)):
+            content, content_type = body, 'application/zip'
+        else:
+            content, content_type = (b'' if body == None else json.dumps(body).encode()), 'application/json'
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.record(self.command, self._route_name, status_code)
+
+    def _handle(self, method):
+        self._route_name = 'unknown'
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length > 0 else b''
+        url = urlparse(self.path)
+
+        if url.path == '/mock/stats':
+            self._route_name = 'stats'
+            return self._send(200, self.server.get_stats())
+
+        route = None
+        for route_method, pattern, name, handler in _routes:
+            match = re.fullmatch(pattern, url.path) if route_method == method else None
+            if match:
+                route = (handler, match)
+                self._route_name = name
+                break
+
+        #injected latency and faults
+        fault = self.server.next_fault()
+        if fault == 'throttle':
+            return self._send(429, {'error': 'Too Many Requests'}, {'Retry-After': str(self.server.retry_after)})
+        if fault == 'error':
+            return self._send(503, {'error': 'Service Unavailable'})
+        if self.server.api_key != None and self.headers.get('Authorization') != self.server.api_key:
+            return self._send(401, {'error': 'Unauthorized'})
+        if route == None:
+            return self._send(404, {'error': 'Not Found'})
+
+        try:
+            body = json.loads(raw_body) if len(raw_body) > 0 else {}
+        except ValueError:
+            return self._send(400, {'error': 'Invalid JSON'})
+
+        handler, match = route
+        if self._route_name in _mutating_routes:
+            with self.server.appliance.lock:
+                status_code, response = handler(self.server.appliance, match, parse_qs(url.query), body)
+        else:
+            status_code, response = handler(self.server.appliance, match, parse_qs(url.query), body)
+        return self._send(status_code, response)
+
+
+# Route handlers. Each receives (appliance, path match, query parameters,
+# parsed JSON body) and returns (status code, response body).
+
+def _get_devices(appliance, match, query, body):
+    return 200, appliance.device_page(int(query.get('after_device_id', ['0'])[0]))
+
+def _get_device(appliance, match, query, body):
+    device = appliance.device(int(match.group(1)))
+    return (200, device) if device != None else (404, {'error': 'Device not found'})
+
+def _device_action(appliance, match, query, body):
+    device_id, action = int(match.group(1)), match.group(2)
+    if appliance.device(device_id) == None:
+        return 404, {'error': 'Device not found'}
+    changes = {'remove': {'deployment_status': 'PENDING_UNINSTALL', 'license_status': 'DEACTIVATED'},
+               'disable': {'deployment_status': 'DISABLED'}, 'enable': {'deployment_status': 'REGISTERED'}}.get(action, {})
+    appliance._record_changes(appliance.device_changes, device_id, changes)
+    return 204, None
+
+def _archive_devices(appliance, match, query, body):
+    if match.group(1) == 'archive':
+        appliance.archived_device_ids.update(body.get('ids', []))
+    else:
+        appliance.archived_device_ids.difference_update(body.get('ids', []))
+    return 200, None
+
+def _request_remote_file_upload(appliance, match, query, body):
+    return (204, None) if appliance.event(int(match.group(1))) != None else (404, {'error': 'Event not found'})
+
+def _search_events(appliance, match, query, body):
+    after_event_id = match.group(2) if match.group(2) != None else query.get('after_event_id', ['0'])[0]
+    return 200, appliance.event_page(int(after_event_id), body, suspicious=match.group(1) != None)
+
+def _get_event(appliance, match, query, body):
+    event = appliance.event(int(match.group(2)), suspicious=match.group(1) != None)
+    return (200, {'event': event}) if event != None else (404, {'error': 'Event not found'})
+
+def _event_action(appliance, match, query, body):
+    suspicious, action = match.group(1) != None, match.group(2)
+    for event_id in body.get('ids', []):
+        if action == 'archive':
+            appliance.archived_event_ids.add((suspicious, event_id))
+        elif action == 'unarchive':
+            appliance.archived_event_ids.discard((suspicious, event_id))
+        elif action == 'close':
+            appliance._record_changes(appliance.event_changes, (suspicious, event_id), {'status': 'CLOSED', 'close_trigger': 'CLOSED_BY_ADMIN', 'close_timestamp': _timestamp(datetime.datetime.now(datetime.timezone.utc))})
+        elif action == 'open':
+            appliance._record_changes(appliance.event_changes, (suspicious, event_id), {'status': 'OPEN', 'close_trigger': None, 'close_timestamp': None})
+    return 204, None
+
+def _download_uploaded_file(appliance, match, query, body):
+    return 200, b'PK\x05\x06' + bytes(18)  #an empty zip archive
+
+def _get_policies(appliance, match, query, body):
+    return 200, appliance.policies
+
+def _create_policy(appliance, match, query, body):
+    base_policy = appliance._find(appliance.policies, body.get('base_policy_id'))
+    if base_policy == None:
+        return 404, {'error': 'Base policy not found'}
+    msp = appliance._find(appliance.msps, base_policy['msp_id'])
+    policy = appliance._add_policy(body.get('name', 'New Policy'), base_policy['os'], msp, is_default=False, prevention=False, base_data=appliance.policy_data[base_policy['id']])
+    policy['comment'] = body.get('comment', '')
+    return 200, policy
+
+def _delete_policy(appliance, match, query, body):
+    policy = appliance._find(appliance.policies, int(match.group(1)))
+    if policy == None:
+        return 404, {'error': 'Policy not found'}
+    if policy['is_default_policy']:
+        return 422, {'error': 'Default policies cannot be deleted'}
+    appliance.policies = [record for record in appliance.policies if record is not policy]  #replaced rather than changed in place, see _record_changes
+    del appliance.policy_data[policy['id']]
+    return 204, None
+
+def _get_policy_data(appliance, match, query, body):
+    policy_id = int(match.group(1))
+    if policy_id not in appliance.policy_data:
+        return 404, {'error': 'Policy not found'}
+    return 200, {'id': policy_id, 'data': appliance.policy_data[policy_id]}
+
+def _put_policy_data(appliance, match, query, body):
+    policy_id = int(match.group(1))
+    if policy_id not in appliance.policy_data:
+        return 404, {'error': 'Policy not found'}
+    if not isinstance(body.get('data'), dict):
+        return 400, {'error': 'Missing data'}
+    appliance.policy_data[policy_id] = body['data']
+    return 204, None
+
+def _get_policy_list(appliance, match, query, body):
+    policy_id, list_name = int(match.group(1)), match.group(2)
+    if policy_id not in appliance.policy_data:
+        return 404, {'error': 'Policy not found'}
+    rng = random.Random(_hex(appliance.seed, policy_id, list_name))
+    return 200, {'items': [{'item': _hex(list_name, policy_id, number) if list_name.endswith('hashes') else f'c:\\allowed\\{list_name.split("/")[1]}\\{number}',
+                            'comment': ''} for number in range(rng.randint(0, 3))]}
+
+def _get_groups(appliance, match, query, body):
+    return 200, appliance.groups
+
+def _group_devices(appliance, match, query, body):
+    group_id, action = int(match.group(1)), match.group(2)
+    if appliance._find(appliance.groups, group_id) == None:
+        return 404, {'error': 'Group not found'}
+    appliance.move_devices(body.get('devices', []), group_id if action == 'add' else None)
+    return 204, None
+
+def _get_tenants(appliance, match, query, body):
+    return 200, {'tenants': appliance.tenants}
+
+def _create_tenant(appliance, match, query, body):
+    msp = appliance._find(appliance.msps, body.get('msp_id'))
+    if msp == None:
+        return 404, {'error': 'MSP not found'}
+    if any(tenant['name'] == body.get('name') and tenant['msp_id'] == msp['id'] for tenant in appliance.tenants):
+        return 409, {'error': 'Tenant name already exists'}
+    tenant = {'id': max([tenant['id'] for tenant in appliance.tenants] + [0]) + 1, 'name': body.get('name'), 'msp_id': msp['id'], 'msp_name': msp['name'],
+              'license_limit': body.get('license_limit', 0), 'token': _hex('tenant', msp['id'], body.get('name'), length=32)}
+    appliance.tenants.append(tenant)
+    return 200, tenant
+
+def _delete_tenant(appliance, match, query, body):
+    tenant = appliance._find(appliance.tenants, int(match.group(1)))
+    if tenant == None:
+        return 404, {'error': 'Tenant not found'}
+    appliance.tenants = [record for record in appliance.tenants if record is not tenant]  #replaced rather than changed in place, see _record_changes
+    return 204, None
+
+def _get_msps(appliance, match, query, body):
+    return 200, {'msps': appliance.msps}
+
+def _create_msp(appliance, match, query, body):
+    if any(msp['name'] == body.get('name') for msp in appliance.msps):
+        return 409, {'error': 'MSP name already exists'}
+    msp = {'id': max([msp['id'] for msp in appliance.msps] + [0]) + 1, 'name': body.get('name'), 'license_limit': body.get('license_limit', 0)}
+    appliance.msps.append(msp)
+    return 200, msp
+
+def _delete_msp(appliance, match, query, body):
+    msp = appliance._find(appliance.msps, int(match.group(1)))
+    if msp == None:
+        return 404, {'error': 'MSP not found'}
+    if any(tenant['msp_id'] == msp['id'] for tenant in appliance.tenants):
+        return 409, {'error': 'MSP still has tenants'}
+    appliance.msps = [record for record in appliance.msps if record is not msp]  #replaced rather than changed in place, see _record_changes
+    return 204, None
+
+
+# (method, path regex, name used in stats, handler)
+_routes = [
+    ('GET', r'/api/v1/devices', 'devices', _get_devices),
+    ('GET', r'/api/v1/devices/(\d+)', 'device', _get_device),
+    ('POST', r'/api/v1/devices/(\d+)/actions/(remove|disable|enable|upload-logs)', 'device_action', _device_action),
+    ('POST', r'/api/v1/devices/actions/(archive|unarchive)', 'devices_archive', _archive_devices),
+    ('POST', r'/api/v1/devices/actions/request-remote-file-upload/(\d+)', 'request_remote_file_upload', _request_remote_file_upload),
+    ('POST', r'/api/v1/(suspicious-)?events/search(?:/(\d+))?', 'events_search', _search_events),
+    ('GET', r'/api/v1/(suspicious-)?events/(\d+)', 'event', _get_event),
+    ('POST', r'/api/v1/(suspicious-)?events/actions/(archive|unarchive|close|open)', 'events_action', _event_action),
+    ('GET', r'/api/v1/events/actions/download-uploaded-file/(\w+)', 'download_uploaded_file', _download_uploaded_file),
+    ('GET', r'/api/v1/policies/?', 'policies', _get_policies),
+    ('POST', r'/api/v1/policies/?', 'create_policy', _create_policy),
+    ('DELETE', r'/api/v1/policies/(\d+)', 'delete_policy', _delete_policy),
+    ('GET', r'/api/v1/policies/(\d+)/data', 'policy_data', _get_policy_data),
+    ('PUT', r'/api/v1/policies/(\d+)/data', 'put_policy_data', _put_policy_data),
+    ('GET', r'/api/v1/policies/(\d+)/((?:allow|deny)-list/\w+)', 'policy_list', _get_policy_list),
+    ('GET', r'/api/v1/groups/?', 'groups', _get_groups),
+    ('POST', r'/api/v1/groups/(\d+)/(add|remove)-devices', 'group_devices', _group_devices),
+    ('GET', r'/api/v1/multitenancy/tenant/?', 'tenants', _get_tenants),
+    ('POST', r'/api/v1/multitenancy/tenant/?', 'create_tenant', _create_tenant),
+    ('DELETE', r'/api/v1/multitenancy/tenant/(\d+)', 'delete_tenant', _delete_tenant),
+    ('GET', r'/api/v1/multitenancy/msp/?', 'msps', _get_msps),
+    ('POST', r'/api/v1/multitenancy/msp/?', 'create_msp', _create_msp),
+    ('DELETE', r'/api/v1/multitenancy/msp/(\d+)', 'delete_msp', _delete_msp),
+    ]
+
+
+# Names of the routes which change data (see MockDAppliance)
+_mutating_routes = {'device_action', 'devices_archive', 'events_action', 'create_policy', 'delete_policy', 'put_policy_data',
+                    'group_devices', 'create_tenant', 'delete_tenant', 'create_msp', 'delete_msp'}
+
+
+# HTTP server holding the appliance, fault injection settings, and stats
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, appliance, api_key=None, latency=0, latency_jitter=0, error_rate=0, throttle_rate=0, retry_after=1, max_rps=None, seed=1, verbose=False):
+        ThreadingHTTPServer.__init__(self, address, MockRequestHandler)
+        self.appliance = appliance
+        self.api_key = api_key
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._fault_lock = threading.Lock()
+        self._tokens = max_rps
+        self._token_timestamp = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'by_route': {}, 'by_status_code': {}}
+        self._started = time.monotonic()
+
+    # Sleeps for the configured latency and returns the fault to inject for
+    # the next request ('throttle', 'error', or None)
+    def next_fault(self):
+        with self._fault_lock:
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            roll = self._random.random()
+            throttled = False
+            if self.max_rps != None:
+                #token bucket allowing max_rps requests per second
+                now = time.monotonic()
+                self._tokens = min(self.max_rps, self._tokens + (now - self._token_timestamp) * self.max_rps)
+                self._token_timestamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                else:
+                    throttled = True
+        if delay > 0:
+            time.sleep(delay)
+        if throttled or roll < self.throttle_rate:
+            return 'throttle'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return None
+
+    def record(self, method, route_name, status_code):
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            route = f'{method} {route_name}'
+            self._stats['by_route'][route] = self._stats['by_route'].get(route, 0) + 1
+            self._stats['by_status_code'][str(status_code)] = self._stats['by_status_code'].get(str(status_code), 0) + 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            elapsed = time.monotonic() - self._started
+            return {'requests': self._stats['requests'], 'elapsed_seconds': round(elapsed, 3),
+                    'requests_per_second': round(self._stats['requests'] / elapsed, 2) if elapsed > 0 else 0,
+                    'by_route': dict(self._stats['by_route']), 'by_status_code': dict(self._stats['by_status_code'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock Deep Instinct D-Appliance for testing and benchmarking the REST API wrapper')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default 8080)')
+    parser.add_argument('--devices', type=int, default=1000, help='number of devices (default 1000)')
+    parser.add_argument('--events', type=int, default=10000, help='number of events (default 10000)')
+    parser.add_argument('--suspicious-events', type=int, default=1000, help='number of suspicious events (default 1000)')
+    parser.add_argument('--msps', type=int, default=1, help='number of MSPs (default 1)')
+    parser.add_argument('--tenants-per-msp', type=int, default=3, help='number of tenants per MSP (default 3)')
+    parser.add_argument('--groups-per-msp', type=int, default=6, help='number of non-default groups per MSP (default 6)')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the synthetic data and injected faults (default 1)')
+    parser.add_argument('--key', default=None, help='API key to require in the Authorization header (default: accept any)')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response (default 0)')
+    parser.add_argument('--latency-jitter', type=float, default=0, help='up to this many extra random seconds per response (default 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests which return 503 (default 0)')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='fraction of requests which return 429 (default 0)')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429 responses (default 1)')
+    parser.add_argument('--max-rps', type=float, default=None, help='return 429 when requests exceed this rate per second (default: no limit)')
+    parser.add_argument('--certfile', default=None, help='certificate file to serve HTTPS (default: serve HTTP)')
+    parser.add_argument('--keyfile', default=None, help='private key file for --certfile')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    appliance = MockDAppliance(device_count=args.devices, event_count=args.events, suspicious_event_count=args.suspicious_events, msp_count=args.msps,
+                               tenants_per_msp=args.tenants_per_msp, groups_per_msp=args.groups_per_msp, seed=args.seed)
+    server = MockServer((args.host, args.port), appliance, api_key=args.key, latency=args.latency, latency_jitter=args.latency_jitter,
+                        error_rate=args.error_rate, throttle_rate=args.throttle_rate, retry_after=args.retry_after, max_rps=args.max_rps,
+                        seed=args.seed, verbose=args.verbose)
+    protocol = 'http'
+    if args.certfile != None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        protocol = 'https'
+
+    print('INFO: Mock D-Appliance with', args.devices, 'devices,', args.events, 'events, and', args.suspicious_events, 'suspicious events listening on', f'{protocol}://{args.host}:{args.port}')
+    print('INFO: Use di.protocol =', repr(protocol), 'and di.fqdn =', repr(f'{args.host}:{args.port}'), '- press Ctrl+C to stop')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print()
+        print(json.dumps(server.get_stats(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
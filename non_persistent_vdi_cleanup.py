@@ -43,14 +43,16 @@ for device in devices:
                                 #all criteria above were met, therefore adding current device to the removal list
                                 devices_to_remove.append(device)
 
-# Process the list of devices which were identified for removal
-for device in devices_to_remove:
-    print('Requesting removal of device', )
-    removal_status = di.remove_device(device)
-    if removal_status:
-        print(device['id'], device['hostname'], 'was successfully removed')
-    else:
-        print('Failed to remove', device['id'], device['hostname'])
+# Process the list of devices which were identified for removal. The removal
+# requests are sent concurrently (see di.max_workers and di.requests_per_second)
+print('Requesting removal of', len(devices_to_remove), 'devices')
+results = di.remove_devices(devices_to_remove)
+
+# Report the devices which could not be removed
+hostnames = {device['id']: device['hostname'] for device in devices_to_remove}
+for device_id in results['failed']:
+    print('Failed to remove', device_id, hostnames[device_id], '(return code', str(results['status_codes'][device_id]) + ')')
+print(len(results['succeeded']), 'devices were successfully removed and', len(results['failed']), 'failed')
 
 
 
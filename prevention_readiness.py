@@ -23,8 +23,8 @@
 # 1. Save latest version of deepinstinct30.py from
 #    https://github.com/pvz01/deepinstinct_rest_api_wrapper to disk
 # 2. Save prevention_readiness.py to the same folder on disk
-# 3. Optionally implement event filters by modifying the code below which
-#    organizes events into included_events | excluded_events
+# 3. Optionally implement event filters by modifying the include_event
+#    function below, which decides which events are included in the analysis
 # 4. Optionally modify the criteria for determining prevention readiness:
 #    min_days_since_deployment,max_days_since_last_contect,max_weekly_event_rate
 # 5. Save modified script (if any changes were made)
@@ -36,8 +36,8 @@
 #    answer the prompts. You can exit any time with Ctrl+C.
 
 # import required libraries
-import deepinstinct30 as di, json, datetime, pandas
-from dateutil import parser
+import deepinstinct30 as di, deepinstinct30_aggregation as agg, json, datetime, pandas, collections, requests
+from deepinstinct30_inventory import Inventory
 
 #Criteria for determining yes/no on whether an endpoint is ready for prevention
 min_days_since_deployment = '10'
@@ -65,27 +65,23 @@ print('INFO: Calling get_policies')
 policies = di.get_policies(include_policy_data=True)
 print('INFO: Calling get_groups')
 groups = di.get_groups(exclude_default_groups=False)
-print('INFO: Calling get_events using minimum_event_id', minimum_event_id)
-all_events = di.get_events(minimum_event_id=minimum_event_id)
-print('INFO:', len(all_events), 'events were returned.')
-print('INFO: Beginning filtering events')
+print('INFO: Indexing devices, policies, and groups')
+inventory = Inventory(devices=devices, policies=policies, groups=groups)
+print('INFO: Calling iter_events using minimum_event_id', minimum_event_id, 'and filtering events as they are returned')
 
-#define two lists to organize events into
-included_events = []
-excluded_events = []
-
-for event in all_events:
+#returns True if an event is included in the analysis, False if it is excluded
+def include_event(event):
 
     if event['type'] in ['STATIC_ANALYSIS']:
         if event['threat_severity'] in ['MODERATE', 'HIGH', 'VERY_HIGH']:
-            included_events.append(event)
+            return True
 
         # TODO: You can add more filters here for patterns of activity you have
         # either confirmed as a True Positive -or- you have confirmed as a
         # False Positive and added the appropriate allow list. Some examples
         # are below (commented out). You need to remove/comment out the above
         # code block and replace it wabuild *nested* if statements with a single
-        # 'append' statement at the end
+        # 'return True' statement at the end
 
         #if event['type'] in ['STATIC_ANALYSIS']:
             #if event['threat_severity'] in ['MODERATE', 'HIGH', 'VERY_HIGH']:
@@ -93,7 +89,7 @@ for event in all_events:
                     #if event['path'][0:10] not in ['c:\\echo\\foxtrot\\']:
                         #if event['path'][0:28] not in ['/Users/paulinejolly/Library/']:
                             #if event['path'][0:22] not in ['/Users/workspace/berk/']:
-                                #included_events.append(event)
+                                #return True
 
     #TODO: You might also consider removing some/many event types below, which
     #means they will always be excluded from analysis. This is useful if, for
@@ -105,18 +101,36 @@ for event in all_events:
     #Positives.
 
     elif event['type'] in ['RANSOMWARE_FILE_ENCRYPTION', 'REMOTE_CODE_INJECTION_EXECUTION', 'KNOWN_SHELLCODE_PAYLOADS', 'ARBITRARY_SHELLCODE', 'REFLECTIVE_DLL', 'REFLECTIVE_DOTNET', 'AMSI_BYPASS', 'DIRECT_SYSTEMCALLS', 'CREDENTIAL_DUMP', 'MALICIOUS_POWERSHELL_COMMAND_EXECUTION']:
-        included_events.append(event)
-
-    #all events that didn't match any of the inclusion parameters above go here
-    else:
-        excluded_events.append(event)
-
+        return True
+
+    #all events that didn't match any of the inclusion parameters above are excluded
+    return False
+
+
+#events are streamed from the server and counted as they are returned, keeping
+#only the number of included events per device_id and the number of excluded
+#events per type rather than the events themselves
+event_counts = collections.Counter()
+excluded_counts = collections.Counter()
+last_event_id = minimum_event_id
+try:
+    for event in di.iter_events(minimum_event_id=minimum_event_id):
+        last_event_id = event['id']
+        if include_event(event):
+            event_counts[event['device_id']] += 1
+        else:
+            excluded_counts[event['type']] += 1
+#in case of error, continue with the events counted so far
+except requests.HTTPError as e:
+    print('ERROR:', e)
+    print('WARNING: Continuing with the events returned before the error (up to event id', str(last_event_id) + ')')
 
-print('INFO:', len(excluded_events), 'were excluded from analysis and', len(included_events), 'events remain')
+included_event_count = sum(event_counts.values())
+excluded_event_count = sum(excluded_counts.values())
+print('INFO:', included_event_count + excluded_event_count, 'events were returned.')
+print('INFO:', excluded_event_count, 'were excluded from analysis and', included_event_count, 'events remain')
+event_counts = dict(event_counts)
 
-#count the filtered events by device_id
-print('INFO: Summarizing included events by device_id')
-event_counts = di.count_data_by_field(included_events, 'device_id')
 
 print('INFO: Adding prevention_mode field to policy data')
 for policy in policies:
@@ -128,44 +142,20 @@ for policy in policies:
 
 #add in_prevention field to devices
 print('INFO: Adding prevention_mode field to device data')
-for device in devices:
-    for policy in policies:
-        if policy['id'] == device['policy_id']:
-            device['in_prevention'] = policy['prevention_mode']
-
-#add event_count field to devices
-print('INFO: Adding event_count field to device data')
-for device in devices:
-    if device['id'] in event_counts.keys():
-        device['event_count'] = event_counts[device['id']]
-    else:
-        device['event_count'] = 0
+inventory.join(devices, 'policy_id', 'policies', {'prevention_mode': 'in_prevention'})
 
 #add associated policy name and prevention mode to group data (for display purposes only)
 print('INFO: Adding policy_name and prevention_mode to group data')
-for group in groups:
-    for policy in policies:
-        if group['policy_id'] == policy['id']:
-            group['policy_name'] = policy['name']
-            group['prevention_mode'] = policy['prevention_mode']
+inventory.join(groups, 'policy_id', 'policies', {'name': 'policy_name', 'prevention_mode': 'prevention_mode'})
 
-#add days_since_deployment field to devices
-print('INFO: Adding days_since_deployment to device data by comparing last_registration to current datetime')
-for device in devices:
-    device['days_since_deployment'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_registration'])).days
+#add event_count, days_since_deployment, and weekly_event_rate fields to devices
+print('INFO: Adding event_count, days_since_deployment, and weekly_event_rate to device data by comparing last_registration to current datetime')
+agg.add_weekly_event_rates(devices, event_counts)
 
 #add days_since_last_contact field to devices
 print('INFO: Adding last_contact_days_ago to device data by comparing last_contact to current datetime')
-for device in devices:
-    device['last_contact_days_ago'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_contact'])).days
-
-#add weekly_event_rate field to devices
-print('INFO: Adding weekly_event_rate to device data')
-for device in devices:
-    if device['days_since_deployment'] > 0:
-        device['weekly_event_rate'] = device['event_count'] / device['days_since_deployment'] * 7
-    else:
-        device['weekly_event_rate'] = device['event_count'] * 7
+for device, days in zip(devices, agg.days_since(devices, 'last_contact').tolist()):
+    device['last_contact_days_ago'] = days
 
 #add ready_for_prevention field to devices
 print('INFO: Evaluating devices to determine prevention readiness and recoding it in device data as ready_for_prevention')
@@ -190,12 +180,9 @@ for device in devices:
         devices_not_ready_for_prevention.append(device)
 
 print('INFO: Calculating how many devices in each group are ready for prevention')
+ready_counts = inventory.count_by(devices_ready_for_prevention, 'group_id')
 for group in groups:
-    group['devices_ready_for_prevention'] = 0
-for device in devices_ready_for_prevention:
-    for group in groups:
-        if device['group_id'] == group['id']:
-            group['devices_ready_for_prevention'] +=1
+    group['devices_ready_for_prevention'] = ready_counts.get(group['id'], 0)
 
 print('INFO: Building list of groups with devices ready for prevention')
 groups_with_devices_ready_for_prevention = []
@@ -271,9 +258,7 @@ groups_df = pandas.DataFrame(groups)
 devices_already_in_prevention_df = pandas.DataFrame(devices_already_in_prevention)
 devices_ready_for_prevention_df = pandas.DataFrame(devices_ready_for_prevention)
 devices_not_ready_for_prevention_df = pandas.DataFrame(devices_not_ready_for_prevention)
-all_events_df = pandas.DataFrame(all_events)
-included_events_df = pandas.DataFrame(included_events)
-excluded_events_df = pandas.DataFrame(excluded_events)
+excluded_summary_df = pandas.DataFrame(excluded_counts.most_common(), columns=['type', 'count'])
 
 print('INFO: Creating output folder and calculating file name')
 folder_name = di.create_export_folder()
@@ -288,9 +273,7 @@ with pandas.ExcelWriter(f'{folder_name}/{file_name}') as writer:
     event_counts_df.to_excel(writer, sheet_name='event_counts', index=False)
     policies_df.to_excel(writer, sheet_name='policies', index=False)
     groups_df.to_excel(writer, sheet_name='groups', index=False)
-    all_events_df.to_excel(writer, sheet_name='all_events', index=False)
-    included_events_df.to_excel(writer, sheet_name='included_events', index=False)
-    excluded_events_df.to_excel(writer, sheet_name='excluded_events', index=False)
+    excluded_summary_df.to_excel(writer, sheet_name='excluded_summary', index=False)
 
 print('INFO: Done writing data to disk')
 
@@ -298,15 +281,13 @@ print()
 
 if execute_moves_now:
     print('INFO: Beginning to move devices')
+    devices_ready_for_prevention_by_group_id = inventory.group_by(devices_ready_for_prevention, 'group_id')
     for group in groups_with_devices_ready_for_prevention:
 
         source_group_id = group['id']
         destination_group_id = group['destination_group_id']
 
-        device_ids_to_move = []
-        for device in devices_ready_for_prevention:
-            if device['group_id'] == source_group_id:
-                device_ids_to_move.append(device['id'])
+        device_ids_to_move = [device['id'] for device in devices_ready_for_prevention_by_group_id.get(source_group_id, [])]
 
         print('INFO: Moving', len(device_ids_to_move), 'devices from group', source_group_id, 'to group', destination_group_id)
 
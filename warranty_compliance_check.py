@@ -1,4 +1,4 @@
-import datetime
+import datetime, collections
 
 # Prompt use for D-Appliance Version, validate input, then import appropriate
 # version of the REST API Wrapper
@@ -36,13 +36,9 @@ devices = di.get_devices(include_deactivated=False)
 # Calculate device_count for each policy (how many active devices in policy)
 # Add device_countfield with initial value zero
 print('INFO: Calculating device count for each policy')
+device_counts = collections.Counter(device['policy_id'] for device in devices if 'policy_id' in device)
 for policy in policies:
-    policy['device_count'] = 0
-# Iterate through devices and policies, incrementing device_count appropriately
-for device in devices:
-    for policy in policies:
-        if policy['id'] == device['policy_id']:
-            policy['device_count'] +=1
+    policy['device_count'] = device_counts.get(policy['id'], 0)
 
 if exclude_empty_policies:
     print('INFO: Narrowing policy list to include only those which contain 1 or more activated devices')